@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 from datetime import timedelta
+from decimal import Decimal
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -61,6 +62,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "store.metrics.RequestMetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -69,7 +71,6 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -106,6 +107,27 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Local memory by default, which only suits a single process. Production must
+# point CACHE_BACKEND/CACHE_LOCATION at a shared backend (memcached, redis) so
+# invalidations reach every worker, see prod.py.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# Tax added to prices of collections without a tax rate of their own.
+STORE_DEFAULT_TAX_RATE = Decimal(os.environ.get("STORE_DEFAULT_TAX_RATE", "0.10"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -153,9 +175,18 @@ AUTH_USER_MODEL = "profiles.user"
 
 REST_FRAMEWORK = {
     "COERCE_DECIMAL_TO_STRING": False,
+    "DEFAULT_RENDERER_CLASSES": (
+        "store.renderers.TimedORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "store.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "profiles.authentication.ClaimsJWTAuthentication",
     ),
 }
 SIMPLE_JWT = {
@@ -190,6 +221,7 @@ CORS_ALLOW_ALL_ORIGINS = True
 STATIC_ROOT = BASE_DIR/'static'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 CLOUDINARY_STORAGE = {
     'CLOUD_NAME': os.getenv("CLOUDINARY_NAME"),
@@ -197,3 +229,21 @@ CLOUDINARY_STORAGE = {
     'API_SECRET': os.getenv("CLOUDINARY_API_SECRET"),
 
 }
+
+# Product image uploads are staged in IMAGE_STAGING_STORAGE and processed by
+# `manage.py process_images`. Worker dynos do not share the web dynos' disks,
+# so the staging storage has to be a shared one.
+# store.images.StorageBackend saves them through DEFAULT_FILE_STORAGE instead
+# of uploading to Cloudinary directly.
+IMAGE_STAGING_STORAGE = os.environ.get(
+    "IMAGE_STAGING_STORAGE", "cloudinary_storage.storage.RawMediaCloudinaryStorage"
+)
+IMAGE_STORAGE_BACKEND = os.environ.get(
+    "IMAGE_STORAGE_BACKEND", "store.images.CloudinaryBackend"
+)
+IMAGE_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+IMAGE_MAX_DIMENSION = 2048
+
+# Threads per process serving the async catalog views (store/async/) under
+# ASGI. Each one may hold a database connection while it runs.
+ASYNC_VIEW_THREADS = int(os.environ.get("ASYNC_VIEW_THREADS", 16))
@@ -3,6 +3,10 @@ from .base import *
 INSTALLED_APPS += [
     "debug_toolbar",
 ]
+# Sync only, under ASGI it would force every view into a single thread.
+MIDDLEWARE += [
+    "debug_toolbar.middleware.DebugToolbarMiddleware",
+]
 INTERNAL_IPS = [
     # ...
     "127.0.0.1",
@@ -1,3 +1,5 @@
+from django.core.exceptions import ImproperlyConfigured
+
 from .base import *
 import django_on_heroku
 
@@ -17,5 +19,32 @@ DATABASES = {
         "USER": os.environ.get("DB_USER"),
         "PASSWORD": os.environ.get("DB_PASSWORD"),
         "OPTIONS": {"ssl": {"ca": os.environ.get("MYSQL_ATTR_SSL_CA")}},
+        # Connections go back to the engine's pool at the end of each request.
+        "CONN_MAX_AGE": 0,
+        "POOL": {
+            "SIZE": int(os.environ.get("DB_POOL_SIZE", ASYNC_VIEW_THREADS)),
+            "MAX_LIFETIME": 1800,
+            "HEALTH_CHECK_AFTER": 30,
+            "TIMEOUT": 10,
+        },
+        "SLOW_QUERY_MS": int(os.environ.get("DB_SLOW_QUERY_MS", 500)),
     }
 }
+
+# Writes invalidate cached catalog responses by bumping version keys, which
+# only reaches the other workers through a shared cache, e.g.
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache and
+# CACHE_LOCATION=host:11211.
+if (
+    CACHES["default"]["BACKEND"]
+    in (
+        "django.core.cache.backends.locmem.LocMemCache",
+        "django.core.cache.backends.filebased.FileBasedCache",
+        "django.core.cache.backends.dummy.DummyCache",
+    )
+    or not CACHES["default"]["LOCATION"]
+):
+    raise ImproperlyConfigured(
+        "Set CACHE_BACKEND and CACHE_LOCATION to a cache shared by every worker "
+        "(memcached, redis)."
+    )
@@ -13,8 +13,10 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from profiles.views import ClaimsTokenObtainPairView, ClaimsTokenRefreshView
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularRedocView,
@@ -23,8 +25,13 @@ from drf_spectacular.views import (
 
 urlpatterns = [
     path("notadmin/", admin.site.urls),
-    path("__debug__/", include("debug_toolbar.urls")),
     path("store/", include("store.urls")),
+    re_path(
+        r"^auth/jwt/create/?", ClaimsTokenObtainPairView.as_view(), name="jwt-create"
+    ),
+    re_path(
+        r"^auth/jwt/refresh/?", ClaimsTokenRefreshView.as_view(), name="jwt-refresh"
+    ),
     path("auth/", include("djoser.urls")),
     path("auth/", include("djoser.urls.jwt")),
     path("schema/", SpectacularAPIView.as_view(), name="schema"),
@@ -36,3 +43,6 @@ urlpatterns = [
     path("redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc"),
     path("", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger"),
 ]
+
+if "debug_toolbar" in settings.INSTALLED_APPS:
+    urlpatterns += [path("__debug__/", include("debug_toolbar.urls"))]
@@ -0,0 +1,148 @@
+import logging
+import re
+import time
+from typing import Callable, List
+
+from django.db.backends.mysql import base
+from django.db.backends.mysql.features import DatabaseFeatures as MySQLFeatures
+
+from .pool import ConnectionPool, PoolTimeout, get_pool
+from .schema import DatabaseSchemaEditor
+
+Database = base.Database
+
+logger = logging.getLogger("django_psdb_engine")
+
+# MySQL server has gone away, lost connection during query.
+DISCONNECT_ERRORS = (2006, 2013)
+
+READ_QUERY = re.compile(r"\s*(SELECT|SHOW|EXPLAIN)\b", re.IGNORECASE)
+LOCKING_READ = re.compile(
+    r"\bFOR\s+(UPDATE|SHARE)\b|\bLOCK\s+IN\s+SHARE", re.IGNORECASE
+)
+
+# Called with (alias, sql, seconds, failed) after every statement.
+query_hooks: List[Callable] = []
+
+
+def register_query_hook(hook: Callable) -> Callable:
+    query_hooks.append(hook)
+    return hook
+
+
+def ping(connection) -> bool:
+    connection.ping()
+    return True
+
+
+class DatabaseFeatures(MySQLFeatures):
+    # PlanetScale (Vitess) does not allow foreign key constraints.
+    supports_foreign_keys = False
+
+
+class CursorWrapper(base.CursorWrapper):
+    def __init__(self, cursor, db):
+        super().__init__(cursor)
+        self.db = db
+
+    def execute(self, query, args=None):
+        return self.timed(super().execute, query, args)
+
+    def executemany(self, query, args):
+        return self.timed(super().executemany, query, args)
+
+    def timed(self, method, query, args):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = self.retrying(method, query, args)
+            failed = False
+            return result
+        finally:
+            self.db.query_finished(query, time.perf_counter() - started, failed)
+
+    def retrying(self, method, query, args):
+        try:
+            return method(query, args)
+        except Database.OperationalError as exc:
+            if exc.args[0] not in DISCONNECT_ERRORS or not self.db.can_retry(query):
+                raise
+            logger.warning("Retrying read after a lost connection: %s", exc)
+            self.cursor = self.db.reconnect().cursor()
+            return method(query, args)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Kept as "mysql" so vendor specific code paths treat this as MySQL.
+    vendor = "mysql"
+    features_class = DatabaseFeatures
+    SchemaEditorClass = DatabaseSchemaEditor
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get("POOL")
+        if not options:
+            return None
+        return get_pool(self.alias, lambda: self.create_pool(options))
+
+    def create_pool(self, options) -> ConnectionPool:
+        return ConnectionPool(
+            connect=lambda: super(DatabaseWrapper, self).get_new_connection(
+                self.get_connection_params()
+            ),
+            check=ping,
+            size=options.get("SIZE", 10),
+            max_lifetime=options.get("MAX_LIFETIME", 3600),
+            health_check_after=options.get("HEALTH_CHECK_AFTER", 30),
+            timeout=options.get("TIMEOUT", 10),
+        )
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            return pool.acquire()
+        except PoolTimeout as exc:
+            raise Database.OperationalError(str(exc)) from exc
+
+    def create_cursor(self, name=None):
+        return CursorWrapper(self.connection.cursor(), self)
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        # Released connections are rolled back, or dropped if that fails.
+        pool.release(self.connection)
+
+    def can_retry(self, query) -> bool:
+        """Reads outside a transaction can be safely sent again."""
+        return (
+            self.get_autocommit()
+            and not self.in_atomic_block
+            and READ_QUERY.match(query) is not None
+            and LOCKING_READ.search(query) is None
+        )
+
+    def reconnect(self):
+        broken, self.connection = self.connection, None
+        pool = self.pool
+        if pool is None:
+            try:
+                broken.close()
+            except Database.Error:
+                pass
+        else:
+            pool.discard(broken)
+        self.connect()
+        return self.connection
+
+    def query_finished(self, sql, duration, failed):
+        threshold = self.settings_dict.get("SLOW_QUERY_MS")
+        if threshold is not None and duration * 1000 >= threshold:
+            logger.warning(
+                "Slow query on %s (%.0fms): %s", self.alias, duration * 1000, sql
+            )
+        for hook in query_hooks:
+            hook(self.alias, sql, duration, failed)
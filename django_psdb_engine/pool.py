@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Tuple
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Entry:
+    __slots__ = ("connection", "created_at", "returned_at")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = self.returned_at = time.monotonic()
+
+
+class ConnectionPool:
+    """A thread-safe pool of DB-API connections.
+
+    The pool knows nothing about the driver: ``connect`` opens a connection,
+    ``check`` tells whether an idle one still works and ``reset`` returns a
+    connection to a clean state (raising if it cannot), so it can be driven by
+    any DB-API module or by plain stand-ins.
+    """
+
+    def __init__(
+        self,
+        connect: Callable,
+        check: Callable = lambda connection: True,
+        reset: Callable = lambda connection: connection.rollback(),
+        size: int = 10,
+        max_lifetime: float = 3600,
+        health_check_after: float = 30,
+        timeout: float = 10,
+    ):
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        # Most recently returned last, so the warmest connection goes out first.
+        self.idle = deque()
+        self.in_use: Dict[int, Entry] = {}
+        # Idle, in use and being opened.
+        self.opened = 0
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            entry = self.checkout(deadline)
+            if entry is None:
+                try:
+                    entry = Entry(self.connect())
+                except BaseException:
+                    self.forget()
+                    raise
+            elif not self.usable(entry):
+                self.close(entry)
+                continue
+            with self.condition:
+                self.in_use[id(entry.connection)] = entry
+            return entry.connection
+
+    def checkout(self, deadline):
+        """Take an idle entry, or reserve room for a new one and return None."""
+        with self.condition:
+            while True:
+                if self.idle:
+                    return self.idle.pop()
+                if self.opened < self.size:
+                    self.opened += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"No connection available after {self.timeout}s "
+                        f"({self.size} in use)."
+                    )
+                self.condition.wait(remaining)
+
+    def usable(self, entry):
+        now = time.monotonic()
+        if now - entry.created_at >= self.max_lifetime:
+            return False
+        if now - entry.returned_at < self.health_check_after:
+            return True
+        try:
+            return self.check(entry.connection)
+        except Exception:
+            return False
+
+    def release(self, connection):
+        with self.condition:
+            entry = self.in_use.pop(id(connection), None)
+        if entry is None:
+            # Not ours, e.g. opened before the pool was replaced after a fork.
+            self.close_quietly(connection)
+            return
+        try:
+            self.reset(connection)
+        except Exception:
+            self.close(entry)
+            return
+        entry.returned_at = time.monotonic()
+        if entry.returned_at - entry.created_at >= self.max_lifetime:
+            self.close(entry)
+            return
+        with self.condition:
+            self.idle.append(entry)
+            self.condition.notify()
+
+    def discard(self, connection):
+        """Close a connection that is known to be broken instead of reusing it."""
+        with self.condition:
+            entry = self.in_use.pop(id(connection), None)
+        if entry is None:
+            self.close_quietly(connection)
+        else:
+            self.close(entry)
+
+    def close(self, entry):
+        self.close_quietly(entry.connection)
+        self.forget()
+
+    def forget(self):
+        with self.condition:
+            self.opened -= 1
+            self.condition.notify()
+
+    def close_quietly(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def clear(self):
+        """Close the idle connections, the ones in use are closed on release."""
+        with self.condition:
+            entries, self.idle = list(self.idle), deque()
+        for entry in entries:
+            self.close(entry)
+
+    def stats(self) -> Dict[str, int]:
+        with self.condition:
+            return {
+                "size": self.size,
+                "open": self.opened,
+                "idle": len(self.idle),
+                "in_use": len(self.in_use),
+            }
+
+
+pools: Dict[Tuple[str, int], ConnectionPool] = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, factory: Callable[[], ConnectionPool]) -> ConnectionPool:
+    # Keyed by pid as well: a forked worker must never share its parent's sockets.
+    key = (alias, os.getpid())
+    pool = pools.get(key)
+    if pool is None:
+        with pools_lock:
+            pool = pools.get(key)
+            if pool is None:
+                pool = pools[key] = factory()
+    return pool
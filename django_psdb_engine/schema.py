@@ -0,0 +1,13 @@
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.backends.mysql.schema import DatabaseSchemaEditor as MySQLSchemaEditor
+
+
+class DatabaseSchemaEditor(MySQLSchemaEditor):
+    def _field_should_be_indexed(self, model, field):
+        # MySQL leaves foreign key columns to the index their constraint
+        # creates on InnoDB. Without constraints they need one of their own.
+        if self.connection.features.supports_foreign_keys:
+            return super()._field_should_be_indexed(model, field)
+        return BaseDatabaseSchemaEditor._field_should_be_indexed(
+            self, model, field
+        ) and not self._is_limited_data_type(field)
@@ -0,0 +1,380 @@
+import os
+import threading
+import time
+from unittest import mock, skipIf
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError
+from django.test import SimpleTestCase
+
+from .pool import ConnectionPool, PoolTimeout, get_pool, pools
+
+try:
+    from . import base
+except ImproperlyConfigured:
+    # The backend imports mysqlclient, the pool does not need it.
+    base = None
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, query, args=None):
+        if self.connection.failures:
+            raise self.connection.failures.pop(0)
+        self.connection.queries.append(query)
+        if "VERSION()" in query:
+            # Server settings Django reads when it first connects.
+            self.rows = [("8.0.30", "", "InnoDB", 0, 0, 1)]
+        elif "information_schema.tables" in query:
+            self.rows = [("InnoDB",)]
+        else:
+            self.rows = [(0,)]
+        return 1
+
+    def executemany(self, query, args):
+        return self.execute(query)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Just enough of a DB-API connection for the pool and the backend."""
+
+    def __init__(self, **params):
+        self.closed = False
+        self.broken = False
+        self.queries = []
+        self.failures = []
+        self.encoders = {}
+        self.pings = self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def ping(self):
+        self.pings += 1
+        if self.broken:
+            raise OSError("gone away")
+
+    def rollback(self):
+        if self.broken:
+            raise OSError("gone away")
+        self.rollbacks += 1
+
+    def commit(self):
+        pass
+
+    def autocommit(self, value):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, **kwargs):
+        self.opened = []
+
+        def connect():
+            connection = FakeConnection()
+            self.opened.append(connection)
+            return connection
+
+        def check(connection):
+            connection.ping()
+            return True
+
+        return ConnectionPool(connect=connect, check=check, **kwargs)
+
+    def test_released_connection_is_reused(self):
+        pool = self.make_pool(size=2)
+        connection = pool.acquire()
+        self.assertEqual(pool.stats(), {"size": 2, "open": 1, "idle": 0, "in_use": 1})
+
+        pool.release(connection)
+
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertEqual(pool.stats(), {"size": 2, "open": 1, "idle": 1, "in_use": 0})
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_most_recently_released_connection_goes_out_first(self):
+        pool = self.make_pool(size=2)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+
+        self.assertIs(pool.acquire(), second)
+
+    def test_acquire_times_out_when_every_connection_is_in_use(self):
+        pool = self.make_pool(size=1, timeout=0.05)
+        pool.acquire()
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+
+    def test_waiting_acquire_gets_the_released_connection(self):
+        pool = self.make_pool(size=1, timeout=5)
+        connection = pool.acquire()
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        waiter.start()
+        time.sleep(0.05)
+
+        pool.release(connection)
+        waiter.join(5)
+
+        self.assertEqual(acquired, [connection])
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = ConnectionPool(connect=mock.Mock(side_effect=OSError), size=1)
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                pool.acquire()
+        self.assertEqual(pool.stats()["open"], 0)
+
+    def test_connection_that_cannot_be_reset_is_closed(self):
+        pool = self.make_pool(size=1)
+        connection = pool.acquire()
+        connection.broken = True
+
+        pool.release(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["open"], 0)
+        self.assertIsNot(pool.acquire(), connection)
+
+    def test_idle_connection_is_checked_before_reuse(self):
+        pool = self.make_pool(size=1, health_check_after=0)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(connection.pings, 1)
+
+        pool.release(connection)
+        connection.broken = True
+        replacement = pool.acquire()
+
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["open"], 1)
+
+    def test_recently_returned_connection_is_not_checked(self):
+        pool = self.make_pool(size=1, health_check_after=60)
+        connection = pool.acquire()
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(connection.pings, 0)
+
+    def test_connection_past_its_lifetime_is_replaced(self):
+        pool = self.make_pool(size=1, max_lifetime=0)
+        connection = pool.acquire()
+
+        pool.release(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.acquire(), connection)
+
+    def test_discard_closes_the_connection(self):
+        pool = self.make_pool(size=1)
+        connection = pool.acquire()
+
+        pool.discard(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["open"], 0)
+
+    def test_unknown_connection_is_closed_on_release(self):
+        pool = self.make_pool(size=1)
+        stranger = FakeConnection()
+
+        pool.release(stranger)
+
+        self.assertTrue(stranger.closed)
+        self.assertEqual(pool.stats()["idle"], 0)
+
+    def test_clear_closes_idle_connections(self):
+        pool = self.make_pool(size=2)
+        idle, in_use = pool.acquire(), pool.acquire()
+        pool.release(idle)
+
+        pool.clear()
+
+        self.assertTrue(idle.closed)
+        self.assertFalse(in_use.closed)
+        self.assertEqual(pool.stats(), {"size": 2, "open": 1, "idle": 0, "in_use": 1})
+
+    def test_get_pool_is_per_alias_and_process(self):
+        self.addCleanup(pools.pop, ("pool-a", os.getpid()), None)
+        self.addCleanup(pools.pop, ("pool-b", os.getpid()), None)
+        factory = mock.Mock(side_effect=lambda: self.make_pool())
+
+        pool = get_pool("pool-a", factory)
+
+        self.assertIs(get_pool("pool-a", factory), pool)
+        self.assertIsNot(get_pool("pool-b", factory), pool)
+        self.assertEqual(factory.call_count, 2)
+        with mock.patch("os.getpid", return_value=-1):
+            self.addCleanup(pools.pop, ("pool-a", -1), None)
+            self.assertIsNot(get_pool("pool-a", factory), pool)
+
+
+@skipIf(base is None, "mysqlclient is not installed")
+class DatabaseWrapperTests(SimpleTestCase):
+    def setUp(self):
+        self.opened = []
+
+        def connect(**params):
+            connection = FakeConnection(**params)
+            self.opened.append(connection)
+            return connection
+
+        patcher = mock.patch.object(base.Database, "connect", side_effect=connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connection = self.make_wrapper(self.id(), POOL={"SIZE": 2})
+
+    def make_wrapper(self, alias, **settings):
+        connection = base.DatabaseWrapper(
+            {
+                "ENGINE": "django_psdb_engine",
+                "NAME": "store",
+                "USER": "",
+                "PASSWORD": "",
+                "HOST": "",
+                "PORT": "",
+                "OPTIONS": {},
+                "TIME_ZONE": None,
+                "CONN_MAX_AGE": 0,
+                "AUTOCOMMIT": True,
+                "ATOMIC_REQUESTS": False,
+                **settings,
+            },
+            alias,
+        )
+        self.addCleanup(pools.pop, (alias, os.getpid()), None)
+        self.addCleanup(connection.close)
+        return connection
+
+    def execute(self, sql):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()
+
+    def test_features(self):
+        self.assertEqual(self.connection.vendor, "mysql")
+        self.assertFalse(self.connection.features.supports_foreign_keys)
+
+    def test_closed_connection_goes_back_to_the_pool(self):
+        self.execute("SELECT 1")
+        first = self.connection.connection
+
+        self.connection.close()
+
+        self.assertFalse(first.closed)
+        self.assertEqual(self.connection.pool.stats()["idle"], 1)
+        self.execute("SELECT 1")
+        self.assertIs(self.connection.connection, first)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_without_pool_connections_are_closed(self):
+        connection = self.make_wrapper(f"{self.id()}-nopool")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        first = connection.connection
+
+        connection.close()
+
+        self.assertIsNone(connection.pool)
+        self.assertTrue(first.closed)
+
+    def test_exhausted_pool_raises_operational_error(self):
+        connection = self.make_wrapper(
+            f"{self.id()}-small", POOL={"SIZE": 1, "TIMEOUT": 0.05}
+        )
+        connection.pool.acquire()
+
+        with self.assertRaises(OperationalError):
+            connection.ensure_connection()
+
+    def test_read_is_retried_after_a_lost_connection(self):
+        self.execute("SELECT 1")
+        first = self.connection.connection
+        first.failures.append(base.Database.OperationalError(2013, "lost"))
+
+        with self.assertLogs("django_psdb_engine", "WARNING"):
+            self.assertEqual(self.execute("SELECT 2"), (0,))
+
+        self.assertTrue(first.closed)
+        self.assertIsNot(self.connection.connection, first)
+        self.assertIn("SELECT 2", self.connection.connection.queries)
+        self.assertEqual(self.connection.pool.stats()["open"], 1)
+
+    def test_writes_locking_reads_and_transactions_are_not_retried(self):
+        self.execute("SELECT 1")
+        for sql, autocommit in [
+            ("UPDATE store_product SET inventory = 0", True),
+            ("SELECT 1 FOR UPDATE", True),
+            ("SELECT 1", False),
+        ]:
+            with self.subTest(sql=sql, autocommit=autocommit):
+                self.connection.set_autocommit(autocommit)
+                connection = self.connection.connection
+                connection.failures.append(base.Database.OperationalError(2013, "lost"))
+                with self.assertRaises(OperationalError):
+                    self.execute(sql)
+                self.assertIs(self.connection.connection, connection)
+        self.connection.set_autocommit(True)
+
+    def test_other_errors_are_not_retried(self):
+        self.execute("SELECT 1")
+        self.connection.connection.failures.append(
+            base.Database.OperationalError(1205, "lock wait timeout")
+        )
+
+        with self.assertRaises(OperationalError):
+            self.execute("SELECT 1")
+        self.assertEqual(len(self.opened), 1)
+
+    def test_query_hooks_and_slow_query_log(self):
+        connection = self.make_wrapper(f"{self.id()}-slow", SLOW_QUERY_MS=0)
+        calls = []
+        hook = base.register_query_hook(lambda *args: calls.append(args))
+        self.addCleanup(base.query_hooks.remove, hook)
+
+        with self.assertLogs("django_psdb_engine", "WARNING") as logs:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+        alias, sql, duration, failed = calls[-1]
+        self.assertEqual((alias, sql, failed), (connection.alias, "SELECT 1", False))
+        self.assertGreaterEqual(duration, 0)
+        self.assertIn("Slow query", logs.output[-1])
+
+    def test_foreign_keys_are_indexed_without_constraints(self):
+        from store.models import Image, Product
+
+        editor = self.connection.schema_editor()
+        uploaded_by = Image._meta.get_field("uploaded_by")
+
+        self.assertTrue(editor._field_should_be_indexed(Image, uploaded_by))
+        self.assertIn(
+            "`uploaded_by_id`", str(editor._field_indexes_sql(Image, uploaded_by)[0])
+        )
+        self.assertFalse(
+            editor._field_should_be_indexed(Product, Product._meta.get_field("title"))
+        )
+        self.assertFalse(
+            editor._field_should_be_indexed(Image, Image._meta.get_field("product"))
+        )
@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class ClaimsUser(SimpleLazyObject):
+    """The token's user, answering ``pk``/``is_staff``/``customer_id`` from claims.
+
+    Any other attribute loads the real user row on first access, just like
+    Django's lazy ``request.user``.
+    """
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        User = get_user_model()
+        super().__init__(
+            lambda: User.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        )
+        # Set on __dict__ directly, LazyObject forwards attribute writes.
+        self.__dict__.update(
+            id=user_id,
+            pk=user_id,
+            is_staff=token["is_staff"],
+            customer_id=token.get("customer_id"),
+            is_authenticated=True,
+            is_anonymous=False,
+        )
+
+    def __bool__(self):
+        return True
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """Authenticate from the claims added by ``ClaimsTokenObtainPairSerializer``.
+
+    Tokens issued before the claims existed still load the user from the
+    database. Claims are only checked against the user row when the token is
+    refreshed, by ``ClaimsTokenRefreshSerializer``, so a revoked staff flag or
+    a deactivated account lasts until the access token expires.
+    """
+
+    def get_user(self, validated_token):
+        if "is_staff" not in validated_token:
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
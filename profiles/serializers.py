@@ -2,6 +2,15 @@ from djoser.serializers import (
     UserSerializer,
     UserCreateSerializer as BaseUserCreateSerializer,
 )
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from store.models import Customer
 
 
 class UserCreateSerializer(BaseUserCreateSerializer):
@@ -19,3 +28,44 @@ class UserCreateSerializer(BaseUserCreateSerializer):
 class UserDetailSerializer(UserSerializer):
     class Meta(UserSerializer.Meta):
         fields = ("id", "email", "username", "first_name", "last_name")
+
+
+def add_claims(token, user):
+    token["is_staff"] = user.is_staff
+    token["customer_id"] = (
+        Customer.objects.filter(user=user).values_list("id", flat=True).first()
+    )
+    return token
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Tokens carrying what ``ClaimsJWTAuthentication`` needs to skip the DB."""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh the claims from the user row, refusing deactivated users.
+
+    Access tokens are trusted without loading the user until they expire, a
+    refresh is where staff and active flag changes take effect.
+    """
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+        user = (
+            get_user_model()
+            .objects.filter(
+                **{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}
+            )
+            .first()
+        )
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                "No active account found for the token.", code="user_inactive"
+            )
+        data = super().validate(attrs)
+        data["access"] = str(add_claims(refresh.access_token, user))
+        return data
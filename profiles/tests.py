@@ -1,3 +1,105 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from store.models import Customer
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.user = User.objects.create_user("customer", "c@example.com", "secret")
+        cls.admin = User.objects.create_user(
+            "admin", "admin@example.com", "secret", is_staff=True
+        )
+        cls.customer = Customer.objects.get(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def obtain(self, username):
+        response = self.client.post(
+            "/auth/jwt/create/", {"username": username, "password": "secret"}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def authenticate(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f"JWT {token}")
+
+    def test_claims_token_authenticates_without_a_user_query(self):
+        tokens = self.obtain("customer")
+        claims = AccessToken(tokens["access"])
+        self.assertEqual(claims["customer_id"], self.customer.pk)
+        self.assertIs(claims["is_staff"], False)
+        self.authenticate(tokens["access"])
+
+        # The customer row only.
+        with self.assertNumQueries(1):
+            response = self.client.get("/store/customers/me/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["id"], self.customer.pk)
+
+    def test_token_without_claims_loads_the_user(self):
+        self.authenticate(AccessToken.for_user(self.user))
+
+        with self.assertNumQueries(2):
+            response = self.client.get("/store/customers/me/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["user_id"], self.user.pk)
+
+    def test_claims_drive_permissions_and_the_customer(self):
+        self.authenticate(self.obtain("customer")["access"])
+        self.assertEqual(self.client.get("/store/customers/").status_code, 403)
+
+        self.authenticate(self.obtain("admin")["access"])
+        self.assertEqual(self.client.get("/store/customers/").status_code, 200)
+
+        # The claims are trusted as issued, the rows are not read again.
+        token = AccessToken.for_user(self.admin)
+        token["is_staff"] = False
+        token["customer_id"] = self.customer.pk
+        self.authenticate(token)
+        self.assertEqual(self.client.get("/store/customers/").status_code, 403)
+        response = self.client.get("/store/customers/me/")
+        self.assertEqual(response.data["id"], self.customer.pk)
+
+    def test_deactivated_user(self):
+        tokens = self.obtain("customer")
+        old_token = AccessToken.for_user(self.user)
+        self.user.is_active = False
+        self.user.save()
+
+        # Accepted until the access token expires, see ClaimsJWTAuthentication.
+        self.authenticate(tokens["access"])
+        self.assertEqual(self.client.get("/store/customers/me/").status_code, 200)
+
+        self.authenticate(old_token)
+        self.assertEqual(self.client.get("/store/customers/me/").status_code, 401)
+        self.client.credentials()
+        response = self.client.post(
+            "/auth/jwt/refresh/", {"refresh": tokens["refresh"]}
+        )
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post(
+            "/auth/jwt/create/", {"username": "customer", "password": "secret"}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_reloads_the_claims(self):
+        tokens = self.obtain("customer")
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.post(
+            "/auth/jwt/refresh/", {"refresh": tokens["refresh"]}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        claims = AccessToken(response.data["access"])
+        self.assertIs(claims["is_staff"], True)
+        self.assertEqual(claims["customer_id"], self.customer.pk)
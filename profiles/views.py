@@ -1,3 +1,11 @@
-from django.shortcuts import render
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-# Create your views here.
+from .serializers import ClaimsTokenObtainPairSerializer, ClaimsTokenRefreshSerializer
+
+
+class ClaimsTokenObtainPairView(TokenObtainPairView):
+    serializer_class = ClaimsTokenObtainPairSerializer
+
+
+class ClaimsTokenRefreshView(TokenRefreshView):
+    serializer_class = ClaimsTokenRefreshSerializer
@@ -57,7 +57,7 @@ class CollectionAdmin(admin.ModelAdmin):
     list_display = ["title", "products_count"]
     search_fields = ["title"]
 
-    @admin.display(ordering="products_count")
+    @admin.display(ordering="product_count")
     def products_count(self, collection):
         url = (
             reverse("admin:store_product_changelist")
@@ -65,12 +65,9 @@ class CollectionAdmin(admin.ModelAdmin):
             + urlencode({"collection__id": str(collection.id)})
         )
         return format_html(
-            '<a href="{}">{} Products</a>', url, collection.products_count
+            '<a href="{}">{} Products</a>', url, collection.product_count
         )
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(products_count=Count("products"))
-
 
 @admin.register(models.Customer)
 class CustomerAdmin(admin.ModelAdmin):
@@ -112,4 +109,12 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(models.Image)
 class ImageAdmin(admin.ModelAdmin):
     autocomplete_fields = ["product"]
-    list_display = ["title", "image", "product"]
+    list_display = ["title", "image", "product", "status"]
+    list_filter = ["status"]
+
+
+@admin.register(models.OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ["id", "topic", "created_at", "attempts", "processed_at"]
+    list_filter = ["topic", "processed_at"]
+    readonly_fields = ["created_at"]
@@ -0,0 +1,211 @@
+"""Daily sales rollups and the reports served from them.
+
+New orders count towards the product, collection and payment status rollups
+through the ``rollup_sales`` outbox topic, so checkouts never wait on the
+shared row of the day. Status changes move an order between payment statuses
+once that event has been applied; until then the event records the order
+under whatever status it has by then.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Min, Sum
+from django.utils import timezone
+
+from .models import (
+    Collection,
+    DailyCollectionSales,
+    DailyOrderStatus,
+    DailyProductSales,
+    Order,
+    OrderItem,
+    OutboxEvent,
+    Product,
+)
+
+REVENUE = DecimalField(max_digits=14, decimal_places=2)
+
+
+def order_total(order_id) -> Decimal:
+    total = OrderItem.objects.filter(order_id=order_id).aggregate(
+        total=Sum(F("unit_price") * F("quantity"), output_field=REVENUE)
+    )["total"]
+    return total or Decimal(0)
+
+
+def record_placed_order(order_id):
+    """Count a new order under its current payment status."""
+    # Locked so a concurrent status change lands either before this is
+    # recorded, or after it and moves the order from the recorded status.
+    order = (
+        Order.objects.select_for_update()
+        .only("placed_at", "payment_status")
+        .get(pk=order_id)
+    )
+    DailyOrderStatus.objects.increment(
+        [
+            {
+                "date": timezone.localdate(order.placed_at),
+                "payment_status": order.payment_status,
+                "orders": 1,
+                "revenue": order_total(order_id),
+            }
+        ]
+    )
+
+
+def record_status_change(order: Order, previous_status: str):
+    """Move ``order`` from its previous payment status to the current one."""
+    if order.payment_status == previous_status:
+        return
+    date = timezone.localdate(order.placed_at)
+    total = order_total(order.pk)
+    DailyOrderStatus.objects.increment(
+        [
+            {
+                "date": date,
+                "payment_status": previous_status,
+                "orders": -1,
+                "revenue": -total,
+            },
+            {
+                "date": date,
+                "payment_status": order.payment_status,
+                "orders": 1,
+                "revenue": total,
+            },
+        ]
+    )
+
+
+def record_order_sales(order_id):
+    items = OrderItem.objects.filter(order_id=order_id).values_list(
+        "order__placed_at",
+        "product_id",
+        "product__collection_id",
+        "quantity",
+        "unit_price",
+    )
+    products = defaultdict(lambda: [0, Decimal(0)])
+    collections = defaultdict(lambda: [0, Decimal(0)])
+    for placed_at, product_id, collection_id, quantity, unit_price in items:
+        date = timezone.localdate(placed_at)
+        for totals in (products[date, product_id], collections[date, collection_id]):
+            totals[0] += quantity
+            totals[1] += unit_price * quantity
+    DailyProductSales.objects.increment(
+        {"date": date, "product": product_id, "units": units, "revenue": revenue}
+        for (date, product_id), (units, revenue) in products.items()
+    )
+    DailyCollectionSales.objects.increment(
+        {"date": date, "collection": collection_id, "units": units, "revenue": revenue}
+        for (date, collection_id), (units, revenue) in collections.items()
+    )
+
+
+def rebuild_day(date: datetime.date):
+    """Recompute the rollups of one day from its orders.
+
+    Orders whose ``rollup_sales`` event is still pending are left out, the
+    event counts them once it is delivered.
+    """
+    # The outbox delivers its events to this module.
+    from . import outbox
+
+    start = timezone.make_aware(datetime.datetime.combine(date, datetime.time()))
+    items = OrderItem.objects.filter(
+        order__placed_at__gte=start,
+        order__placed_at__lt=start + datetime.timedelta(days=1),
+    ).order_by()
+    revenue = Sum(F("unit_price") * F("quantity"), output_field=REVENUE)
+    with transaction.atomic():
+        # Locked so workers cannot deliver them before the rebuild commits.
+        pending = list(
+            OutboxEvent.objects.select_for_update()
+            .filter(topic=outbox.ROLLUP_SALES, processed_at__isnull=True)
+            .order_by("pk")
+            .values_list("payload__order_id", flat=True)
+        )
+        items = items.exclude(order_id__in=pending)
+        for model in (DailyProductSales, DailyCollectionSales, DailyOrderStatus):
+            model.objects.filter(date=date).delete()
+        DailyProductSales.objects.bulk_create(
+            DailyProductSales(date=date, **row)
+            for row in items.values("product_id").annotate(
+                units=Sum("quantity"), revenue=revenue
+            )
+        )
+        DailyCollectionSales.objects.bulk_create(
+            DailyCollectionSales(date=date, **row)
+            for row in items.values(collection_id=F("product__collection_id")).annotate(
+                units=Sum("quantity"), revenue=revenue
+            )
+        )
+        DailyOrderStatus.objects.bulk_create(
+            DailyOrderStatus(date=date, **row)
+            for row in items.values(payment_status=F("order__payment_status")).annotate(
+                orders=Count("order_id", distinct=True), revenue=revenue
+            )
+        )
+
+
+def order_dates():
+    """The first and last days with orders, ``(None, None)`` without any."""
+    placed = Order.objects.order_by().aggregate(
+        first=Min("placed_at"), last=Max("placed_at")
+    )
+    if placed["first"] is None:
+        return None, None
+    return timezone.localdate(placed["first"]), timezone.localdate(placed["last"])
+
+
+def sales_report(start: datetime.date, end: datetime.date, limit: int) -> Dict:
+    """Sales between ``start`` and ``end`` inclusive, read from the rollups."""
+    in_range = {"date__gte": start, "date__lte": end}
+    measures = {"units": Sum("units"), "revenue": Sum("revenue")}
+    collections = DailyCollectionSales.objects.filter(**in_range).order_by()
+
+    days = list(collections.values("date").annotate(**measures).order_by("date"))
+    top_products = list(
+        DailyProductSales.objects.filter(**in_range)
+        .order_by()
+        .values("product_id")
+        .annotate(**measures)
+        .order_by("-revenue", "product_id")[:limit]
+    )
+    titles = dict(
+        Product.objects.filter(
+            pk__in=[row["product_id"] for row in top_products]
+        ).values_list("pk", "title")
+    )
+    for row in top_products:
+        row["title"] = titles.get(row["product_id"])
+    by_collection = list(
+        collections.values("collection_id")
+        .annotate(**measures)
+        .order_by("-revenue", "collection_id")
+    )
+    titles = dict(Collection.objects.values_list("pk", "title"))
+    for row in by_collection:
+        row["title"] = titles.get(row["collection_id"])
+    by_status = list(
+        DailyOrderStatus.objects.filter(**in_range)
+        .order_by()
+        .values("payment_status")
+        .annotate(orders=Sum("orders"), revenue=Sum("revenue"))
+        .order_by("payment_status")
+    )
+    return {
+        "start": start,
+        "end": end,
+        "units": sum(row["units"] for row in days),
+        "revenue": sum((row["revenue"] for row in days), Decimal(0)),
+        "orders": sum(row["orders"] for row in by_status),
+        "days": days,
+        "top_products": top_products,
+        "collections": by_collection,
+        "payment_status": by_status,
+    }
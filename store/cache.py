@@ -0,0 +1,103 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+# Version scopes. Every cached catalog response is keyed on the current version
+# of the scopes it depends on, so bumping a scope orphans exactly the entries
+# built from it and leaves the rest of the catalog warm.
+CATALOG = "catalog"
+PRODUCTS = "products"
+COLLECTIONS = "collections"
+
+
+def product_scope(product_id) -> str:
+    return f"product:{product_id}"
+
+
+def collection_scope(collection_id) -> str:
+    return f"collection:{collection_id}"
+
+
+def reviews_scope(product_id) -> str:
+    return f"reviews:{product_id}"
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def version_key(scope: str) -> str:
+    return f"catalog-version:{scope}"
+
+
+def get_versions(scopes):
+    cache = get_cache()
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Seed from the clock so an evicted version never reuses old entries.
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    """Invalidate ``scopes`` once the current transaction commits."""
+
+    def invalidate():
+        cache = get_cache()
+        for scope in scopes:
+            try:
+                cache.incr(version_key(scope))
+            except ValueError:
+                cache.set(version_key(scope), time.time_ns(), timeout=None)
+
+    transaction.on_commit(invalidate)
+
+
+def response_key(request, scopes) -> str:
+    params = sorted(
+        (key, value) for key, values in request.query_params.lists() for value in values
+    )
+    versions = ".".join(str(version) for version in get_versions(scopes))
+    digest = hashlib.md5(
+        repr((request.build_absolute_uri(request.path), params)).encode()
+    ).hexdigest()
+    return f"catalog:{versions}:{digest}"
+
+
+class CachedResponseMixin:
+    """Serve ``list`` and ``retrieve`` from the catalog cache.
+
+    Views implement ``get_cache_scopes()``; the signal handlers in
+    ``store.signals.handlers`` bump those scopes when the data changes.
+    """
+
+    def get_cache_scopes(self):
+        raise NotImplementedError
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        key = response_key(request, [CATALOG, *self.get_cache_scopes()])
+        data = get_cache().get(key)
+        if data is not None:
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            get_cache().set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,99 @@
+import csv
+import datetime
+import io
+
+from django.db.models import F
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import OrderItem, Product
+
+
+class ProductExport:
+    since_field = "last_update"
+
+    def get_queryset(self):
+        return Product.objects.values(
+            "id",
+            "title",
+            "slug",
+            "description",
+            "unit_price",
+            "inventory",
+            "collection_id",
+            "last_update",
+        )
+
+
+class OrderExport:
+    """One row per order item, with the order columns repeated."""
+
+    since_field = "order__placed_at"
+
+    def get_queryset(self):
+        return OrderItem.objects.values(
+            "id",
+            "order_id",
+            "product_id",
+            "quantity",
+            "unit_price",
+            placed_at=F("order__placed_at"),
+            payment_status=F("order__payment_status"),
+            customer_id=F("order__customer_id"),
+        )
+
+
+EXPORTS = {"products": ProductExport, "orders": OrderExport}
+
+
+def columns(queryset):
+    return [*queryset.query.values_select, *queryset.query.annotation_select]
+
+
+def chunks(queryset, chunk_size=5000):
+    """Yield lists of rows, each fetched with ``WHERE id > last id LIMIT n``.
+
+    Memory stays flat without server-side cursors, which MySQLdb only offers
+    by holding the connection for the whole export.
+    """
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(page[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1]["id"]
+
+
+def ndjson(queryset):
+    encode = JSONEncoder().encode
+    for rows in chunks(queryset):
+        yield "".join(f"{encode(row)}\n" for row in rows)
+
+
+def csv_rows(queryset):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header = columns(queryset)
+    writer.writerow(header)
+    for rows in chunks(queryset):
+        writer.writerows(
+            [
+                value.isoformat() if isinstance(value, datetime.datetime) else value
+                for value in row.values()
+            ]
+            for row in rows
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+RENDERERS = {
+    "ndjson": (ndjson, "application/x-ndjson"),
+    "csv": (csv_rows, "text/csv"),
+}
@@ -1,8 +1,62 @@
-from django_filters.rest_framework import FilterSet
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from django_filters.rest_framework import CharFilter, FilterSet, NumberFilter
+from rest_framework.filters import SearchFilter
+from tags.models import TaggedItem
 from .models import Product
 
 
 class ProductFilter(FilterSet):
+    tag = CharFilter(method="filter_tag", label="Tag label")
+    # Annotated by ProductQuerySet.with_prices().
+    effective_price__gt = NumberFilter(field_name="effective_price", lookup_expr="gt")
+    effective_price__lt = NumberFilter(field_name="effective_price", lookup_expr="lt")
+
     class Meta:
         model = Product
         fields = {"collection_id": ["exact"], "unit_price": ["gt", "lt"]}
+
+    def filter_tag(self, queryset, name, value):
+        return queryset.filter(id__in=TaggedItem.objects.tagged_ids(Product, value))
+
+
+class ProductSearchFilter(SearchFilter):
+    """``?search=`` served by the FULLTEXT index on product title and description.
+
+    Every term must match (boolean mode ``+term*``) and results are ranked by
+    relevance unless the client asked for an explicit ordering. Databases
+    without the index fall back to SearchFilter's ``icontains`` lookups.
+    """
+
+    # Shorter words are not indexed by InnoDB (innodb_ft_min_token_size).
+    min_term_length = 3
+
+    def filter_queryset(self, request, queryset, view):
+        connection = connections[queryset.db]
+        if connection.vendor != "mysql":
+            return super().filter_queryset(request, queryset, view)
+
+        words = [
+            word
+            for term in self.get_search_terms(request)
+            for word in re.findall(r"\w+", term)
+        ]
+        if not words:
+            return queryset
+        if any(len(word) < self.min_term_length for word in words):
+            return super().filter_queryset(request, queryset, view)
+
+        qn = connection.ops.quote_name
+        table = qn(queryset.model._meta.db_table)
+        columns = f"{table}.{qn('title')}, {table}.{qn('description')}"
+        match = f"MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)"
+        against = " ".join(f"+{word}*" for word in words)
+        queryset = queryset.filter(
+            RawSQL(match, (against,), output_field=BooleanField())
+        ).annotate(search_rank=RawSQL(match, (against,), output_field=FloatField()))
+        if request.query_params.get("ordering"):
+            return queryset
+        return queryset.order_by("-search_rank")
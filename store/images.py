@@ -0,0 +1,145 @@
+import functools
+import io
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import Tuple
+
+import cloudinary.uploader
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, get_storage_class
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+from .models import Image
+
+# Pillow format name -> file extension of the formats we accept.
+FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class CloudinaryBackend:
+    def upload(self, content: bytes, name: str):
+        return cloudinary.uploader.upload_resource(
+            io.BytesIO(content), public_id=Path(name).stem, resource_type="image"
+        )
+
+    def url(self, value) -> str:
+        return value.url
+
+
+class StorageBackend:
+    """Saves processed images through ``DEFAULT_FILE_STORAGE``, for local work.
+
+    The ``CloudinaryField`` keeps the storage name as is, but parses it into a
+    public id and format when read, which ``url`` joins back together.
+    """
+
+    def __init__(self, storage=default_storage):
+        self.storage = storage
+
+    def upload(self, content: bytes, name: str):
+        return self.storage.save(f"images/{name}", ContentFile(content))
+
+    def url(self, value) -> str:
+        name = value.public_id
+        if value.format:
+            name = f"{name}.{value.format}"
+        return self.storage.url(name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.IMAGE_STORAGE_BACKEND)()
+
+
+@functools.lru_cache(maxsize=None)
+def get_staging_storage():
+    return get_storage_class(settings.IMAGE_STAGING_STORAGE)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting in ("IMAGE_STORAGE_BACKEND", "DEFAULT_FILE_STORAGE"):
+        get_backend.cache_clear()
+    if setting == "IMAGE_STAGING_STORAGE":
+        get_staging_storage.cache_clear()
+
+
+def image_url(value) -> str:
+    """The URL of a stored ``Image.image``, empty while it is being processed."""
+    if not value:
+        return ""
+    return get_backend().url(value)
+
+
+def stage(upload) -> str:
+    """Save an uploaded file to the staging storage and return its name.
+
+    The storage has to be shared with the ``process_images`` workers, which
+    do not see the disks of the web processes.
+    """
+    return get_staging_storage().save(f"staging/{uuid.uuid4().hex}", upload)
+
+
+def prepare(content: bytes) -> Tuple[bytes, str]:
+    """Validate and downscale the staged image, returns its bytes and extension."""
+    try:
+        with PILImage.open(io.BytesIO(content)) as image:
+            image.verify()
+        with PILImage.open(io.BytesIO(content)) as image:
+            if image.format not in FORMATS:
+                raise InvalidImage(f"Unsupported image format {image.format}.")
+            image_format = image.format
+            image = ImageOps.exif_transpose(image)
+            size = settings.IMAGE_MAX_DIMENSION
+            image.thumbnail((size, size))
+            content = io.BytesIO()
+            image.save(content, format=image_format)
+    except (OSError, SyntaxError, ValueError, PILImage.DecompressionBombError) as exc:
+        raise InvalidImage("Not a valid image.") from exc
+    return content.getvalue(), FORMATS[image_format]
+
+
+def process(image: Image, backend, max_attempts: int, backoff: float = 5.0) -> None:
+    """Upload a claimed image once and record the outcome on its row.
+
+    Failed uploads are retried after ``backoff * 2 ** attempts`` seconds.
+    """
+    storage = get_staging_storage()
+    try:
+        with storage.open(image.staged_file) as staged:
+            content, extension = prepare(staged.read())
+        image.image = backend.upload(
+            content, f"{image.product_id}-{image.pk}.{extension}"
+        )
+    except InvalidImage as exc:
+        image.status = Image.STATUS_FAILED
+        image.error = str(exc)
+    except Exception as exc:
+        # Storage and upload errors are usually transient, try again later.
+        image.attempts += 1
+        image.error = repr(exc)
+        if image.attempts < max_attempts:
+            image.status = Image.STATUS_PENDING
+            image.available_at = timezone.now() + timedelta(
+                seconds=backoff * 2**image.attempts
+            )
+        else:
+            image.status = Image.STATUS_FAILED
+    else:
+        image.status = Image.STATUS_READY
+        image.error = ""
+
+    if image.status != Image.STATUS_PENDING:
+        storage.delete(image.staged_file)
+        image.staged_file = ""
+    image.save()
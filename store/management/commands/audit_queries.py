@@ -0,0 +1,222 @@
+import json
+import re
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from profiles.serializers import ClaimsTokenObtainPairSerializer
+from store.models import Cart, Collection, Order, OrderItem, Product, Review
+from tags.models import TaggedItem
+
+# Lookup tables that stay small enough for a scan to be the cheapest plan.
+SMALL_TABLES = [
+    "django_content_type",
+    "store_collection",
+    "store_promotion",
+    "tags_tag",
+]
+
+
+FULL_SCAN = "full scan"
+FILESORT = "filesort"
+
+
+def mysql_plan(cursor, sql, params):
+    """Yield ``(problem, table)`` for each step of the plan that needs one."""
+    cursor.execute(f"EXPLAIN {sql}", params)
+    columns = [column[0].lower() for column in cursor.description]
+    for row in cursor.fetchall():
+        step = dict(zip(columns, row))
+        extra = step.get("extra") or ""
+        if step["type"] == "ALL":
+            yield FULL_SCAN, step["table"]
+        if "Using filesort" in extra or "Using temporary" in extra:
+            yield FILESORT, step["table"]
+
+
+def sqlite_plan(cursor, sql, params):
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    first_table = None
+    for row in cursor.fetchall():
+        detail = row[-1]
+        step = re.match(r"(SCAN|SEARCH) (?:TABLE )?(\w+)", detail)
+        if step:
+            first_table = first_table or step[2]
+            if step[1] == "SCAN" and " USING " not in detail:
+                yield FULL_SCAN, step[2]
+        if detail.startswith("USE TEMP B-TREE"):
+            # The sort is over the rows of the driving table.
+            yield FILESORT, first_table
+
+
+def postgresql_plan(cursor, sql, params):
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [(plan[0]["Plan"], None)]
+    while nodes:
+        node, sorted_by = nodes.pop()
+        if node["Node Type"] == "Sort":
+            sorted_by = node
+        table = node.get("Relation Name")
+        if node["Node Type"] == "Seq Scan":
+            yield FULL_SCAN, table
+        if table and sorted_by is not None:
+            yield FILESORT, table
+            sorted_by = None
+        nodes.extend((child, sorted_by) for child in node.get("Plans", []))
+
+
+PLANNERS = {
+    "mysql": mysql_plan,
+    "sqlite": sqlite_plan,
+    "postgresql": postgresql_plan,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Call the store endpoints with representative parameters, EXPLAIN every "
+        "SELECT they run and flag full table scans and filesorts. Exits with an "
+        "error when anything is flagged."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--allow",
+            nargs="*",
+            default=SMALL_TABLES,
+            help="Tables whose full scans are expected.",
+        )
+        parser.add_argument(
+            "--only", nargs="*", default=None, help="Only audit these endpoint names."
+        )
+        parser.add_argument("--verbose-sql", action="store_true")
+
+    def handle(self, *args, **options):
+        planner = PLANNERS.get(connection.vendor)
+        if planner is None:
+            raise CommandError(f"Cannot read {connection.vendor} query plans.")
+
+        client = Client()
+        flagged = 0
+        # Cached responses would skip the queries under audit.
+        with override_settings(
+            ALLOWED_HOSTS=["*"],
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+            },
+        ):
+            for name, method, path, headers, expected in self.endpoints():
+                if options["only"] and name not in options["only"]:
+                    continue
+                queries = self.capture(client, method, path, headers)
+                problems = []
+                with connection.cursor() as cursor:
+                    for sql, params in queries:
+                        for problem, table in planner(cursor, sql, params):
+                            if (
+                                problem not in expected
+                                and table not in options["allow"]
+                            ):
+                                problems.append((f"{problem} on {table}", sql))
+                flagged += len(problems)
+                status = self.style.ERROR("FLAG") if problems else "ok  "
+                self.stdout.write(f"{status} {name:<28} {len(queries)} queries")
+                for problem, sql in problems:
+                    self.stdout.write(f"       {problem}")
+                    if options["verbose_sql"]:
+                        self.stdout.write(f"         {sql}")
+
+        if flagged:
+            raise CommandError(f"{flagged} query plan problems found.")
+        self.stdout.write(self.style.SUCCESS("No full scans or filesorts."))
+
+    def capture(self, client, method, path, headers):
+        queries = []
+
+        def collect(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith("SELECT"):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        # Writes made by the endpoints are rolled back.
+        with transaction.atomic():
+            with connection.execute_wrapper(collect):
+                response = getattr(client, method)(path, **headers)
+            transaction.set_rollback(True)
+        if response.status_code >= 400:
+            raise CommandError(
+                f"{method.upper()} {path} returned {response.status_code}"
+            )
+        return list({sql: (sql, params) for sql, params in queries}.values())
+
+    def auth_headers(self, user):
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        return {"HTTP_AUTHORIZATION": f"JWT {token}"}
+
+    def endpoints(self):
+        product = Product.objects.order_by("-id").first()
+        collection = Collection.objects.order_by("-id").first()
+        ordered = OrderItem.objects.values_list("product_id", flat=True).first()
+        order = Order.objects.select_related("customer__user").order_by("-id").first()
+        review = Review.objects.values_list("product_id", flat=True).first()
+        cart = Cart.objects.filter(items__isnull=False).first()
+        staff = get_user_model().objects.filter(is_staff=True).first()
+        if None in (product, collection, ordered, order, review, cart, staff):
+            raise CommandError(
+                "Needs products, reviews, carts, orders and a staff user, "
+                "run generate_data first."
+            )
+        tag = (
+            TaggedItem.objects.filter(
+                content_type=ContentType.objects.get_for_model(Product)
+            )
+            .values_list("tag__label", flat=True)
+            .first()
+        )
+        staff_headers = self.auth_headers(staff)
+        customer_headers = self.auth_headers(order.customer.user)
+        collection_products = f"/store/products/?collection_id={collection.id}"
+
+        # (name, method, path, headers, problems accepted for this endpoint)
+        endpoints = [
+            ("products-list", "get", "/store/products/", {}, ()),
+            ("products-keyset", "get", "/store/products/?cursor=", {}, ()),
+            ("products-collection", "get", collection_products, {}, ()),
+            (
+                "products-price-range",
+                "get",
+                f"{collection_products}&unit_price__gt=10&unit_price__lt=50",
+                {},
+                # Either the price range or the title order comes from an index,
+                # the rows of the other are sorted or filtered.
+                (FILESORT,),
+            ),
+            ("product-detail", "get", f"/store/products/{product.id}/", {}, ()),
+            ("collections-list", "get", "/store/collections/", {}, ()),
+            ("reviews-list", "get", f"/store/products/{review}/reviews/", {}, ()),
+            ("cart-detail", "get", f"/store/carts/{cart.id}/", {}, ()),
+            ("cart-items", "get", f"/store/carts/{cart.id}/items/", {}, ()),
+            ("orders-staff", "get", "/store/orders/", staff_headers, ()),
+            ("orders-customer", "get", "/store/orders/", customer_headers, ()),
+            ("customer-me", "get", "/store/customers/me/", customer_headers, ()),
+            (
+                "product-destroy",
+                "delete",
+                f"/store/products/{ordered}/",
+                staff_headers,
+                (),
+            ),
+        ]
+        if tag:
+            # Tagged products are looked up by id, then sorted by title.
+            endpoints.append(
+                ("products-tag", "get", f"/store/products/?tag={tag}", {}, (FILESORT,))
+            )
+        return endpoints
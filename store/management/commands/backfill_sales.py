@@ -0,0 +1,51 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from store import analytics
+
+
+def day(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups from the orders, one day per "
+        "transaction. Days default to the first through the last order. Orders "
+        "still waiting for their rollup_sales event are left to it. Orders "
+        "placed while a day is rebuilt can be missed, so rebuild the current "
+        "day while no orders are coming in."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=day, default=None, help="YYYY-MM-DD")
+        parser.add_argument("--end", type=day, default=None, help="YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        first, last = analytics.order_dates()
+        start = options["start"] or first
+        end = options["end"] or last
+        if start is None or end is None:
+            self.stdout.write("No orders to roll up.")
+            return
+        if start > end:
+            raise CommandError("--start must not be after --end.")
+
+        started = time.perf_counter()
+        date = start
+        while date <= end:
+            analytics.rebuild_day(date)
+            date += datetime.timedelta(days=1)
+        days = (end - start).days + 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {days} days of rollups ({start} to {end}) "
+                f"in {time.perf_counter() - started:.1f}s."
+            )
+        )
@@ -0,0 +1,247 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from profiles.serializers import ClaimsTokenObtainPairSerializer
+from store.models import Cart, CartItem, Collection, Order, Product, Review
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every store endpoint and write latency percentiles and "
+        "SQL query counts to a JSON report. Creates carts and cart items, so "
+        "it only runs with DEBUG on unless --force is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--output", default="benchmark.json")
+        parser.add_argument(
+            "--compare", help="A previous report to print latency/query deltas against."
+        )
+        parser.add_argument(
+            "--only", nargs="*", default=None, help="Only run these endpoint names."
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Run without DEBUG, against a database that can take the writes.",
+        )
+
+    def handle(self, *args, **options):
+        if not (settings.DEBUG or options["force"]):
+            raise CommandError(
+                "benchmark_api writes carts and cart items. Run it against a "
+                "DEBUG setup, or pass --force."
+            )
+        client = Client(SERVER_NAME="localhost")
+        results = {}
+        for name, method, path, data, headers in self.endpoints():
+            if options["only"] and name not in options["only"]:
+                continue
+            results[name] = self.measure(
+                client,
+                method,
+                path,
+                data,
+                headers,
+                options["warmup"],
+                options["iterations"],
+            )
+            self.stdout.write(
+                f"{name:<28} {results[name]['status']} "
+                f"p50={results[name]['p50_ms']:.2f}ms "
+                f"p99={results[name]['p99_ms']:.2f}ms "
+                f"queries={results[name]['queries']}"
+            )
+
+        report = {
+            "generated_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "iterations": options["iterations"],
+            "endpoints": results,
+        }
+        with open(options["output"], "w") as fp:
+            json.dump(report, fp, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    def measure(self, client, method, path, data, headers, warmup, iterations):
+        request = getattr(client, method)
+        kwargs = dict(headers)
+        if data is not None:
+            kwargs.update(data=json.dumps(data), content_type="application/json")
+
+        for _ in range(warmup):
+            request(path, **kwargs)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = request(path, **kwargs)
+        # Read the count now, the next request resets the connection's query log.
+        query_count = len(queries)
+
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            request(path, **kwargs)
+            samples.append((time.perf_counter() - started) * 1000)
+
+        return {
+            "method": method.upper(),
+            "path": path,
+            "status": response.status_code,
+            "queries": query_count,
+            "response_bytes": len(response.content),
+            "mean_ms": statistics.mean(samples),
+            "min_ms": min(samples),
+            "p50_ms": percentile(samples, 0.50),
+            "p90_ms": percentile(samples, 0.90),
+            "p99_ms": percentile(samples, 0.99),
+            "max_ms": max(samples),
+        }
+
+    def auth_headers(self, user):
+        if user is None:
+            return {}
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        return {"HTTP_AUTHORIZATION": f"JWT {token}"}
+
+    def endpoints(self):
+        product = Product.objects.order_by("-id").first()
+        collection = Collection.objects.order_by("-id").first()
+        if product is None or collection is None:
+            raise CommandError("No catalog data found, run generate_data first.")
+        reviewed = (
+            Review.objects.values_list("product_id", flat=True).first() or product.id
+        )
+        cart = Cart.objects.filter(items__isnull=False).first() or Cart.objects.create()
+        cart_item = CartItem.objects.filter(cart=cart).first()
+
+        User = get_user_model()
+        staff = User.objects.filter(is_staff=True).first()
+        order = Order.objects.select_related("customer__user").order_by("-id").first()
+        customer_user = order.customer.user if order else None
+        staff_headers = self.auth_headers(staff)
+        customer_headers = self.auth_headers(customer_user)
+        search_term = product.title.split()[0]
+
+        endpoints = [
+            ("products-list", "get", "/store/products/", None, {}),
+            ("products-deep-page", "get", "/store/products/?page=1000", None, {}),
+            (
+                "products-filtered",
+                "get",
+                f"/store/products/?collection_id={collection.id}"
+                "&unit_price__gt=10&ordering=-unit_price",
+                None,
+                {},
+            ),
+            (
+                "products-search",
+                "get",
+                f"/store/products/?search={search_term}",
+                None,
+                {},
+            ),
+            ("product-detail", "get", f"/store/products/{product.id}/", None, {}),
+            (
+                "product-reviews",
+                "get",
+                f"/store/products/{reviewed}/reviews/",
+                None,
+                {},
+            ),
+            ("collections-list", "get", "/store/collections/", None, {}),
+            (
+                "collection-detail",
+                "get",
+                f"/store/collections/{collection.id}/",
+                None,
+                {},
+            ),
+            ("cart-create", "post", "/store/carts/", {}, {}),
+            ("cart-detail", "get", f"/store/carts/{cart.id}/", None, {}),
+            ("cart-items-list", "get", f"/store/carts/{cart.id}/items/", None, {}),
+            (
+                "cart-items-add",
+                "post",
+                f"/store/carts/{cart.id}/items/",
+                {"product_id": product.id, "quantity": 1},
+                {},
+            ),
+            (
+                "cart-items-batch",
+                "post",
+                f"/store/carts/{cart.id}/items/batch/",
+                {"items": [{"product_id": product.id, "quantity": 1}]},
+                {},
+            ),
+        ]
+        if cart_item:
+            endpoints.append(
+                (
+                    "cart-item-detail",
+                    "get",
+                    f"/store/carts/{cart.id}/items/{cart_item.id}/",
+                    None,
+                    {},
+                )
+            )
+        if customer_user:
+            endpoints += [
+                (
+                    "orders-list-customer",
+                    "get",
+                    "/store/orders/",
+                    None,
+                    customer_headers,
+                ),
+                (
+                    "order-detail",
+                    "get",
+                    f"/store/orders/{order.id}/",
+                    None,
+                    customer_headers,
+                ),
+                ("customers-me", "get", "/store/customers/me/", None, customer_headers),
+            ]
+        if staff:
+            endpoints += [
+                ("orders-list-staff", "get", "/store/orders/", None, staff_headers),
+                ("customers-list", "get", "/store/customers/", None, staff_headers),
+            ]
+        return endpoints
+
+    def compare(self, path, results):
+        with open(path) as fp:
+            baseline = json.load(fp)["endpoints"]
+        self.stdout.write(
+            f"\n{'endpoint':<28} {'p50 delta':>12} {'p99 delta':>12} {'queries':>10}"
+        )
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            self.stdout.write(
+                f"{name:<28} "
+                f"{current['p50_ms'] - previous['p50_ms']:>+10.2f}ms "
+                f"{current['p99_ms'] - previous['p99_ms']:>+10.2f}ms "
+                f"{previous['queries']:>4} -> {current['queries']:<4}"
+            )
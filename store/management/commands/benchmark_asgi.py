@@ -0,0 +1,206 @@
+import asyncio
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+
+HOST = "127.0.0.1"
+LATENCY_VARIABLE = "BENCHMARK_DB_LATENCY_MS"
+APPLICATION = "store.management.commands.benchmark_asgi"
+
+
+def add_latency():
+    """Sleep before every query to stand in for a database across the network."""
+    seconds = float(os.environ.get(LATENCY_VARIABLE) or 0) / 1000
+    if not seconds:
+        return
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        # The wrapper outlives its connections, install the delay only once.
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+
+
+def wsgi_application():
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    add_latency()
+    return application
+
+
+def asgi_application():
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+    add_latency()
+    return application
+
+
+async def get(port, path):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode()
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+async def load(port, paths, requests, concurrency):
+    queue = itertools.islice(itertools.cycle(paths), requests)
+    latencies, errors = [], 0
+
+    async def client():
+        nonlocal errors
+        for path in queue:
+            started = time.perf_counter()
+            try:
+                status = await get(port, path)
+            except (OSError, IndexError, ValueError):
+                status = None
+            if status != 200:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare catalog read throughput of the sync views under gunicorn's "
+        "WSGI workers with the async views under uvicorn workers."
+    )
+
+    stacks = {
+        # name: (worker class, application, URL prefix)
+        "wsgi": ("sync", "wsgi_application()", "/store/"),
+        "asgi-async": (
+            "uvicorn.workers.UvicornWorker",
+            "asgi_application()",
+            "/store/async/",
+        ),
+        "asgi-sync": ("uvicorn.workers.UvicornWorker", "asgi_application()", "/store/"),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument(
+            "--db-latency-ms",
+            type=float,
+            default=5.0,
+            help="Delay added to every query in the servers.",
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="Keep the catalog cache on instead of measuring the database path.",
+        )
+        parser.add_argument(
+            "--stacks", nargs="*", choices=sorted(self.stacks), default=None
+        )
+        parser.add_argument("--port", type=int, default=8765)
+
+    def handle(self, *args, **options):
+        # Imported here, the servers load this module before Django is set up.
+        from .benchmark_api import percentile
+
+        paths = self.sample_paths()
+        env = {**os.environ, LATENCY_VARIABLE: str(options["db_latency_ms"])}
+        if not options["cache"]:
+            env["CACHE_BACKEND"] = "django.core.cache.backends.dummy.DummyCache"
+
+        self.stdout.write(
+            f"{options['requests']} requests, concurrency {options['concurrency']}, "
+            f"{options['workers']} workers, {options['db_latency_ms']}ms per query"
+        )
+        for name in options["stacks"] or self.stacks:
+            worker_class, application, prefix = self.stacks[name]
+            server = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "gunicorn",
+                    f"{APPLICATION}:{application}",
+                    "--worker-class",
+                    worker_class,
+                    "--workers",
+                    str(options["workers"]),
+                    "--bind",
+                    f"{HOST}:{options['port']}",
+                    "--log-level",
+                    "warning",
+                ],
+                env=env,
+            )
+            try:
+                self.wait_for(options["port"], server)
+                urls = [prefix + path for path in paths]
+                # Warm up the workers before measuring.
+                _, _, errors = asyncio.run(load(options["port"], urls, len(urls), 4))
+                if errors == len(urls):
+                    raise CommandError(f"Every request to the {name} server failed.")
+                elapsed, latencies, errors = asyncio.run(
+                    load(
+                        options["port"],
+                        urls,
+                        options["requests"],
+                        options["concurrency"],
+                    )
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            self.stdout.write(
+                f"{name:<12} {options['requests'] / elapsed:8.0f} req/s "
+                f"p50={percentile(latencies, 0.5):.1f}ms "
+                f"p99={percentile(latencies, 0.99):.1f}ms "
+                f"errors={errors}"
+            )
+
+    def sample_paths(self):
+        from store.models import Collection, Product, Review
+
+        product_ids = list(
+            Product.objects.order_by("?").values_list("id", flat=True)[:20]
+        )
+        review = Review.objects.values("id", "product_id").first()
+        collection_id = Collection.objects.values_list("id", flat=True).first()
+        if not product_ids or review is None or collection_id is None:
+            raise CommandError("Seed products, collections and reviews first.")
+        paths = ["products/", "products/?page=2", "collections/"]
+        paths += [f"products/{product_id}/" for product_id in product_ids]
+        paths += [
+            f"collections/{collection_id}/",
+            f"products/{review['product_id']}/reviews/",
+            f"products/{review['product_id']}/reviews/{review['id']}/",
+        ]
+        return paths
+
+    def wait_for(self, port, server, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("The server exited before accepting connections.")
+            try:
+                socket.create_connection((HOST, port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"Nothing is listening on port {port}.")
@@ -0,0 +1,92 @@
+import io
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from store.models import Cart, Order, Product
+from store.renderers import ORJSONParser, ORJSONRenderer
+from store.serializers import CartSerializer, OrderSerializer, ProductValuesSerializer
+
+
+def median_us(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare JSONRenderer/JSONParser with their orjson versions on product, "
+        "cart and order payloads, and check the rendered bytes are identical."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument(
+            "--page-size", type=int, default=100, help="Products and orders per page."
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'payload':<10} {'bytes':>8} {'render json':>12} {'orjson':>10} "
+            f"{'parse json':>12} {'orjson':>10}"
+        )
+        for name, data in self.payloads(options["page_size"]):
+            expected = JSONRenderer().render(data)
+            rendered = ORJSONRenderer().render(data)
+            if rendered != expected:
+                raise CommandError(f"The orjson rendering of {name} differs.")
+            if ORJSONParser().parse(io.BytesIO(rendered)) != JSONParser().parse(
+                io.BytesIO(expected)
+            ):
+                raise CommandError(f"The orjson parsing of {name} differs.")
+
+            timings = [
+                median_us(lambda: renderer.render(data), options["iterations"])
+                for renderer in (JSONRenderer(), ORJSONRenderer())
+            ]
+            timings += [
+                median_us(
+                    lambda: parser.parse(io.BytesIO(expected)), options["iterations"]
+                )
+                for parser in (JSONParser(), ORJSONParser())
+            ]
+            self.stdout.write(
+                f"{name:<10} {len(expected):>8} "
+                f"{timings[0]:>10.0f}us {timings[1]:>8.0f}us "
+                f"{timings[2]:>10.0f}us {timings[3]:>8.0f}us "
+                f"({timings[0] / timings[1]:.1f}x, {timings[2] / timings[3]:.1f}x)"
+            )
+
+    def payloads(self, page_size):
+        cart = (
+            Cart.objects.annotate(item_count=Count("items"))
+            .order_by("-item_count")
+            .prefetch_related("items__product")
+            .first()
+        )
+        if cart is None or not cart.item_count or not Order.objects.exists():
+            raise CommandError("Needs carts with items and orders, run generate_data.")
+        products = (
+            Product.objects.select_related("image")
+            .with_prices()
+            .values(
+                *ProductValuesSerializer.values, "price_with_tax", "effective_price"
+            )
+        )
+        orders = Order.objects.with_totals().with_items().order_by("-placed_at")
+        return [
+            (
+                "products",
+                ProductValuesSerializer(products[:page_size], many=True).data,
+            ),
+            ("cart", CartSerializer(cart).data),
+            ("orders", OrderSerializer(orders[:page_size], many=True).data),
+        ]
@@ -0,0 +1,71 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from store import outbox
+from store.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = "Deliver pending outbox events to their handlers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--max-attempts", type=int, default=10)
+        parser.add_argument(
+            "--backoff",
+            type=float,
+            default=5.0,
+            help="Seconds before the first retry, doubled on every attempt.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when there is nothing to deliver.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once the outbox is drained."
+        )
+        parser.add_argument(
+            "--purge-after",
+            type=int,
+            default=7,
+            help="Delete events processed more than this many days ago.",
+        )
+
+    def handle(self, *args, **options):
+        self.purge(options["purge_after"])
+        try:
+            while True:
+                close_old_connections()
+                delivered, failed = outbox.drain(
+                    options["batch_size"], options["max_attempts"], options["backoff"]
+                )
+                if delivered or failed:
+                    self.stdout.write(f"delivered {delivered}, failed {failed}")
+                # A short batch means the outbox is (momentarily) empty.
+                if delivered + failed < options["batch_size"]:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+
+        dead = OutboxEvent.objects.filter(
+            processed_at__isnull=True, attempts__gte=options["max_attempts"]
+        ).count()
+        if dead:
+            self.stderr.write(
+                f"{dead} events gave up after {options['max_attempts']} attempts"
+            )
+
+    def purge(self, days):
+        deleted, _ = OutboxEvent.objects.filter(
+            processed_at__lt=timezone.now() - timedelta(days=days)
+        ).delete()
+        if deleted:
+            self.stdout.write(f"purged {deleted} processed events")
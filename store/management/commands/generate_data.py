@@ -0,0 +1,333 @@
+import random
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from store import cache
+from store.models import (
+    Cart,
+    CartItem,
+    Collection,
+    Customer,
+    Order,
+    OrderItem,
+    Product,
+    Promotion,
+    Review,
+)
+
+WORDS = (
+    "organic fresh classic premium spicy sweet smoked roasted crispy golden "
+    "herbal wild mini family deluxe natural original gourmet rustic tender "
+    "bread cheese coffee tea pasta sauce soap brush pencil paper toy puzzle "
+    "cookie flour pepper salt cinnamon vanilla shampoo towel candle magazine"
+).split()
+DISCOUNTS = (5, 10, 15, 20, 25, 30, 50)
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let ``bulk_create`` keep the timestamps we generate instead of now()."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large synthetic catalog, customer and order data set. Rows "
+        "are bulk created, so the review counters, discounts and sales rollups "
+        "are rebuilt at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--collections", type=int, default=100)
+        parser.add_argument("--products", type=int, default=1_000_000)
+        parser.add_argument("--customers", type=int, default=100_000)
+        parser.add_argument("--orders", type=int, default=2_000_000)
+        parser.add_argument("--max-items-per-order", type=int, default=5)
+        parser.add_argument("--carts", type=int, default=500_000)
+        parser.add_argument("--max-items-per-cart", type=int, default=4)
+        parser.add_argument("--reviews", type=int, default=2_000_000)
+        parser.add_argument("--promotions", type=int, default=20)
+        parser.add_argument("--products-per-promotion", type=int, default=1000)
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.1,
+            help="Zipf exponent for product and customer popularity (0 is uniform).",
+        )
+        parser.add_argument(
+            "--days", type=int, default=365, help="Spread timestamps over this window."
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.now = timezone.now()
+        self.window = timedelta(days=options["days"]).total_seconds()
+
+        collection_ids = self.create_collections(options["collections"])
+        product_ids, prices = self.create_products(options["products"], collection_ids)
+        customer_ids = self.create_customers(options["customers"])
+
+        self.product_sampler = self.zipf_sampler(product_ids, options["skew"])
+        self.customer_sampler = self.zipf_sampler(customer_ids, options["skew"])
+        self.prices = dict(zip(product_ids, prices))
+
+        self.create_orders(options["orders"], options["max_items_per_order"])
+        self.create_carts(options["carts"], options["max_items_per_cart"])
+        self.create_reviews(options["reviews"])
+        promotion_ids = self.create_promotions(
+            options["promotions"], options["products_per_promotion"]
+        )
+        self.rebuild_derived_data(product_ids, promotion_ids)
+
+    def zipf_sampler(self, population, skew):
+        if not population:
+            return lambda k: []
+        population = list(population)
+        self.random.shuffle(population)
+        cum_weights = list(
+            accumulate(1 / (rank**skew) for rank in range(1, len(population) + 1))
+        )
+        return lambda k: self.random.choices(population, cum_weights=cum_weights, k=k)
+
+    def distinct_products(self, count):
+        return list(dict.fromkeys(self.product_sampler(count)))
+
+    def timestamp(self):
+        return self.now - timedelta(seconds=self.random.random() * self.window)
+
+    def next_id(self, model):
+        return (model.objects.aggregate(max_id=Max("id"))["max_id"] or 0) + 1
+
+    def title(self, words=3):
+        return " ".join(self.random.choice(WORDS) for _ in range(words)).title()
+
+    def bulk_insert(self, label, total, build):
+        """Insert ``total`` rows ``batch_size`` at a time.
+
+        ``build(start, size)`` returns a list of object lists; each list is
+        bulk created in order, so parents can be returned before children.
+        """
+        started = time.perf_counter()
+        inserted = 0
+        for start in range(0, total, self.batch_size):
+            size = min(self.batch_size, total - start)
+            with transaction.atomic():
+                for objs in build(start, size):
+                    if objs:
+                        type(objs[0]).objects.bulk_create(objs, batch_size=size)
+                        inserted += len(objs)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label}: {inserted} rows in {elapsed:.1f}s "
+            f"({inserted / elapsed if elapsed else 0:.0f} rows/s)"
+        )
+
+    def create_collections(self, total):
+        first_id = self.next_id(Collection)
+        self.bulk_insert(
+            "collections",
+            total,
+            lambda start, size: [
+                [
+                    Collection(id=first_id + i, title=self.title(2))
+                    for i in range(start, start + size)
+                ]
+            ],
+        )
+        return list(range(first_id, first_id + total))
+
+    def create_products(self, total, collection_ids):
+        first_id = self.next_id(Product)
+        prices = array("l", (self.random.randint(100, 99999) for _ in range(total)))
+
+        def build(start, size):
+            products = []
+            for i in range(start, start + size):
+                title = self.title()
+                products.append(
+                    Product(
+                        id=first_id + i,
+                        title=title,
+                        slug=f"{title.lower().replace(' ', '-')}-{first_id + i}",
+                        description=self.title(12).lower(),
+                        unit_price=Decimal(prices[i]) / 100,
+                        inventory=self.random.randint(0, 500),
+                        collection_id=self.random.choice(collection_ids),
+                    )
+                )
+            return [products]
+
+        self.bulk_insert("products", total, build)
+        return range(first_id, first_id + total), prices
+
+    def create_customers(self, total):
+        User = get_user_model()
+        first_user_id = self.next_id(User)
+        first_customer_id = self.next_id(Customer)
+        # benchmark_api signs its own tokens, nobody logs in as these users.
+        password = make_password(None)
+
+        def build(start, size):
+            users, customers = [], []
+            for i in range(start, start + size):
+                users.append(
+                    User(
+                        id=first_user_id + i,
+                        username=f"synthetic{first_user_id + i}",
+                        email=f"synthetic{first_user_id + i}@example.com",
+                        first_name=self.random.choice(WORDS).title(),
+                        last_name=self.random.choice(WORDS).title(),
+                        password=password,
+                        # One staff account so staff-only endpoints can be benchmarked.
+                        is_staff=i == 0,
+                    )
+                )
+                customers.append(
+                    Customer(
+                        id=first_customer_id + i,
+                        user_id=first_user_id + i,
+                        membership=self.random.choice("BBBSSG"),
+                    )
+                )
+            return [users, customers]
+
+        self.bulk_insert("users and customers", total, build)
+        return range(first_customer_id, first_customer_id + total)
+
+    def create_orders(self, total, max_items):
+        first_id = self.next_id(Order)
+        statuses = [
+            Order.PAYMENT_STATUS_COMPLETE,
+            Order.PAYMENT_STATUS_PENDING,
+            Order.PAYMENT_STATUS_FAILED,
+        ]
+
+        def build(start, size):
+            orders, items = [], []
+            for order_id, customer_id in zip(
+                range(first_id + start, first_id + start + size),
+                self.customer_sampler(size),
+            ):
+                orders.append(
+                    Order(
+                        id=order_id,
+                        placed_at=self.timestamp(),
+                        payment_status=self.random.choices(statuses, (85, 10, 5))[0],
+                        customer_id=customer_id,
+                    )
+                )
+                for product_id in self.distinct_products(
+                    self.random.randint(1, max_items)
+                ):
+                    items.append(
+                        OrderItem(
+                            order_id=order_id,
+                            product_id=product_id,
+                            quantity=self.random.randint(1, 5),
+                            unit_price=Decimal(self.prices[product_id]) / 100,
+                        )
+                    )
+            return [orders, items]
+
+        with explicit_timestamps(Order._meta.get_field("placed_at")):
+            self.bulk_insert("orders and order items", total, build)
+
+    def create_carts(self, total, max_items):
+        def build(start, size):
+            carts, items = [], []
+            for _ in range(size):
+                cart = Cart(id=uuid4(), created_at=self.timestamp())
+                carts.append(cart)
+                for product_id in self.distinct_products(
+                    self.random.randint(1, max_items)
+                ):
+                    items.append(
+                        CartItem(
+                            cart_id=cart.id,
+                            product_id=product_id,
+                            quantity=self.random.randint(1, 5),
+                        )
+                    )
+            return [carts, items]
+
+        with explicit_timestamps(Cart._meta.get_field("created_at")):
+            self.bulk_insert("carts and cart items", total, build)
+
+    def create_reviews(self, total):
+        def build(start, size):
+            return [
+                [
+                    Review(
+                        product_id=product_id,
+                        name=self.random.choice(WORDS).title(),
+                        body=self.title(20).lower(),
+                        date=self.timestamp().date(),
+                    )
+                    for product_id in self.product_sampler(size)
+                ]
+            ]
+
+        with explicit_timestamps(Review._meta.get_field("date")):
+            self.bulk_insert("reviews", total, build)
+
+    def create_promotions(self, total, products_per_promotion):
+        first_id = self.next_id(Promotion)
+        ProductPromotion = Product.promotions.through
+
+        def build(start, size):
+            promotions, links = [], []
+            for promotion_id in range(first_id + start, first_id + start + size):
+                promotions.append(
+                    Promotion(
+                        id=promotion_id,
+                        description=f"{self.title(2)} sale",
+                        discount=self.random.choice(DISCOUNTS),
+                    )
+                )
+                links += [
+                    ProductPromotion(promotion_id=promotion_id, product_id=product_id)
+                    for product_id in self.distinct_products(products_per_promotion)
+                ]
+            return [promotions, links]
+
+        self.bulk_insert("promotions and promoted products", total, build)
+        return list(range(first_id, first_id + total))
+
+    def rebuild_derived_data(self, product_ids, promotion_ids):
+        """Fill in what the signals and the outbox maintain for live writes."""
+        started = time.perf_counter()
+        for start in range(0, len(product_ids), self.batch_size):
+            batch = product_ids[start : start + self.batch_size]
+            with transaction.atomic():
+                Product.objects.filter(
+                    pk__gte=batch[0], pk__lte=batch[-1]
+                ).recount_reviews()
+        cache.bump(cache.CATALOG)
+        self.stdout.write(
+            f"review counters: {len(product_ids)} products in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+        call_command("rebuild_discounts", promotion=promotion_ids, stdout=self.stdout)
+        call_command("backfill_sales", stdout=self.stdout)
@@ -0,0 +1,300 @@
+import csv
+import json
+import multiprocessing
+import sys
+import time
+from collections import deque
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from store import cache
+from store.models import Collection, Product
+
+# Rows whose values all match the database are left alone.
+COMPARED_FIELDS = ("title", "description", "unit_price", "inventory", "collection_id")
+# The largest value of Product.inventory, an IntegerField.
+MAX_INVENTORY = 2**31 - 1
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(fp):
+    yield from csv.DictReader(fp)
+
+
+def read_ndjson(fp):
+    decoder = json.JSONDecoder(parse_float=Decimal)
+    for line in fp:
+        line = line.strip()
+        if line:
+            yield decoder.decode(line)
+
+
+def read_json_array(fp, chunk_size=1 << 16):
+    """Yield the elements of a top level JSON array without reading it whole."""
+    decoder = json.JSONDecoder(parse_float=Decimal)
+    buffer = fp.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise CommandError("Expected a JSON array.")
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(","):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            element, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError("Malformed JSON array.")
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield element
+        buffer = buffer[end:]
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson, "json": read_json_array}
+
+
+def parse_row(raw) -> dict:
+    if not isinstance(raw, dict):
+        raise RowError("expected an object")
+    title = str(raw.get("title") or "").strip()
+    if not title or len(title) > 255:
+        raise RowError("title must be 1 to 255 characters")
+    slug = str(raw.get("slug") or "").strip() or slugify(title)[:50]
+    if not slug or len(slug) > 50 or slug != slugify(slug):
+        raise RowError(f"invalid slug {slug!r}")
+    collection = str(raw.get("collection") or "").strip()
+    if not collection:
+        raise RowError("collection is required")
+    try:
+        unit_price = Decimal(str(raw.get("unit_price"))).quantize(Decimal("0.01"))
+        # NaN quantizes fine, but cannot be compared with the bounds below.
+        if not unit_price.is_finite():
+            raise InvalidOperation
+    except InvalidOperation:
+        raise RowError(f"invalid unit_price {raw.get('unit_price')!r}")
+    if not Decimal(1) <= unit_price < Decimal(10000):
+        raise RowError("unit_price must be between 1 and 9999.99")
+    inventory = raw.get("inventory")
+    if inventory is None or inventory == "":
+        inventory = 0
+    # Whole numbers only, int() would truncate 2.7 and Decimal("2.0").
+    elif isinstance(inventory, str):
+        try:
+            inventory = int(inventory)
+        except ValueError:
+            raise RowError(f"invalid inventory {raw.get('inventory')!r}")
+    elif type(inventory) is not int:
+        raise RowError(f"invalid inventory {raw.get('inventory')!r}")
+    if inventory < 0:
+        raise RowError("inventory cannot be negative")
+    if inventory > MAX_INVENTORY:
+        raise RowError(f"inventory cannot exceed {MAX_INVENTORY}")
+    return {
+        "title": title,
+        "slug": slug,
+        "description": raw.get("description") or None,
+        "unit_price": unit_price,
+        "inventory": inventory,
+        "collection": collection,
+    }
+
+
+def parse_batch(batch):
+    rows, errors = [], []
+    for number, raw in batch:
+        try:
+            rows.append(parse_row(raw))
+        except RowError as exc:
+            errors.append((number, str(exc)))
+    return rows, errors
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a CSV, NDJSON or JSON array product feed into the catalog, "
+        "upserting products by slug and resolving collections by title."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Feed file, or - to read stdin.")
+        parser.add_argument("--format", choices=sorted(READERS), default=None)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Parse and validate rows in this many processes.",
+        )
+        parser.add_argument(
+            "--create-collections",
+            action="store_true",
+            help="Create collections that do not exist instead of skipping rows.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument("--max-errors-shown", type=int, default=20)
+
+    def handle(self, *args, **options):
+        reader = READERS[self.get_format(options["path"], options["format"])]
+        self.create_collections = options["create_collections"]
+        self.collections = {}
+        self.created = self.updated = self.unchanged = self.invalid = 0
+        self.max_errors_shown = options["max_errors_shown"]
+        self.errors_shown = 0
+
+        started = time.perf_counter()
+        processed = 0
+        with self.open(options["path"]) as fp:
+            for rows, errors in self.parse(
+                reader(fp), options["batch_size"], options["workers"]
+            ):
+                for number, message in errors:
+                    self.report_error(number, message)
+                if not options["dry_run"]:
+                    self.write(rows)
+                processed += len(rows) + len(errors)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{processed} rows, {processed / elapsed:.0f} rows/s", ending="\r"
+                )
+
+        if self.created or self.updated:
+            cache.bump(cache.CATALOG)
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{processed} rows in {elapsed:.1f}s ({rate:.0f} rows/s): "
+            f"{self.created} created, {self.updated} updated, "
+            f"{self.unchanged} unchanged, {self.invalid} skipped"
+        )
+
+    def get_format(self, path, explicit):
+        if explicit:
+            return explicit
+        suffix = Path(path).suffix.lstrip(".").lower()
+        if suffix == "jsonl":
+            return "ndjson"
+        if suffix not in READERS:
+            raise CommandError("Cannot tell the feed format, pass --format.")
+        return suffix
+
+    def open(self, path):
+        if path == "-":
+            return open(sys.stdin.fileno(), encoding="utf-8", newline="", closefd=False)
+        return open(path, encoding="utf-8", newline="")
+
+    def parse(self, records, batch_size, workers):
+        """Parse batches in order, keeping at most two per worker in flight."""
+        batches = batched(enumerate(records, 1), batch_size)
+        if workers <= 1:
+            yield from map(parse_batch, batches)
+            return
+        # Forked workers must not inherit open database connections.
+        connections.close_all()
+        with multiprocessing.Pool(workers) as pool:
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.apply_async(parse_batch, (batch,)))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+    def report_error(self, number, message):
+        self.invalid += 1
+        if self.errors_shown < self.max_errors_shown:
+            self.errors_shown += 1
+            self.stderr.write(f"record {number}: {message}")
+
+    def write(self, rows):
+        # The last occurrence of a slug in the batch wins.
+        rows = list({row["slug"]: row for row in rows}.values())
+        with transaction.atomic():
+            collection_ids = self.resolve_collections(
+                {row["collection"] for row in rows}
+            )
+            existing = {
+                product["slug"]: product
+                for product in Product.objects.filter(
+                    slug__in=[row["slug"] for row in rows]
+                )
+                .order_by("-id")
+                .values("id", "slug", *COMPARED_FIELDS)
+            }
+            now = timezone.now()
+            to_create, to_update = [], []
+            for row in rows:
+                collection_id = collection_ids.get(row["collection"])
+                if collection_id is None:
+                    self.report_error(
+                        row["slug"], f"unknown collection {row['collection']!r}"
+                    )
+                    continue
+                product = Product(
+                    title=row["title"],
+                    slug=row["slug"],
+                    description=row["description"],
+                    unit_price=row["unit_price"],
+                    inventory=row["inventory"],
+                    collection_id=collection_id,
+                    last_update=now,
+                )
+                current = existing.get(row["slug"])
+                if current is None:
+                    to_create.append(product)
+                elif any(
+                    getattr(product, field) != current[field]
+                    for field in COMPARED_FIELDS
+                ):
+                    product.id = current["id"]
+                    to_update.append(product)
+                else:
+                    self.unchanged += 1
+            Product.objects.bulk_create(to_create)
+            Product.objects.upsert(to_update)
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def resolve_collections(self, titles):
+        missing = titles - self.collections.keys()
+        if missing:
+            self.collections.update(self.find_collections(missing))
+            missing -= self.collections.keys()
+            if missing and self.create_collections:
+                Collection.objects.bulk_create(
+                    Collection(title=title) for title in sorted(missing)
+                )
+                # MySQL does not return the new ids from bulk_create.
+                self.collections.update(self.find_collections(missing))
+        return self.collections
+
+    def find_collections(self, titles):
+        # Duplicate titles resolve to the oldest collection.
+        return dict(
+            Collection.objects.filter(title__in=titles)
+            .order_by("-id")
+            .values_list("title", "id")
+        )
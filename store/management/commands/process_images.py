@@ -0,0 +1,81 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from store import images
+from store.models import Image
+
+
+class Command(BaseCommand):
+    help = "Validate, resize and upload staged product images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument(
+            "--backoff",
+            type=float,
+            default=5.0,
+            help="Seconds before the first retry, doubled on every attempt.",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=600,
+            help="Seconds before an image stuck in processing is retried.",
+        )
+        parser.add_argument("--poll-interval", type=float, default=2.0)
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when nothing is pending."
+        )
+
+    def handle(self, *args, **options):
+        backend = images.get_backend()
+        try:
+            while True:
+                close_old_connections()
+                self.release_stale(options["stale_after"])
+                processed = self.process_batch(
+                    backend,
+                    options["batch_size"],
+                    options["max_attempts"],
+                    options["backoff"],
+                )
+                if not processed:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def release_stale(self, seconds):
+        # A worker that died mid-upload leaves its images in processing.
+        Image.objects.filter(
+            status=Image.STATUS_PROCESSING,
+            updated_at__lt=timezone.now() - timedelta(seconds=seconds),
+        ).update(status=Image.STATUS_PENDING, updated_at=timezone.now())
+
+    def process_batch(self, backend, batch_size, max_attempts, backoff):
+        candidates = Image.objects.filter(
+            status=Image.STATUS_PENDING, available_at__lte=timezone.now()
+        ).order_by("id")
+        processed = 0
+        for image_id in candidates.values_list("id", flat=True)[:batch_size]:
+            # The conditional update makes sure only one worker gets the image.
+            claimed = Image.objects.filter(
+                pk=image_id, status=Image.STATUS_PENDING
+            ).update(status=Image.STATUS_PROCESSING, updated_at=timezone.now())
+            if not claimed:
+                continue
+            image = Image.objects.get(pk=image_id)
+            started = time.perf_counter()
+            images.process(image, backend, max_attempts, backoff)
+            processed += 1
+            self.stdout.write(
+                f"image {image.pk} for product {image.product_id}: {image.status} "
+                f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+            )
+        return processed
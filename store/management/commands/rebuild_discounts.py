@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store import cache
+from store.models import Product, ProductDiscount
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild ProductDiscount from the product promotions, in batches. Run it "
+        "after assigning promotions in bulk without the m2m signals, e.g. with "
+        "Product.promotions.through.objects.bulk_create()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--promotion",
+            type=int,
+            nargs="*",
+            default=None,
+            help="Only rebuild the products of these promotions.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["promotion"] is None:
+            products = Product.objects.all()
+        else:
+            products = Product.objects.filter(
+                promotions__in=options["promotion"]
+            ).distinct()
+        products = products.order_by("pk").values_list("pk", flat=True)
+
+        started = time.perf_counter()
+        refreshed = discounted = 0
+        last_id = 0
+        while True:
+            product_ids = list(products.filter(pk__gt=last_id)[: options["batch_size"]])
+            if not product_ids:
+                break
+            discounted += ProductDiscount.objects.refresh(product_ids)
+            refreshed += len(product_ids)
+            last_id = product_ids[-1]
+        if refreshed:
+            # Cached catalog pages show effective prices and sort on them.
+            cache.bump(cache.CATALOG)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Refreshed {refreshed} products, {discounted} discounted, "
+                f"in {time.perf_counter() - started:.1f}s."
+            )
+        )
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+
+from store import cache
+from store.models import Collection, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Repair drift in denormalised counters: Collection.product_count and "
+        "Product.review_count / last_review_date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Report drift without fixing it."
+        )
+
+    def handle(self, *args, **options):
+        verb = "drifted" if options["dry_run"] else "repaired"
+        collections = self.reconcile_collections(options["dry_run"])
+        products = self.reconcile_reviews(options["dry_run"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{collections} collection counts and "
+                f"{products} product review stats {verb}."
+            )
+        )
+
+    def reconcile_collections(self, dry_run):
+        drifted = list(
+            Collection.objects.annotate(actual=Count("products"))
+            .exclude(product_count=F("actual"))
+            .values_list("id", "title", "product_count", "actual")
+        )
+        for collection_id, title, stored, actual in drifted:
+            self.stdout.write(
+                f"collection {collection_id} ({title}): product_count {stored} != {actual}"
+            )
+        if drifted and not dry_run:
+            with transaction.atomic():
+                Collection.objects.filter(
+                    pk__in=[row[0] for row in drifted]
+                ).recount_products()
+                cache.bump(cache.CATALOG)
+        return len(drifted)
+
+    def reconcile_reviews(self, dry_run):
+        drifted = list(
+            Product.objects.order_by()
+            .annotate(actual=Count("reviews"), latest=Max("reviews__date"))
+            .exclude(
+                Q(review_count=F("actual"))
+                & (
+                    Q(last_review_date=F("latest"))
+                    | Q(last_review_date__isnull=True, latest__isnull=True)
+                )
+            )
+            .values_list("id", "review_count", "actual", "last_review_date", "latest")
+        )
+        for product_id, stored, actual, stored_date, latest in drifted:
+            self.stdout.write(
+                f"product {product_id}: review_count {stored} != {actual} "
+                f"or last_review_date {stored_date} != {latest}"
+            )
+        if drifted and not dry_run:
+            with transaction.atomic():
+                Product.objects.filter(
+                    pk__in=[row[0] for row in drifted]
+                ).recount_reviews()
+                cache.bump(cache.CATALOG)
+        return len(drifted)
@@ -0,0 +1,207 @@
+import queue
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Max, Sum
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from store import analytics
+from store.models import (
+    Cart,
+    CartItem,
+    Collection,
+    Customer,
+    Order,
+    OrderItem,
+    OutboxEvent,
+    Product,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Check out many carts holding the same hot products from concurrent "
+        "threads and verify that stock is never oversold. Creates its own "
+        "products, customers and carts and deletes them and their orders "
+        "afterwards. Only runs with DEBUG on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--checkouts", type=int, default=200)
+        parser.add_argument("--hot-products", type=int, default=3)
+        parser.add_argument(
+            "--stock",
+            type=int,
+            default=100,
+            help="Inventory given to each hot product.",
+        )
+        parser.add_argument("--max-quantity", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the data it created."
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            raise CommandError("Only run stress_checkout against a DEBUG setup.")
+        rng = random.Random(options["seed"])
+        run = uuid4().hex[:8]
+        collection = Collection.objects.create(title=f"stress_checkout {run}")
+        Product.objects.bulk_create(
+            Product(
+                title=f"stress_checkout {run} {i}",
+                slug=f"stress-checkout-{run}-{i}",
+                unit_price=Decimal(rng.randint(100, 9999)) / 100,
+                inventory=options["stock"],
+                collection=collection,
+            )
+            for i in range(options["hot_products"])
+        )
+        products = list(
+            Product.objects.filter(collection=collection)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        users = [
+            get_user_model().objects.create_user(
+                f"stress_checkout_{run}_{i}", f"stress_checkout_{run}_{i}@example.com"
+            )
+            for i in range(options["threads"])
+        ]
+        customers = list(Customer.objects.select_related("user").filter(user__in=users))
+        carts = [Cart(id=uuid4()) for _ in range(options["checkouts"])]
+        Cart.objects.bulk_create(carts)
+        CartItem.objects.bulk_create(
+            CartItem(
+                cart_id=cart.id,
+                product_id=product_id,
+                quantity=rng.randint(1, options["max_quantity"]),
+            )
+            for cart in carts
+            for product_id in rng.sample(products, rng.randint(1, len(products)))
+        )
+        last_event_id = OutboxEvent.objects.aggregate(last=Max("id"))["last"] or 0
+
+        try:
+            self.stress(carts, customers, products, options)
+        finally:
+            if not options["keep"]:
+                self.clean_up(collection, products, users, carts, last_event_id)
+
+    def stress(self, carts, customers, products, options):
+        pending = queue.Queue()
+        for cart in carts:
+            pending.put(cart.id)
+        outcomes = Counter()
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(customer):
+            client = Client(SERVER_NAME="localhost", raise_request_exception=False)
+            headers = {
+                "HTTP_AUTHORIZATION": f"JWT {AccessToken.for_user(customer.user)}"
+            }
+            try:
+                while True:
+                    try:
+                        cart_id = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    started = time.perf_counter()
+                    response = client.post(
+                        "/store/orders/",
+                        {"cart_id": str(cart_id)},
+                        content_type="application/json",
+                        **headers,
+                    )
+                    with lock:
+                        outcomes[response.status_code] += 1
+                        latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=(customers[i % len(customers)],))
+            for i in range(options["threads"])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{sum(outcomes.values())} checkouts in {elapsed:.1f}s "
+            f"({sum(outcomes.values()) / elapsed:.0f}/s), "
+            f"p50={statistics.median(latencies):.1f}ms max={max(latencies):.1f}ms"
+        )
+        for code, count in sorted(outcomes.items()):
+            self.stdout.write(f"  HTTP {code}: {count}")
+        self.verify(products, options["stock"], customers, outcomes)
+
+    def verify(self, products, stock, customers, outcomes):
+        orders = Order.objects.filter(customer__in=customers)
+        sold = dict(
+            OrderItem.objects.filter(order__in=orders, product_id__in=products)
+            .values_list("product_id")
+            .annotate(Sum("quantity"))
+        )
+        inventory = dict(
+            Product.objects.filter(pk__in=products).values_list("pk", "inventory")
+        )
+        problems = []
+        for product_id in products:
+            self.stdout.write(
+                f"  product {product_id}: sold {sold.get(product_id, 0)}, "
+                f"{inventory[product_id]} left"
+            )
+            if inventory[product_id] < 0:
+                problems.append(f"product {product_id} has negative inventory")
+            if inventory[product_id] + sold.get(product_id, 0) != stock:
+                problems.append(f"product {product_id} stock does not add up")
+        if orders.count() != outcomes[200]:
+            problems.append(
+                f"{orders.count()} orders created for {outcomes[200]} successes"
+            )
+        if any(code >= 500 for code in outcomes):
+            if connection.vendor == "sqlite":
+                # SQLite rejects concurrent writers with "database is locked".
+                self.stdout.write(self.style.WARNING("Lock errors under SQLite."))
+            else:
+                problems.append("server errors during checkout")
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No overselling detected."))
+
+    def clean_up(self, collection, products, users, carts, last_event_id):
+        with transaction.atomic():
+            orders = list(
+                Order.objects.filter(customer__user__in=users).values_list(
+                    "id", flat=True
+                )
+            )
+            OutboxEvent.objects.filter(
+                pk__gt=last_event_id, payload__order_id__in=orders
+            ).delete()
+            OrderItem.objects.filter(order__in=orders).delete()
+            Order.objects.filter(pk__in=orders).delete()
+            Cart.objects.filter(pk__in=[cart.id for cart in carts]).delete()
+            Product.objects.filter(pk__in=products).delete()
+            collection.delete()
+            get_user_model().objects.filter(pk__in=[user.pk for user in users]).delete()
+            if orders:
+                # Take the deleted orders out of the sales rollups.
+                analytics.rebuild_day(timezone.localdate())
@@ -0,0 +1,131 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from store.models import Cart, CartItem
+
+# The highest cart item ids when the last two orphan sweeps started.
+ORPHAN_MARKS_KEY = "sweep_carts:orphan-marks"
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete carts older than --days in small batches, oldest first, with "
+        "their items. Meant to run periodically (e.g. Heroku Scheduler) next to "
+        "live traffic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=30)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.05,
+            help="Seconds to pause between batches to leave room for traffic.",
+        )
+        parser.add_argument(
+            "--max-batches", type=int, default=None, help="Stop after this many."
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Count what would be deleted."
+        )
+        parser.add_argument(
+            "--all-items",
+            action="store_true",
+            help="Check every cart item for orphans, not only the recent ones.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        expired = Cart.objects.filter(created_at__lt=cutoff)
+        if options["dry_run"]:
+            self.stdout.write(
+                f"{expired.count()} carts and "
+                f"{CartItem.objects.filter(cart__in=expired).count()} items "
+                f"created before {cutoff:%Y-%m-%d %H:%M} would be deleted."
+            )
+            return
+
+        started = time.perf_counter()
+        carts = items = batches = 0
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            deleted_carts, deleted_items = self.delete_batch(
+                expired, options["batch_size"]
+            )
+            if not deleted_carts:
+                break
+            batches += 1
+            carts += deleted_carts
+            items += deleted_items
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{carts} carts, {items} items, {carts / elapsed:.0f} carts/s"
+            )
+            time.sleep(options["sleep"])
+
+        orphans = self.delete_orphans(
+            options["batch_size"], options["sleep"], options["all_items"]
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {carts} carts and {items} items in {batches} batches "
+                f"({elapsed:.1f}s, {carts / elapsed if elapsed else 0:.0f} carts/s), "
+                f"and {orphans} orphaned items."
+            )
+        )
+
+    def delete_batch(self, expired, batch_size):
+        # Each batch is its own short transaction. Carts locked by a checkout
+        # or by another sweeper are skipped rather than waited for.
+        with transaction.atomic():
+            cart_ids = list(
+                expired.select_for_update(skip_locked=True)
+                .order_by("created_at")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not cart_ids:
+                return 0, 0
+            items, _ = CartItem.objects.filter(cart_id__in=cart_ids).delete()
+            carts, _ = Cart.objects.filter(id__in=cart_ids).delete()
+        return carts, items
+
+    def delete_orphans(self, batch_size, pause, all_items=False):
+        """Items added to a cart while it was being deleted.
+
+        Without foreign key constraints (PlanetScale) nothing stops that insert.
+        Items are walked in primary key order, so each batch reads at most
+        ``batch_size`` items and the carts they belong to. They are walked from
+        the highest id seen when the run before the last one started, which
+        still covers items committed late by transactions open during the last
+        run, so a run reads the recent items rather than the whole table.
+        """
+        older_top, last_top = cache.get(ORPHAN_MARKS_KEY, (0, 0))
+        last_id = 0 if all_items else older_top
+        top = CartItem.objects.aggregate(top=Max("id"))["top"] or 0
+        deleted = 0
+        while True:
+            items = list(
+                CartItem.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "cart_id")[:batch_size]
+            )
+            if not items:
+                cache.set(ORPHAN_MARKS_KEY, (last_top, top), timeout=None)
+                return deleted
+            last_id = items[-1][0]
+            cart_ids = {cart_id for _, cart_id in items}
+            carts = set(
+                Cart.objects.filter(id__in=cart_ids).values_list("id", flat=True)
+            )
+            orphan_ids = [item_id for item_id, cart_id in items if cart_id not in carts]
+            if orphan_ids:
+                count, _ = CartItem.objects.filter(id__in=orphan_ids).delete()
+                deleted += count
+            time.sleep(pause)
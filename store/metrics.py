@@ -0,0 +1,250 @@
+import asyncio
+import bisect
+import contextvars
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import LazyObject, empty
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer
+
+# Upper bounds in milliseconds, the last bucket catches everything slower.
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# The stats of the request being handled, if any. Context variables follow the
+# request into the thread pools sync_to_async runs it in.
+current = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time", "serialize_time", "render_time", "depth")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        # Serializers whose data is being built, the outermost one is timed.
+        self.depth = 0
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.total_ms = 0.0
+        self.queries = 0
+        self.query_ms = 0.0
+        self.serialize_ms = 0.0
+        self.render_ms = 0.0
+
+    def observe(self, total_ms, stats):
+        self.count += 1
+        self.buckets[bisect.bisect_left(BUCKETS, total_ms)] += 1
+        self.total_ms += total_ms
+        self.queries += stats.queries
+        self.query_ms += stats.query_time * 1000
+        self.serialize_ms += stats.serialize_time * 1000
+        self.render_ms += stats.render_time * 1000
+
+    def percentile(self, fraction):
+        """The upper bound of the bucket holding the percentile, None if above all."""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "buckets": dict(zip([*map(str, BUCKETS), "inf"], self.buckets)),
+            "queries_per_request": round(self.queries / self.count, 2),
+            "query_ms_per_request": round(self.query_ms / self.count, 2),
+            "serialize_ms_per_request": round(self.serialize_ms / self.count, 2),
+            "render_ms_per_request": round(self.render_ms / self.count, 2),
+        }
+
+
+class Registry:
+    """Per-route histograms for this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.started_at = time.time()
+
+    def observe(self, route, total_ms, stats):
+        with self.lock:
+            histogram = self.routes.get(route)
+            if histogram is None:
+                histogram = self.routes[route] = Histogram()
+            histogram.observe(total_ms, stats)
+
+    def snapshot(self):
+        with self.lock:
+            routes = {
+                route: histogram.as_dict()
+                for route, histogram in sorted(self.routes.items())
+            }
+        return {
+            "pid": os.getpid(),
+            "since": self.started_at,
+            "routes": routes,
+        }
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+            self.started_at = time.time()
+
+
+registry = Registry()
+
+
+def time_query(execute, sql, params, many, context):
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+def install_query_timer(sender=None, connection=None, **kwargs):
+    # Wrappers outlive their connections, so only add the timer once.
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+serializer_data = BaseSerializer.data
+
+
+def timed_serializer_data(serializer):
+    """``BaseSerializer.data``, timed without the queries it runs.
+
+    ``Serializer.data`` and ``ListSerializer.data`` both go through it, nested
+    serializers only through ``to_representation``, so this covers the
+    serializer work of a response once.
+    """
+    stats = current.get()
+    if stats is None or stats.depth:
+        return serializer_data.fget(serializer)
+    stats.depth += 1
+    query_time = stats.query_time
+    started = time.perf_counter()
+    try:
+        return serializer_data.fget(serializer)
+    finally:
+        stats.depth -= 1
+        elapsed = time.perf_counter() - started
+        stats.serialize_time += elapsed - (stats.query_time - query_time)
+
+
+def install_serializer_timer():
+    if BaseSerializer.data is serializer_data:
+        BaseSerializer.data = property(timed_serializer_data)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        stats = current.get()
+        if stats is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            stats.render_time += time.perf_counter() - started
+
+
+def shows_timing(request):
+    """Whether the response gets a ``Server-Timing`` header.
+
+    Only in DEBUG or for staff. A user is never loaded for it: a session user
+    nothing looked at yet counts as anonymous.
+    """
+    if settings.DEBUG:
+        return True
+    user = getattr(request, "user", None)
+    if isinstance(user, LazyObject) and user._wrapped is empty:
+        return bool(user.__dict__.get("is_staff"))
+    return bool(getattr(user, "is_staff", False))
+
+
+def route_name(request):
+    match = request.resolver_match
+    if match is None:
+        return f"{request.method} unmatched"
+    return f"{request.method} {match.view_name or match.route}"
+
+
+class RequestMetricsMiddleware:
+    """Time each request, its queries, serializers and rendering.
+
+    The numbers go to the per-route histograms served by ``MetricsView``, and
+    to a ``Server-Timing`` header in DEBUG or for staff.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Mark the instance as a coroutine function for Django's handler.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        connection_created.connect(
+            install_query_timer, dispatch_uid="store.metrics.install_query_timer"
+        )
+        for connection in connections.all():
+            install_query_timer(connection=connection)
+        install_serializer_timer()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.record(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.record(request, response, stats, started)
+
+    def record(self, request, response, stats, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        registry.observe(route_name(request), total_ms, stats)
+        if shows_timing(request):
+            response["Server-Timing"] = (
+                f'db;dur={stats.query_time * 1000:.1f};desc="{stats.queries} queries", '
+                f"serialize;dur={stats.serialize_time * 1000:.1f}, "
+                f"render;dur={stats.render_time * 1000:.1f}, "
+                f"total;dur={total_ms:.1f}"
+            )
+        return response
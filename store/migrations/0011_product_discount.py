@@ -0,0 +1,40 @@
+# Generated by Django 3.2 on 2026-10-18 03:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_discounts(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductDiscount = apps.get_model('store', 'ProductDiscount')
+    promotions = (
+        Product.promotions.through.objects.filter(promotion__discount__gt=0)
+        .order_by('product_id', '-promotion__discount', 'promotion_id')
+        .values_list('product_id', 'promotion_id', 'promotion__discount')
+    )
+    best = {}
+    for product_id, promotion_id, discount in promotions.iterator():
+        if product_id not in best:
+            best[product_id] = ProductDiscount(
+                product_id=product_id, promotion_id=promotion_id, discount=discount
+            )
+    ProductDiscount.objects.bulk_create(best.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_effective_prices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDiscount',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='active_discount', serialize=False, to='store.product')),
+                ('discount', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('promotion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.promotion')),
+            ],
+        ),
+        migrations.RunPython(fill_discounts, migrations.RunPython.noop),
+    ]
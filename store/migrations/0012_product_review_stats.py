@@ -0,0 +1,38 @@
+# Generated by Django 3.2 on 2026-10-18 03:42
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_reviews(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Review = apps.get_model('store', 'Review')
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        review_count=Coalesce(
+            Subquery(reviews.annotate(count=Count('pk')).values('count')), 0
+        ),
+        last_review_date=Subquery(reviews.annotate(latest=Max('date')).values('latest')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_product_discount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='last_review_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_reviews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2 on 2026-10-18 04:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0002_alter_user_email'),
+        ('store', '0013_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='uploaded_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='profiles.user'),
+        ),
+    ]
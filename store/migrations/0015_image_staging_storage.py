@@ -0,0 +1,24 @@
+# Generated by Django 3.2 on 2026-10-18 04:27
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_image_uploaded_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='available_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='staged_file',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -1,6 +1,25 @@
-from django.core.validators import MinValueValidator
-from django.db import models
+from decimal import Decimal
+from functools import partial
+from typing import Dict, Iterable, List, Sequence
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    Func,
+    Max,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 from django.contrib import admin
 from uuid import uuid4
 from cloudinary.models import CloudinaryField
@@ -8,7 +27,32 @@ from cloudinary.models import CloudinaryField
 
 class Promotion(models.Model):
     description = models.CharField(max_length=255)
-    discount = models.FloatField()
+    # Percentage taken off the price, the largest one applies.
+    discount = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        validators=[MinValueValidator(0), MaxValueValidator(100)],
+    )
+
+
+class CollectionQuerySet(models.QuerySet):
+    def adjust_product_counts(self, deltas: Dict[int, int]):
+        # Fixed lock order so concurrent adjustments cannot deadlock.
+        for collection_id in sorted(deltas):
+            if deltas[collection_id]:
+                self.filter(pk=collection_id).update(
+                    product_count=F("product_count") + deltas[collection_id]
+                )
+
+    def recount_products(self) -> int:
+        products = (
+            Product.objects.filter(collection=OuterRef("pk"))
+            .order_by()
+            .values("collection")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return self.update(product_count=Coalesce(Subquery(products), 0))
 
 
 class Collection(models.Model):
@@ -16,14 +60,286 @@ class Collection(models.Model):
     featured_product = models.ForeignKey(
         "Product", on_delete=models.SET_NULL, null=True, related_name="+", blank=True
     )
+    # Maintained by ProductQuerySet and the product signal handlers.
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    # A fraction, settings.STORE_DEFAULT_TAX_RATE applies when empty.
+    tax_rate = models.DecimalField(
+        max_digits=5,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+    )
+
+    objects = CollectionQuerySet.as_manager()
+
+    # The tax rate stored in the database, so saves can tell prices changed.
+    _loaded_tax_rate = None
 
     def __str__(self) -> str:
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_tax_rate = instance.__dict__.get("tax_rate")
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_tax_rate = self.tax_rate
+
     class Meta:
         ordering = ["title"]
 
 
+def round_price(expression):
+    # Round() only takes a precision from Django 4.0 on.
+    return Func(
+        expression,
+        Value(2),
+        function="ROUND",
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+class UpsertQuerySet(models.QuerySet):
+    upsert_sql = {
+        "mysql": "INSERT INTO {table} ({columns}) VALUES {rows} "
+        "ON DUPLICATE KEY UPDATE {assignments}",
+        "postgresql": "INSERT INTO {table} ({columns}) VALUES {rows} "
+        "ON CONFLICT ({unique}) DO UPDATE SET {assignments}",
+    }
+    upsert_sql["sqlite"] = upsert_sql["postgresql"]
+    # Overwriting and incrementing assignments.
+    upsert_assignment = {
+        "mysql": (
+            "{column} = VALUES({column})",
+            "{column} = {table}.{column} + VALUES({column})",
+        ),
+        "postgresql": (
+            "{column} = EXCLUDED.{column}",
+            "{column} = {table}.{column} + EXCLUDED.{column}",
+        ),
+    }
+    upsert_assignment["sqlite"] = upsert_assignment["postgresql"]
+
+    def insert_or_update(
+        self,
+        rows: List[Dict],
+        unique: Sequence[str],
+        update: Sequence[str],
+        increment=False,
+    ):
+        """Insert ``rows``, or update the stored rows with the same ``unique`` fields.
+
+        Rows are dicts keyed by field attnames. The ``update`` fields of stored
+        rows are overwritten, or added to with ``increment=True``. Runs as one
+        ``INSERT ... ON CONFLICT`` statement per batch, so concurrent writers
+        neither lose updates nor trip the unique constraint.
+        """
+        if not rows:
+            return
+        connection = connections[self.db]
+        sql = self.upsert_sql.get(connection.vendor)
+        if sql is None:
+            return self._insert_or_update(rows, unique, update, increment)
+
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        fields = [opts.get_field(name) for name in rows[0]]
+        table = qn(opts.db_table)
+        assignment = self.upsert_assignment[connection.vendor][increment]
+        placeholders = f"({', '.join(['%s'] * len(fields))})"
+        sql = partial(
+            sql.format,
+            table=table,
+            columns=", ".join(qn(field.column) for field in fields),
+            unique=", ".join(qn(opts.get_field(name).column) for name in unique),
+            assignments=", ".join(
+                assignment.format(table=table, column=qn(opts.get_field(name).column))
+                for name in update
+            ),
+        )
+        batch_size = connection.ops.bulk_batch_size(fields, rows)
+        with transaction.atomic(using=self.db, savepoint=False):
+            with connection.cursor() as cursor:
+                for start in range(0, len(rows), batch_size):
+                    batch = rows[start : start + batch_size]
+                    cursor.execute(
+                        sql(rows=", ".join([placeholders] * len(batch))),
+                        [
+                            field.get_db_prep_save(row[field.attname], connection)
+                            for row in batch
+                            for field in fields
+                        ],
+                    )
+
+    def _insert_or_update(self, rows, unique, update, increment):
+        with transaction.atomic(using=self.db):
+            for row in rows:
+                lookup = {name: row[name] for name in unique}
+                changes = {
+                    name: F(name) + row[name] if increment else row[name]
+                    for name in update
+                }
+                if self.filter(**lookup).update(**changes):
+                    continue
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.create(**row)
+                except IntegrityError:
+                    # Lost the race to a concurrent insert, apply on top of it.
+                    self.filter(**lookup).update(**changes)
+
+
+class ProductQuerySet(UpsertQuerySet):
+    """Keeps ``Collection.product_count`` correct for bulk writes.
+
+    Single saves and deletes are counted by the product signal handlers.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            deltas = {}
+            for obj in objs:
+                deltas[obj.collection_id] = deltas.get(obj.collection_id, 0) + 1
+            Collection.objects.adjust_product_counts(deltas)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if not {"collection", "collection_id"} & set(fields):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            previous = self.filter(pk__in=[obj.pk for obj in objs])
+            collection_ids = self._collection_ids(previous)
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            collection_ids.update(obj.collection_id for obj in objs)
+            Collection.objects.filter(pk__in=collection_ids).recount_products()
+        return rows
+
+    # Maintained by the review signal handlers, upserts leave them alone.
+    counter_fields = ("review_count", "last_review_date")
+
+    def upsert(self, objs):
+        """Write whole rows by primary key, inserting the ones that are missing.
+
+        ``bulk_update`` spends most of its time building ``CASE`` expressions in
+        Python; this is one ``INSERT ... ON CONFLICT`` statement per batch.
+        """
+        objs = list(objs)
+        if not objs:
+            return
+        opts = self.model._meta
+        fields = [opts.pk] + [
+            field for field in opts.concrete_fields if not field.primary_key
+        ]
+        with transaction.atomic(using=self.db):
+            collection_ids = self._collection_ids(
+                self.filter(pk__in=[obj.pk for obj in objs])
+            )
+            self.insert_or_update(
+                [
+                    {field.attname: field.pre_save(obj, add=False) for field in fields}
+                    for obj in objs
+                ],
+                unique=[opts.pk.attname],
+                update=[
+                    field.attname
+                    for field in fields[1:]
+                    if field.name not in self.counter_fields
+                ],
+            )
+            collection_ids.update(obj.collection_id for obj in objs)
+            Collection.objects.filter(pk__in=collection_ids).recount_products()
+
+    def update(self, **kwargs):
+        if "collection" not in kwargs and "collection_id" not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            collection_ids = self._collection_ids(self)
+            rows = super().update(**kwargs)
+            collection = kwargs.get("collection_id", kwargs.get("collection"))
+            collection_ids.add(getattr(collection, "pk", collection))
+            Collection.objects.filter(pk__in=collection_ids).recount_products()
+        return rows
+
+    def with_prices(self):
+        """Annotate ``price_with_tax`` and ``effective_price`` computed by the database.
+
+        The tax rate comes from the product's collection, the effective price
+        also takes off the discount kept in ``ProductDiscount``. Both can be
+        filtered and sorted on.
+        """
+        discount = Coalesce(F("active_discount__discount"), Value(Decimal(0)))
+        # Multiplied rather than divided by 100: SQLite stores whole decimals
+        # as integers and would divide them as integers.
+        remaining = (Value(Decimal(100)) - discount) * Value(Decimal("0.01"))
+        tax = Value(Decimal(1)) + Coalesce(
+            F("collection__tax_rate"), Value(settings.STORE_DEFAULT_TAX_RATE)
+        )
+        return self.annotate(
+            price_with_tax=round_price(F("unit_price") * tax),
+            effective_price=round_price(F("unit_price") * remaining * tax),
+        )
+
+    def add_review(self, date):
+        return self.update(
+            review_count=F("review_count") + 1,
+            last_review_date=Greatest(
+                Coalesce(F("last_review_date"), Value(date)), Value(date)
+            ),
+        )
+
+    def recount_reviews(self) -> int:
+        reviews = (
+            Review.objects.filter(product=OuterRef("pk")).order_by().values("product")
+        )
+        return self.update(
+            review_count=Coalesce(
+                Subquery(reviews.annotate(count=Count("pk")).values("count")), 0
+            ),
+            last_review_date=Subquery(
+                reviews.annotate(latest=Max("date")).values("latest")
+            ),
+        )
+
+    def reserve_inventory(self, quantities: Dict[int, int]) -> bool:
+        """Take ``quantities`` out of stock, all or nothing.
+
+        The rows are locked in primary key order first, so concurrent checkouts
+        of overlapping carts queue up instead of deadlocking, then one
+        conditional ``UPDATE`` takes the stock out. Returns ``False`` when any
+        product is short; the caller must then roll back.
+        """
+        if not quantities:
+            return True
+        list(
+            self.select_for_update()
+            .filter(pk__in=quantities)
+            .order_by("pk")
+            .values_list("pk")
+        )
+        requested = Case(
+            *[
+                When(pk=product_id, then=Value(quantity))
+                for product_id, quantity in sorted(quantities.items())
+            ],
+            output_field=models.IntegerField(),
+        )
+        rows = self.filter(pk__in=quantities, inventory__gte=requested).update(
+            inventory=F("inventory") - requested
+        )
+        return rows == len(quantities)
+
+    def _collection_ids(self, queryset: Iterable) -> set:
+        return set(
+            queryset.order_by().values_list("collection_id", flat=True).distinct()
+        )
+
+
 class Product(models.Model):
     title = models.CharField(max_length=255)
     slug = models.SlugField()
@@ -38,21 +354,171 @@ class Product(models.Model):
     )
 
     promotions = models.ManyToManyField(Promotion, blank=True)
+    # Maintained by ProductQuerySet and the review signal handlers.
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    last_review_date = models.DateField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    # The collection stored in the database, so saves can tell a product moved.
+    _loaded_collection_id = None
 
     def __str__(self) -> str:
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_collection_id = instance.__dict__.get("collection_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Atomic so the post_save product count update commits with the row.
+        using = kwargs.get("using") or router.db_for_write(Product, instance=self)
+        with transaction.atomic(using=using):
+            update_fields = kwargs.get("update_fields")
+            if not self._state.adding and (
+                update_fields is None
+                or {"collection", "collection_id"} & set(update_fields)
+            ):
+                self.lock_stored_collection(using)
+            super().save(*args, **kwargs)
+        self._loaded_collection_id = self.collection_id
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Review counters loaded with the instance may be stale by now, saves
+        # only write them when asked to. A missing row is still inserted whole.
+        if update_fields is None:
+            values = [
+                value
+                for value in values
+                if value[0].name not in ProductQuerySet.counter_fields
+            ]
+        return super()._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update
+        )
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(Product, instance=self)
+        with transaction.atomic(using=using):
+            self.lock_stored_collection(using)
+            return super().delete(using, keep_parents)
+
+    def lock_stored_collection(self, using):
+        # Counted from the stored collection, the product may have moved since
+        # this instance was loaded.
+        stored = (
+            Product.objects.using(using)
+            .select_for_update()
+            .filter(pk=self.pk)
+            .values_list("collection_id", flat=True)
+            .first()
+        )
+        if stored is not None:
+            self._loaded_collection_id = stored
+
     class Meta:
         ordering = ["title"]
+        indexes = [
+            models.Index(fields=["title"]),
+            # Collection pages in the default order, and price range filters.
+            models.Index(fields=["collection", "title"]),
+            models.Index(fields=["collection", "unit_price"]),
+        ]
+
+
+class ProductDiscountQuerySet(models.QuerySet):
+    def refresh(self, product_ids: Iterable[int]) -> int:
+        """Recompute the discount of ``product_ids`` from their promotions.
+
+        Returns the number of discounted products among them.
+        """
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return 0
+        with transaction.atomic(using=self.db):
+            # Locking the products serializes concurrent refreshes of a product.
+            list(
+                Product.objects.select_for_update()
+                .filter(pk__in=product_ids)
+                .order_by("pk")
+                .values_list("pk")
+            )
+            best = {}
+            promotions = (
+                Product.promotions.through.objects.filter(product_id__in=product_ids)
+                .order_by("product_id", "-promotion__discount", "promotion_id")
+                .values_list("product_id", "promotion_id", "promotion__discount")
+            )
+            for product_id, promotion_id, discount in promotions:
+                if product_id not in best and discount > 0:
+                    best[product_id] = ProductDiscount(
+                        product_id=product_id,
+                        promotion_id=promotion_id,
+                        discount=min(discount, Decimal(100)),
+                    )
+            self.filter(product_id__in=product_ids).delete()
+            self.bulk_create(best.values())
+        return len(best)
+
+
+class ProductDiscount(models.Model):
+    """The discount of the best promotion of each discounted product.
+
+    Kept up to date by the promotion signal handlers, through the
+    ``refresh_discounts`` outbox topic for changes that span a promotion, so
+    catalog reads join one row per product instead of walking
+    ``Product.promotions``.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="active_discount",
+    )
+    promotion = models.ForeignKey(Promotion, on_delete=models.CASCADE, related_name="+")
+    discount = models.DecimalField(max_digits=5, decimal_places=2)
+
+    objects = ProductDiscountQuerySet.as_manager()
 
 
 class Image(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_READY = "ready"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSING, "Processing"),
+        (STATUS_READY, "Ready"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
     time_created = models.DateTimeField(auto_now_add=True)
     title = models.CharField("Title (optional)", max_length=200, blank=True)
 
-    ## Points to a Cloudinary image
-    image = CloudinaryField("image")
+    ## Points to a Cloudinary image, or a storage name with StorageBackend.
+    ## Empty until the upload is processed.
+    image = CloudinaryField("image", blank=True)
     product = models.OneToOneField(Product, on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_READY
+    )
+    # Name in IMAGE_STAGING_STORAGE while the upload waits for a worker.
+    staged_file = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Failed uploads are retried from then on.
+    available_at = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
 
     def __str__(self):
         """Informative name for model"""
@@ -96,6 +562,49 @@ class Customer(models.Model):
         ordering = ["user__first_name", "user__last_name"]
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate ``total_price`` and ``item_count`` computed by the database.
+
+        Correlated subqueries rather than a join and ``GROUP BY``, so they only
+        run for the rows of the requested page.
+        """
+        items = (
+            OrderItem.objects.filter(order=OuterRef("pk")).order_by().values("order")
+        )
+        total_price = items.annotate(
+            total=Sum(
+                F("unit_price") * F("quantity"),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+        ).values("total")
+        item_count = items.annotate(count=Sum("quantity")).values("count")
+        return self.annotate(
+            total_price=Coalesce(
+                Subquery(total_price),
+                Value(0),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+            item_count=Coalesce(Subquery(item_count), 0),
+        )
+
+    def with_items(self):
+        return self.prefetch_related(
+            Prefetch(
+                "items",
+                queryset=OrderItem.objects.select_related("product").only(
+                    "id",
+                    "order_id",
+                    "quantity",
+                    "unit_price",
+                    "product__id",
+                    "product__title",
+                    "product__unit_price",
+                ),
+            )
+        )
+
+
 class Order(models.Model):
     PAYMENT_STATUS_PENDING = "P"
     PAYMENT_STATUS_COMPLETE = "C"
@@ -112,8 +621,15 @@ class Order(models.Model):
     )
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         permissions = [("cancel_order", "Can cancel order")]
+        # A customer's orders and the staff list, both newest first.
+        indexes = [
+            models.Index(fields=["customer", "placed_at"]),
+            models.Index(fields=["placed_at"]),
+        ]
 
 
 class OrderItem(models.Model):
@@ -135,12 +651,32 @@ class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at"])]
+
+
+class CartItemQuerySet(UpsertQuerySet):
+    def upsert_quantities(self, cart_id, quantities: Dict[int, int], increment=True):
+        """Add (or with ``increment=False`` set) the quantity of each product."""
+        # Sorted rows lock index entries in a fixed order across requests.
+        self.insert_or_update(
+            [
+                {"cart_id": cart_id, "product_id": product_id, "quantity": quantity}
+                for product_id, quantity in sorted(quantities.items())
+            ],
+            unique=["cart_id", "product_id"],
+            update=["quantity"],
+            increment=increment,
+        )
+
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveSmallIntegerField(validators=[MinValueValidator(1)])
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = [["cart", "product"]]
 
@@ -152,3 +688,98 @@ class Review(models.Model):
         Product, on_delete=models.CASCADE, related_name="reviews"
     )
     date = models.DateField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["product", "date"])]
+
+
+class OutboxEvent(models.Model):
+    """An event written in the same transaction as the change it describes.
+
+    ``manage.py drain_outbox`` delivers pending events to the handlers in
+    ``store.outbox`` after the transaction has committed.
+    """
+
+    topic = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["processed_at", "available_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.topic} #{self.pk}"
+
+
+class RollupQuerySet(UpsertQuerySet):
+    def increment(self, rows: Iterable[Dict]):
+        """Add the measures of each row to the stored row with the same keys.
+
+        Rows are dicts of ``Meta.unique_together`` fields and the model's
+        ``measures``; missing rows are created, and concurrent writers never
+        lose an increment.
+        """
+        opts = self.model._meta
+        keys = [opts.get_field(name).attname for name in opts.unique_together[0]]
+        rows = [
+            {opts.get_field(name).attname: value for name, value in row.items()}
+            for row in rows
+        ]
+        # Sorted rows lock index entries in a fixed order across writers.
+        rows.sort(key=lambda row: [str(row[key]) for key in keys])
+        self.insert_or_update(
+            rows, unique=keys, update=self.model.measures, increment=True
+        )
+
+
+class DailyProductSales(models.Model):
+    """Units and revenue ordered per product and day, whatever the payment."""
+
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    measures = ("units", "revenue")
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [["date", "product"]]
+
+
+class DailyCollectionSales(models.Model):
+    """Units and revenue ordered per collection and day, whatever the payment."""
+
+    date = models.DateField()
+    collection = models.ForeignKey(
+        Collection, on_delete=models.CASCADE, related_name="+"
+    )
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    measures = ("units", "revenue")
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [["date", "collection"]]
+
+
+class DailyOrderStatus(models.Model):
+    """Orders and their value per day placed and current payment status."""
+
+    date = models.DateField()
+    payment_status = models.CharField(
+        max_length=1, choices=Order.PAYMENT_STATUS_CHOICES
+    )
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    measures = ("orders", "revenue")
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [["date", "payment_status"]]
@@ -0,0 +1,133 @@
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import analytics, cache
+from .models import Order, OutboxEvent, Product, ProductDiscount
+from .signals import order_created
+
+ORDER_CREATED = "order_created"
+ROLLUP_SALES = "rollup_sales"
+REFRESH_DISCOUNTS = "refresh_discounts"
+
+# Products refreshed by one refresh_discounts event, the rest is queued again.
+DISCOUNT_BATCH_SIZE = 500
+
+handlers: Dict[str, Callable[[dict], None]] = {}
+
+
+def handler(topic: str):
+    """Register the function that delivers events published on ``topic``."""
+
+    def register(func):
+        handlers[topic] = func
+        return func
+
+    return register
+
+
+def publish(topic: str, payload: dict) -> OutboxEvent:
+    """Queue an event; call it inside the transaction making the change."""
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def is_pending(topic: str, **payload) -> bool:
+    """Whether an event on ``topic`` with these payload values is undelivered."""
+    return OutboxEvent.objects.filter(
+        processed_at__isnull=True,
+        topic=topic,
+        **{f"payload__{key}": value for key, value in payload.items()},
+    ).exists()
+
+
+def pending(max_attempts: int):
+    return OutboxEvent.objects.filter(
+        processed_at__isnull=True,
+        available_at__lte=timezone.now(),
+        attempts__lt=max_attempts,
+    )
+
+
+def drain(batch_size=100, max_attempts=10, backoff=5.0):
+    """Deliver one batch of due events, returns ``(delivered, failed)``.
+
+    Each batch is claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several
+    workers can drain in parallel, and an event is marked processed in the same
+    transaction as its handler ran. Delivery is therefore at least once: a
+    handler that talks to other systems has to be idempotent. Failed events are
+    retried after ``backoff * 2 ** attempts`` seconds.
+    """
+    delivered = failed = 0
+    with transaction.atomic():
+        events = list(
+            pending(max_attempts)
+            .select_for_update(skip_locked=True)
+            .order_by("available_at", "id")[:batch_size]
+        )
+        for event in events:
+            try:
+                with transaction.atomic():
+                    deliver = handlers.get(event.topic)
+                    if deliver is None:
+                        raise LookupError(f"No handler for topic {event.topic!r}")
+                    deliver(event.payload)
+            except Exception:
+                event.attempts += 1
+                event.last_error = traceback.format_exc()
+                event.available_at = timezone.now() + timedelta(
+                    seconds=backoff * 2**event.attempts
+                )
+                failed += 1
+            else:
+                event.attempts += 1
+                event.processed_at = timezone.now()
+                delivered += 1
+        OutboxEvent.objects.bulk_update(
+            events, ["attempts", "last_error", "available_at", "processed_at"]
+        )
+    return delivered, failed
+
+
+@handler(ORDER_CREATED)
+def send_order_created(payload: dict):
+    order = Order.objects.get(pk=payload["order_id"])
+    for receiver, response in order_created.send_robust(OutboxEvent, order=order):
+        if isinstance(response, Exception):
+            raise response
+
+
+@handler(ROLLUP_SALES)
+def rollup_sales(payload: dict):
+    # Runs in the transaction marking the event processed, so exactly once.
+    analytics.record_order_sales(payload["order_id"])
+    analytics.record_placed_order(payload["order_id"])
+
+
+@handler(REFRESH_DISCOUNTS)
+def refresh_discounts(payload: dict):
+    """Refresh ``ProductDiscount`` for the products of a promotion, or a list.
+
+    A batch is refreshed per event and the remaining products are published
+    as a new event, so large promotions never lock all their products at once.
+    """
+    size = DISCOUNT_BATCH_SIZE
+    if "promotion_id" in payload:
+        product_ids = list(
+            Product.promotions.through.objects.filter(
+                promotion_id=payload["promotion_id"],
+                product_id__gt=payload.get("after", 0),
+            )
+            .order_by("product_id")
+            .values_list("product_id", flat=True)[: size + 1]
+        )
+        if len(product_ids) > size:
+            publish(REFRESH_DISCOUNTS, {**payload, "after": product_ids[size - 1]})
+    else:
+        product_ids = sorted(payload["product_ids"])
+        if len(product_ids) > size:
+            publish(REFRESH_DISCOUNTS, {"product_ids": product_ids[size:]})
+    ProductDiscount.objects.refresh(product_ids[:size])
+    cache.bump(cache.CATALOG)
@@ -1,5 +1,222 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import datetime
+import json
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder truncates to milliseconds, cursors need exact values.
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
 
 
 class DefaultProductPagination(PageNumberPagination):
     page_size = 10
+
+
+class KeysetPagination(BasePagination):
+    """Seek pagination over the queryset ordering, tie-broken on the primary key.
+
+    Each page is fetched with ``WHERE (ordering) > (last row) LIMIT n`` so deep
+    pages cost the same as the first one. The total is only computed when the
+    client asks for it with ``?count=exact`` or ``?count=estimate``. Estimates
+    come with ``count_capped``, true when there are more rows than ``count``.
+    """
+
+    page_size = 10
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    # Used when neither the request nor the model define an ordering.
+    default_ordering = ("pk",)
+    # Filtered estimates count at most this many rows.
+    estimate_limit = 1000
+    table_estimate_sql = {
+        "mysql": "SELECT table_rows FROM information_schema.tables "
+        "WHERE table_schema = DATABASE() AND table_name = %s",
+        "postgresql": "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.count = self.get_count(queryset, request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.seek(queryset, position))
+
+        rows = list(queryset[: self.page_size + 1])
+        self.next_position = None
+        if len(rows) > self.page_size:
+            rows = rows[: self.page_size]
+            self.next_position = self.position(queryset, rows[-1])
+        return rows
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([("next", self.get_next_link())])
+        if self.count is not None:
+            response["count"] = self.count
+        if self.count_capped is not None:
+            response["count_capped"] = self.count_capped
+        response["results"] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "count": {"type": "integer"},
+                "count_capped": {"type": "boolean"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = list(
+            queryset.query.order_by
+            or queryset.model._meta.ordering
+            or self.default_ordering
+        )
+        pk_name = queryset.model._meta.pk.name
+        if not any(term.lstrip("-") in ("pk", pk_name) for term in ordering):
+            ordering.append("-pk" if ordering[0].startswith("-") else "pk")
+        return ordering
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        cursor = base64.urlsafe_b64encode(
+            json.dumps(self.next_position, cls=CursorEncoder).encode()
+        ).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound("Invalid cursor")
+        return position
+
+    def get_field(self, queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        if name == "pk":
+            return queryset.model._meta.pk
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise ValueError(f"Cannot paginate by {name!r} with a keyset cursor.")
+
+    def position(self, queryset, row):
+        position = []
+        for term in self.ordering:
+            name = term.lstrip("-")
+            if isinstance(row, dict):
+                if name not in row:
+                    name = self.get_field(queryset, name).attname
+                value = row[name]
+            else:
+                value = getattr(row, name)
+            position.append(value)
+        return position
+
+    def seek(self, queryset, position):
+        """Expand the row comparison ``(a, b, pk) > (x, y, z)`` into ``Q`` objects."""
+        condition = Q()
+        equal = {}
+        for term, value in zip(self.ordering, position):
+            name = term.lstrip("-")
+            value = self.clean_position(self.get_field(queryset, name), value)
+            lookup = "lt" if term.startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def clean_position(self, field, value):
+        # Cursors come from clients, anything that is not a valid key is a 404.
+        try:
+            value = field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound("Invalid cursor")
+        if (
+            value is None
+            or isinstance(value, int)
+            and not -(2**63) <= value < 2**63
+            or isinstance(value, Decimal)
+            and not value.is_finite()
+        ):
+            raise NotFound("Invalid cursor")
+        return value
+
+    def get_count(self, queryset, request):
+        self.count_capped = None
+        mode = request.query_params.get(self.count_query_param)
+        if mode == "exact":
+            return queryset.count()
+        if mode == "estimate":
+            return self.estimate_count(queryset)
+        return None
+
+    def estimate_count(self, queryset):
+        """Table statistics for unfiltered querysets, a capped count otherwise."""
+        self.count_capped = False
+        if not queryset.query.where:
+            estimate = self.table_estimate(queryset)
+            if estimate is not None:
+                return estimate
+        count = queryset.order_by()[: self.estimate_limit + 1].count()
+        if count > self.estimate_limit:
+            self.count_capped = True
+            return self.estimate_limit
+        return count
+
+    def table_estimate(self, queryset):
+        connection = connections[queryset.db]
+        sql = self.table_estimate_sql.get(connection.vendor)
+        if sql is None:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] is None or row[0] < 0:
+            return None
+        return int(row[0])
+
+
+class OrderPagination(KeysetPagination):
+    default_ordering = ("-placed_at",)
+
+
+class ReviewPagination(KeysetPagination):
+    default_ordering = ("-date",)
@@ -0,0 +1,113 @@
+import io
+from decimal import Decimal
+
+import orjson
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .metrics import TimedJSONRenderer
+
+
+class InexactValue(TypeError):
+    pass
+
+
+def exact_float(value: float) -> bool:
+    """Whether orjson writes ``value`` exactly like ``json.dumps``.
+
+    The stdlib switches to exponents (1e-05, 1e+16) where orjson does not or
+    writes them differently, and refuses NaN and infinities.
+    """
+    return value == 0 or 1e-4 <= abs(value) < 1e16
+
+
+def exact_floats(data) -> bool:
+    """Whether every float nested in the dicts and lists of ``data`` is exact."""
+    stack = [[data]]
+    while stack:
+        value = stack.pop()
+        for item in value.values() if isinstance(value, dict) else value:
+            kind = type(item)
+            # Checked first, they make up most of the values.
+            if kind is str or kind is int or item is None:
+                continue
+            if kind is float:
+                if not exact_float(item):
+                    return False
+            elif isinstance(item, (dict, list, tuple)):
+                stack.append(item)
+    return True
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Writes the same bytes as ``JSONRenderer``, with orjson.
+
+    Values orjson does not serialize itself (decimals, datetimes, lazy strings)
+    go through DRF's encoder. Output orjson cannot reproduce exactly is left
+    to ``JSONRenderer``: indented output, non-string keys, integers beyond 64
+    bits, and floats outside ``1e-4 <= abs(x) < 1e16``, NaN and infinities,
+    whether they come from decimals or are in the data already.
+    """
+
+    options = orjson.OPT_PASSTHROUGH_DATETIME
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None
+            or self.ensure_ascii
+            or not (self.compact and self.strict)
+            or self.encoder_class is not JSONEncoder
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            or not exact_floats(data)
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like JSONRenderer does, to stay a strict javascript subset.
+        if b"\xe2\x80" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028")
+            ret = ret.replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+    def default(self, obj):
+        # Prices are by far the most common, skip the encoder's type checks.
+        value = float(obj) if type(obj) is Decimal else self.encoder.default(obj)
+        if isinstance(value, float) and not exact_float(value):
+            raise InexactValue(value)
+        return value
+
+
+class TimedORJSONRenderer(TimedJSONRenderer, ORJSONRenderer):
+    pass
+
+
+# orjson reads integers beyond 64 bits as floats. Digits are mapped to zeros
+# to look for runs of 19 of them, much faster than a regular expression.
+DIGITS_TO_ZEROS = bytes.maketrans(b"123456789", b"000000000")
+LONG_NUMBER = b"0" * 19
+
+
+class ORJSONParser(JSONParser):
+    """Parses UTF-8 JSON with orjson, falling back to ``JSONParser``.
+
+    Invalid documents are parsed again by ``JSONParser`` for its error message,
+    and so are documents with numbers of 19 digits or more, which orjson might
+    read as floats where ``JSONParser`` reads integers.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        if not self.strict or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if LONG_NUMBER not in body.translate(DIGITS_TO_ZEROS):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -1,8 +1,11 @@
-from typing import Dict
+from typing import Dict, List
 from decimal import Decimal
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
 from rest_framework import serializers
-from .signals import order_created
+from rest_framework.exceptions import NotFound
+from . import analytics, cache, images, outbox
 from .models import (
     Cart,
     CartItem,
@@ -19,19 +22,67 @@ from .models import (
 class CollectionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Collection
-        fields = ("id", "title", "product_count")
+        fields = ("id", "title", "product_count", "tax_rate")
 
     product_count = serializers.IntegerField(read_only=True)
 
 
+class StoredImageField(serializers.Field):
+    """The URL of an ``Image.image``, through the configured storage backend."""
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        url = images.image_url(value)
+        if not url:
+            return None
+        request = self.context.get("request")
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
 class ImageSerializer(serializers.ModelSerializer):
-    image = serializers.ImageField()
+    image = StoredImageField()
 
     class Meta:
         model = Image
         fields = ("title", "image", "product")
 
 
+class ImageUploadSerializer(serializers.ModelSerializer):
+    image = serializers.FileField(write_only=True)
+
+    def validate_image(self, upload):
+        if upload.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(
+                f"Images are limited to {settings.IMAGE_MAX_UPLOAD_SIZE} bytes."
+            )
+        return upload
+
+    def create(self, validated_data):
+        upload = validated_data.pop("image")
+        return Image.objects.create(
+            status=Image.STATUS_PENDING,
+            staged_file=images.stage(upload),
+            **validated_data,
+        )
+
+    class Meta:
+        model = Image
+        fields = ("id", "title", "image", "product", "status")
+        read_only_fields = ("status",)
+
+
+class StaffImageStatusSerializer(ImageUploadSerializer):
+    # Processing errors can name internal paths and exceptions.
+    class Meta(ImageUploadSerializer.Meta):
+        fields = ImageUploadSerializer.Meta.fields + ("error",)
+        read_only_fields = ("status", "error")
+
+
 class ProductSerialzer(serializers.ModelSerializer):
     image = ImageSerializer()
 
@@ -45,14 +96,80 @@ class ProductSerialzer(serializers.ModelSerializer):
             "inventory",
             "unit_price",
             "price_with_tax",
+            "effective_price",
             "collection",
             "image",
+            "review_count",
+            "last_review_date",
         )
 
-    price_with_tax = serializers.SerializerMethodField("calculate_tax")
-
-    def calculate_tax(self, product: Product) -> Decimal:
-        return product.unit_price * Decimal(1.1)
+    # Annotated by ProductQuerySet.with_prices().
+    price_with_tax = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
+    effective_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, read_only=True
+    )
+
+
+class ProductValuesSerializer(serializers.BaseSerializer):
+    """Read-only fast path rendering ``Product.objects.with_prices().values()`` rows.
+
+    Produces the same representation as ``ProductSerialzer`` without
+    instantiating models or walking the ``ModelSerializer`` field machinery.
+    """
+
+    values = (
+        "id",
+        "title",
+        "description",
+        "slug",
+        "inventory",
+        "unit_price",
+        "collection_id",
+        "review_count",
+        "last_review_date",
+        # Not rendered, selected so keyset pagination can read the ordering.
+        "last_update",
+        "image__id",
+        "image__title",
+        "image__image",
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.unit_price_field = serializers.DecimalField(max_digits=6, decimal_places=2)
+        self.price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+        self.date_field = serializers.DateField()
+        self.image_field = StoredImageField()
+        self.image_field.bind("image", self)
+
+    def to_representation(self, row: Dict) -> Dict:
+        image = None
+        if row["image__id"] is not None:
+            image = {
+                "title": row["image__title"],
+                "image": self.image_field.to_representation(row["image__image"]),
+                "product": row["id"],
+            }
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "description": row["description"],
+            "slug": row["slug"],
+            "inventory": row["inventory"],
+            "unit_price": self.unit_price_field.to_representation(row["unit_price"]),
+            "price_with_tax": self.price_field.to_representation(row["price_with_tax"]),
+            "effective_price": self.price_field.to_representation(
+                row["effective_price"]
+            ),
+            "collection": row["collection_id"],
+            "image": image,
+            "review_count": row["review_count"],
+            "last_review_date": self.date_field.to_representation(
+                row["last_review_date"]
+            ),
+        }
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -96,27 +213,64 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ("id", "items", "total_price")
 
 
+# The largest quantity a PositiveSmallIntegerField holds on every backend.
+MAX_CART_QUANTITY = 32767
+
+
+def lock_cart(cart_id):
+    """Lock the cart for the current transaction, 404 when it does not exist.
+
+    Adds to a cart wait for its checkout (which deletes it) and for each other,
+    so they can neither land in a deleted cart nor push an item past
+    ``MAX_CART_QUANTITY`` together.
+    """
+    try:
+        exists = Cart.objects.select_for_update().filter(pk=cart_id).exists()
+    except DjangoValidationError:
+        exists = False
+    if not exists:
+        raise NotFound("No cart with the given ID was found.")
+
+
+def quantity_errors(cart_id, quantities: Dict[int, int], increment=True):
+    """Errors for the products that would end up over ``MAX_CART_QUANTITY``."""
+    in_cart: Dict[int, int] = {}
+    if increment:
+        in_cart = dict(
+            CartItem.objects.filter(
+                cart_id=cart_id, product_id__in=quantities
+            ).values_list("product_id", "quantity")
+        )
+    errors: Dict[str, List[str]] = {}
+    for product_id, quantity in quantities.items():
+        if in_cart.get(product_id, 0) + quantity > MAX_CART_QUANTITY:
+            errors[str(product_id)] = [
+                f"At most {MAX_CART_QUANTITY} of a product fit in a cart, "
+                f"{in_cart.get(product_id, 0)} already in it."
+            ]
+    return errors
+
+
 class AddCartItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_CART_QUANTITY)
 
     def validate_product_id(self, value: int):
-        if not Product.objects.filter(pk=value):
+        if not Product.objects.filter(pk=value).exists():
             raise serializers.ValidationError("No product with the given ID exists")
         return value
 
     def save(self, **kwargs):
-        quantity = self.validated_data.get("quantity")
-        product_id = self.validated_data.get("product_id")
         cart_id = self.context.get("cart_id")
-        try:
-            cart_item = CartItem.objects.get(cart_id=cart_id, product_id=product_id)
-            cart_item.quantity += quantity
-            cart_item.save()
-            self.instance = cart_item
-        except CartItem.DoesNotExist:
-            self.instance = CartItem.objects.create(
-                cart_id=cart_id, **self.validated_data
-            )
+        product_id = self.validated_data["product_id"]
+        quantities = {product_id: self.validated_data["quantity"]}
+        with transaction.atomic():
+            lock_cart(cart_id)
+            errors = quantity_errors(cart_id, quantities)
+            if errors:
+                raise serializers.ValidationError({"quantity": errors[str(product_id)]})
+            CartItem.objects.upsert_quantities(cart_id, quantities)
+        self.instance = CartItem.objects.get(cart_id=cart_id, product_id=product_id)
         return self.instance
 
     class Meta:
@@ -124,6 +278,50 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         fields = ("id", "product_id", "quantity")
 
 
+class CartItemQuantitySerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_CART_QUANTITY)
+
+
+class BatchCartItemSerializer(serializers.Serializer):
+    items = CartItemQuantitySerializer(many=True, allow_empty=False)
+    replace = serializers.BooleanField(
+        default=False, help_text="Set the quantities instead of adding to them."
+    )
+
+    def validate_items(self, items):
+        quantities: Dict[int, int] = {}
+        for item in items:
+            product_id = item["product_id"]
+            quantities[product_id] = quantities.get(product_id, 0) + item["quantity"]
+        found = set(
+            Product.objects.filter(pk__in=quantities).values_list("pk", flat=True)
+        )
+        missing = sorted(set(quantities) - found)
+        if missing:
+            raise serializers.ValidationError(
+                f"No products with the given IDs exist: {missing}"
+            )
+        return quantities
+
+    def save(self, **kwargs):
+        cart_id = self.context.get("cart_id")
+        quantities = self.validated_data["items"]
+        increment = not self.validated_data["replace"]
+        with transaction.atomic():
+            lock_cart(cart_id)
+            errors = quantity_errors(cart_id, quantities, increment)
+            if errors:
+                raise serializers.ValidationError({"items": errors})
+            CartItem.objects.upsert_quantities(cart_id, quantities, increment)
+        self.instance = list(
+            CartItem.objects.filter(cart_id=cart_id, product_id__in=quantities)
+            .select_related("product")
+            .order_by("id")
+        )
+        return self.instance
+
+
 class UpdateCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
@@ -148,10 +346,22 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
+    total_price = serializers.DecimalField(
+        max_digits=12, decimal_places=2, read_only=True
+    )
+    item_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Order
-        fields = ("id", "customer", "placed_at", "payment_status", "items")
+        fields = (
+            "id",
+            "customer",
+            "placed_at",
+            "payment_status",
+            "items",
+            "total_price",
+            "item_count",
+        )
 
 
 class UpdateOrderSerializer(serializers.ModelSerializer):
@@ -159,38 +369,102 @@ class UpdateOrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ("payment_status",)
 
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            # Locked so concurrent updates move the order between statuses once.
+            previous_status = (
+                Order.objects.select_for_update()
+                .values_list("payment_status", flat=True)
+                .get(pk=instance.pk)
+            )
+            order = super().update(instance, validated_data)
+            # A pending rollup_sales event will count the order at its new status.
+            if not outbox.is_pending(outbox.ROLLUP_SALES, order_id=order.pk):
+                analytics.record_status_change(order, previous_status)
+        return order
+
+
+class OutOfStock(Exception):
+    pass
+
 
 class CreateOrderSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()
 
-    def validate_cart_id(self, cart_id):
-        if not Cart.objects.filter(pk=cart_id).exists():
-            raise serializers.ValidationError("No cart with the given ID was found.")
-        if CartItem.objects.filter(cart_id=cart_id).count() == 0:
-            raise serializers.ValidationError("The cart is empty.")
-        return cart_id
-
     def save(self, **kwargs):
+        cart_id = self.validated_data.get("cart_id")
+        try:
+            return self.checkout(cart_id)
+        except OutOfStock as exc:
+            # Stock can be restocked between the rollback and this read.
+            errors = self.shortages(exc.args[0]) or ["Stock changed, please retry."]
+            raise serializers.ValidationError({"items": errors})
+
+    def checkout(self, cart_id):
+        """Turn the cart into an order in a fixed number of queries."""
         with transaction.atomic():
-            cart_id = self.validated_data.get("cart_id")
-
-            customer = Customer.objects.get(user_id=self.context.get("user_id"))
-            order = Order.objects.create(customer=customer)
-
-            cart_items = CartItem.objects.select_related("product").filter(
-                cart_id=cart_id
+            # Locking the cart serializes concurrent checkouts of the same cart.
+            if not Cart.objects.select_for_update().filter(pk=cart_id).exists():
+                raise serializers.ValidationError(
+                    {"cart_id": ["No cart with the given ID was found."]}
+                )
+            items = list(
+                CartItem.objects.filter(cart_id=cart_id)
+                .order_by("product_id")
+                .values_list(
+                    "product_id",
+                    "quantity",
+                    "product__unit_price",
+                    "product__collection_id",
+                )
             )
-            order_items = [
-                OrderItem(
-                    order=order,
-                    product=item.product,
-                    unit_price=item.product.unit_price,
-                    quantity=item.quantity,
+            if not items:
+                raise serializers.ValidationError({"cart_id": ["The cart is empty."]})
+
+            quantities = {product_id: quantity for product_id, quantity, *_ in items}
+            if not Product.objects.reserve_inventory(quantities):
+                raise OutOfStock(quantities)
+            # The update sends no signals, cached pages still show the old stock.
+            scopes = {cache.PRODUCTS}
+            for product_id, _, _, collection_id in items:
+                scopes.add(cache.product_scope(product_id))
+                scopes.add(cache.collection_scope(collection_id))
+            cache.bump(*sorted(scopes))
+
+            customer_id = self.context.get("customer_id")
+            if customer_id is None:
+                customer_id = (
+                    Customer.objects.only("id")
+                    .get(user_id=self.context.get("user_id"))
+                    .id
                 )
-                for item in cart_items
-            ]
-            OrderItem.objects.bulk_create(order_items)
+            order = Order.objects.create(customer_id=customer_id)
+            OrderItem.objects.bulk_create(
+                [
+                    OrderItem(
+                        order=order,
+                        product_id=product_id,
+                        unit_price=unit_price,
+                        quantity=quantity,
+                    )
+                    for product_id, quantity, unit_price, _ in items
+                ]
+            )
 
             Cart.objects.filter(pk=cart_id).delete()
-            order_created.send_robust(self.__class__, order=order)
+            outbox.publish(outbox.ORDER_CREATED, {"order_id": order.id})
+            outbox.publish(outbox.ROLLUP_SALES, {"order_id": order.id})
             return order
+
+    def shortages(self, quantities: Dict[int, int]):
+        available = dict(
+            Product.objects.filter(pk__in=quantities).values_list("pk", "inventory")
+        )
+        return {
+            str(product_id): [
+                f"Only {max(available.get(product_id, 0), 0)} left in stock, "
+                f"{quantity} requested."
+            ]
+            for product_id, quantity in quantities.items()
+            if available.get(product_id, 0) < quantity
+        }
@@ -1,10 +1,182 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.conf import settings
-from ..models import Customer
+from django.contrib.contenttypes.models import ContentType
+from tags.models import TaggedItem
+from .. import cache, outbox
+from ..models import (
+    Collection,
+    Customer,
+    Image,
+    Product,
+    ProductDiscount,
+    Promotion,
+    Review,
+)
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_for_new_user(sender, **kwargs):
     if kwargs["created"]:
         Customer.objects.create(user=kwargs["instance"])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    scopes = [
+        cache.PRODUCTS,
+        cache.product_scope(instance.pk),
+        cache.collection_scope(instance.collection_id),
+    ]
+    moved_from = instance._loaded_collection_id
+    if kwargs["signal"] is post_delete or kwargs["created"]:
+        scopes.append(cache.COLLECTIONS)
+    elif moved_from != instance.collection_id:
+        scopes += [cache.COLLECTIONS, cache.collection_scope(moved_from)]
+    cache.bump(*scopes)
+
+
+@receiver(post_save, sender=Product)
+def count_saved_product(sender, instance, created, **kwargs):
+    moved_from = instance._loaded_collection_id
+    if created:
+        Collection.objects.adjust_product_counts({instance.collection_id: 1})
+    elif moved_from is not None and moved_from != instance.collection_id:
+        Collection.objects.adjust_product_counts(
+            {moved_from: -1, instance.collection_id: 1}
+        )
+
+
+@receiver(post_delete, sender=Product)
+def count_deleted_product(sender, instance, **kwargs):
+    collection_id = instance._loaded_collection_id or instance.collection_id
+    Collection.objects.adjust_product_counts({collection_id: -1})
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_collection(sender, instance, **kwargs):
+    scopes = [cache.COLLECTIONS, cache.collection_scope(instance.pk)]
+    if instance._loaded_tax_rate != instance.tax_rate:
+        # Every product of the collection changed price.
+        scopes.append(cache.CATALOG)
+    cache.bump(*scopes)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def invalidate_product_image(sender, instance, **kwargs):
+    collection_id = (
+        Product.objects.filter(pk=instance.product_id)
+        .values_list("collection_id", flat=True)
+        .first()
+    )
+    cache.bump(
+        cache.PRODUCTS,
+        cache.product_scope(instance.product_id),
+        cache.collection_scope(collection_id),
+    )
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviews(sender, instance, **kwargs):
+    # The product and the lists it is in show its review count and latest
+    # review date, other products and collections stay cached.
+    collection_id = (
+        Product.objects.filter(pk=instance.product_id)
+        .values_list("collection_id", flat=True)
+        .first()
+    )
+    cache.bump(
+        cache.PRODUCTS,
+        cache.reviews_scope(instance.product_id),
+        cache.product_scope(instance.product_id),
+        cache.collection_scope(collection_id),
+    )
+
+
+@receiver(post_save, sender=Review)
+def count_saved_review(sender, instance, created, **kwargs):
+    if created:
+        Product.objects.filter(pk=instance.product_id).add_review(instance.date)
+
+
+@receiver(post_delete, sender=Review)
+def count_deleted_review(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).recount_reviews()
+
+
+# Promotions can cover many products, their discounts are refreshed by the
+# outbox worker, which also invalidates the catalog.
+
+
+def discounted_product_ids(promotion):
+    # Products it is not the best promotion of keep their discount.
+    return list(
+        ProductDiscount.objects.filter(promotion=promotion).values_list(
+            "product_id", flat=True
+        )
+    )
+
+
+@receiver(post_save, sender=Promotion)
+def refresh_promotion_discounts(sender, instance, created, **kwargs):
+    if not created:
+        outbox.publish(outbox.REFRESH_DISCOUNTS, {"promotion_id": instance.pk})
+
+
+@receiver(pre_delete, sender=Promotion)
+def collect_discounted_products(sender, instance, **kwargs):
+    # Their discounts are deleted along with the promotion.
+    instance._discounted_product_ids = discounted_product_ids(instance)
+
+
+@receiver(post_delete, sender=Promotion)
+def refresh_deleted_promotion_discounts(sender, instance, **kwargs):
+    cache.bump(cache.CATALOG)
+    if instance._discounted_product_ids:
+        outbox.publish(
+            outbox.REFRESH_DISCOUNTS, {"product_ids": instance._discounted_product_ids}
+        )
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def refresh_product_discounts(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # A single product, refreshed right away.
+        if action.startswith("post_"):
+            ProductDiscount.objects.refresh([instance.pk])
+    elif action == "pre_clear":
+        instance._discounted_product_ids = discounted_product_ids(instance)
+    elif action == "post_clear":
+        product_ids = instance._discounted_product_ids
+        if product_ids:
+            outbox.publish(outbox.REFRESH_DISCOUNTS, {"product_ids": product_ids})
+    elif action.startswith("post_") and pk_set:
+        outbox.publish(outbox.REFRESH_DISCOUNTS, {"product_ids": sorted(pk_set)})
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def invalidate_product_promotions(sender, instance, action, reverse, **kwargs):
+    if action.startswith("post_") and not reverse:
+        cache.bump(
+            cache.PRODUCTS,
+            cache.product_scope(instance.pk),
+            cache.collection_scope(instance.collection_id),
+        )
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def invalidate_product_tags(sender, instance, **kwargs):
+    # Tags only show up in ?tag= filtered product lists.
+    if instance.content_type_id != ContentType.objects.get_for_model(Product).id:
+        return
+    collection_id = (
+        Product.objects.filter(pk=instance.object_id)
+        .values_list("collection_id", flat=True)
+        .first()
+    )
+    cache.bump(cache.PRODUCTS, cache.collection_scope(collection_id))
@@ -1,3 +1,1834 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import functools
+import io
+import json
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache as django_cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image as PILImage
+from rest_framework import mixins, serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from tags.models import Tag, TaggedItem
+
+from . import cache, export, images, metrics, outbox
+from .management.commands.import_catalog import RowError, parse_row
+from .models import (
+    Cart,
+    CartItem,
+    Collection,
+    Customer,
+    DailyOrderStatus,
+    DailyProductSales,
+    Image,
+    Order,
+    OrderItem,
+    OutboxEvent,
+    Product,
+    ProductDiscount,
+    Promotion,
+    Review,
+    UpsertQuerySet,
+)
+from .filters import ProductSearchFilter
+from .pagination import KeysetPagination
+from .renderers import ORJSONParser, ORJSONRenderer
+from .serializers import (
+    MAX_CART_QUANTITY,
+    CreateOrderSerializer,
+    UpdateOrderSerializer,
+)
+
+
+def create_collection(title="Collection", **kwargs):
+    return Collection.objects.create(title=title, **kwargs)
+
+
+def create_product(collection, title="Product", unit_price="10.00", **kwargs):
+    kwargs.setdefault("inventory", 10)
+    return Product.objects.create(
+        title=title,
+        slug=title.lower().replace(" ", "-"),
+        unit_price=Decimal(unit_price),
+        collection=collection,
+        **kwargs,
+    )
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def png_upload(name="photo.png"):
+    content = io.BytesIO()
+    PILImage.new("RGB", (4, 4), "red").save(content, format="PNG")
+    return SimpleUploadedFile(name, content.getvalue(), content_type="image/png")
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = create_collection()
+        # Three products per title and per price, so pages end inside ties.
+        cls.products = [
+            create_product(
+                collection, title=f"Product {i // 3}", unit_price=f"{10 + i // 3}.00"
+            )
+            for i in range(25)
+        ]
+        for i in range(12):
+            Review.objects.create(
+                product=cls.products[0], name=f"Reviewer {i}", body="Fine."
+            )
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+        return ids
+
+    def test_pages_follow_the_ordering_across_ties(self):
+        ids = self.walk("/store/products/?cursor=&page_size=4")
+        expected = list(
+            Product.objects.order_by("title", "pk").values_list("pk", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_descending_ordering(self):
+        ids = self.walk("/store/products/?cursor=&page_size=4&ordering=-unit_price")
+        expected = list(
+            Product.objects.order_by("-unit_price", "-pk").values_list("pk", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_annotated_ordering(self):
+        ids = self.walk("/store/products/?cursor=&page_size=7&ordering=effective_price")
+        expected = list(
+            Product.objects.with_prices()
+            .order_by("effective_price", "pk")
+            .values_list("pk", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_reviews_with_equal_dates(self):
+        product_id = self.products[0].pk
+        ids = self.walk(f"/store/products/{product_id}/reviews/?page_size=5")
+        expected = list(
+            Review.objects.filter(product_id=product_id)
+            .order_by("-date", "-pk")
+            .values_list("pk", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_count(self):
+        response = self.client.get("/store/products/?cursor=&count=exact")
+        self.assertEqual(response.data["count"], 25)
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_estimated_count_says_when_it_is_capped(self):
+        url = (
+            "/store/products/?cursor=&count=estimate"
+            f"&collection_id={self.products[0].collection_id}"
+        )
+        for limit, count, capped in [(10, 10, True), (25, 25, False), (30, 25, False)]:
+            with self.subTest(limit=limit), mock.patch.object(
+                KeysetPagination, "estimate_limit", limit
+            ):
+                cache.get_cache().clear()
+                response = self.client.get(url)
+                self.assertEqual(response.data["count"], count)
+                self.assertIs(response.data["count_capped"], capped)
+
+        response = self.client.get("/store/products/?cursor=&count=exact")
+        self.assertNotIn("count_capped", response.data)
+
+    def test_invalid_cursors(self):
+        positions = [
+            ["Product 1"],
+            ["Product 1", 1, 2],
+            [None, 1],
+            ["Product 1", None],
+            ["Product 1", "one"],
+            ["Product 1", [1]],
+            ["Product 1", {"pk": 1}],
+            ["Product 1", 2**64],
+            {"title": "Product 1"},
+        ]
+        cursors = ["not base64!", base64.urlsafe_b64encode(b"not json").decode()]
+        cursors += [encode_cursor(position) for position in positions]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f"/store/products/?cursor={cursor}")
+                self.assertEqual(response.status_code, 404)
+
+    def test_invalid_annotation_and_date_cursors(self):
+        for url, position in [
+            ("/store/products/?ordering=effective_price&", ["NaN", 1]),
+            ("/store/products/?ordering=effective_price&", [[1], 1]),
+            (f"/store/products/{self.products[0].pk}/reviews/?", [12, 1]),
+            (f"/store/products/{self.products[0].pk}/reviews/?", ["yesterday", 1]),
+        ]:
+            with self.subTest(url=url, position=position):
+                response = self.client.get(f"{url}cursor={encode_cursor(position)}")
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(
+    IMAGE_STORAGE_BACKEND="store.images.StorageBackend",
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+)
+class ProductRepresentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = create_collection()
+        other = create_collection("Other")
+        cls.products = [
+            create_product(collection, "Tea", "3.50", description="Green\u2028tea"),
+            create_product(collection, "Cup", "12.00"),
+            create_product(other, "Pot", "25.99", inventory=0),
+        ]
+        Image.objects.create(
+            product=cls.products[0], title="Tea", image="products/tea.png"
+        )
+        Image.objects.create(product=cls.products[1], title="Pending", image="")
+        small = Promotion.objects.create(description="Small", discount=10)
+        large = Promotion.objects.create(description="Large", discount=35)
+        cls.products[0].promotions.add(small, large)
+        cls.products[2].promotions.add(small)
+        Review.objects.create(product=cls.products[1], name="A", body="Fine")
+        cls.admin = get_user_model().objects.create_user(
+            "admin", "admin@example.com", "password", is_staff=True
+        )
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+
+    def assertSameBody(self, url):
+        values = self.client.get(url)
+        self.assertEqual(values.status_code, 200)
+        cache.get_cache().clear()
+        with mock.patch.multiple(
+            "store.views.ProductViewSet",
+            list_values=mixins.ListModelMixin.list,
+            retrieve_values=mixins.RetrieveModelMixin.retrieve,
+        ):
+            models = self.client.get(url)
+        self.assertEqual(values.content, models.content)
+
+    def test_values_serializer_writes_the_same_bytes(self):
+        for url in [
+            "/store/products/",
+            f"/store/products/{self.products[0].pk}/",
+            f"/store/products/{self.products[1].pk}/",
+            f"/store/products/?collection_id={self.products[0].collection_id}",
+            "/store/products/?ordering=effective_price&effective_price__lt=20",
+            "/store/products/?ordering=-effective_price&cursor=",
+        ]:
+            with self.subTest(url=url):
+                self.assertSameBody(url)
+
+    def test_writes_respond_with_fresh_prices(self):
+        self.client.force_authenticate(self.admin)
+        product = self.products[0]
+        with self.assertNumQueries(6):
+            response = self.client.patch(
+                f"/store/products/{product.pk}/", {"unit_price": "10.00"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["price_with_tax"], Decimal("11.00"))
+        self.assertEqual(
+            response.data["effective_price"],
+            Product.objects.with_prices().get(pk=product.pk).effective_price,
+        )
+        self.assertSameBody(f"/store/products/{product.pk}/")
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.collection = create_collection()
+        cls.other_collection = create_collection("Other")
+        cls.product = create_product(cls.collection)
+        cls.other_product = create_product(cls.other_collection, "Other product")
+        cls.admin = get_user_model().objects.create_user(
+            "admin", "admin@example.com", "password", is_staff=True
+        )
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeated_reads_hit(self):
+        for url in ["/store/products/", f"/store/products/{self.product.pk}/"]:
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url)["X-Cache"], "MISS")
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.get(url)["X-Cache"], "HIT")
+
+    def test_write_bumps_scopes_after_commit(self):
+        scopes = [
+            cache.PRODUCTS,
+            cache.product_scope(self.product.pk),
+            cache.collection_scope(self.collection.pk),
+        ]
+        before = cache.get_versions(scopes)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = "Renamed"
+            self.product.save()
+            self.assertEqual(cache.get_versions(scopes), before)
+        after = cache.get_versions(scopes)
+        for scope, old, new in zip(scopes, before, after):
+            with self.subTest(scope=scope):
+                self.assertGreater(new, old)
+
+    def test_next_read_after_a_write_misses(self):
+        self.client.force_authenticate(self.admin)
+        urls = [
+            "/store/products/",
+            f"/store/products/{self.product.pk}/",
+            f"/store/products/?collection_id={self.collection.pk}",
+        ]
+        untouched = [
+            f"/store/products/{self.other_product.pk}/",
+            f"/store/products/?collection_id={self.other_collection.pk}",
+        ]
+        for url in urls + untouched:
+            self.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/store/products/{self.product.pk}/", {"title": "Renamed"}
+            )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.get("/store/products/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        titles = [row["title"] for row in response.data["results"]]
+        self.assertIn("Renamed", titles)
+        response = self.get(f"/store/products/{self.product.pk}/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["title"], "Renamed")
+        self.assertEqual(self.get(urls[2])["X-Cache"], "MISS")
+        for url in untouched:
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url)["X-Cache"], "HIT")
+
+    def test_review_misses_its_product_and_lists(self):
+        detail = f"/store/products/{self.product.pk}/"
+        reviews = f"/store/products/{self.product.pk}/reviews/"
+        collection = f"/store/products/?collection_id={self.collection.pk}"
+        untouched = [
+            f"/store/products/{self.other_product.pk}/",
+            f"/store/products/?collection_id={self.other_collection.pk}",
+        ]
+        for url in [detail, reviews, collection, "/store/products/", *untouched]:
+            self.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, name="Ann", body="Good")
+
+        for url in [detail, collection, "/store/products/"]:
+            with self.subTest(url=url):
+                response = self.get(url)
+                self.assertEqual(response["X-Cache"], "MISS")
+                products = response.data.get("results", [response.data])
+                counts = {
+                    product["id"]: product["review_count"] for product in products
+                }
+                self.assertEqual(counts[self.product.pk], 1)
+        self.assertEqual(self.get(reviews)["X-Cache"], "MISS")
+        for url in untouched:
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url)["X-Cache"], "HIT")
+
+    def test_checkout_misses_the_reserved_products(self):
+        user = get_user_model().objects.create_user("customer", "c@example.com")
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=3)
+        detail = f"/store/products/{self.product.pk}/"
+        collection = f"/store/products/?collection_id={self.collection.pk}"
+        untouched = f"/store/products/{self.other_product.pk}/"
+        for url in [detail, collection, "/store/products/", untouched]:
+            self.get(url)
+
+        serializer = CreateOrderSerializer(
+            data={"cart_id": cart.pk}, context={"user_id": user.pk}
+        )
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+
+        response = self.get(detail)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["inventory"], 7)
+        self.assertEqual(self.get(collection).data["results"][0]["inventory"], 7)
+        self.assertEqual(self.get("/store/products/")["X-Cache"], "MISS")
+        self.assertEqual(self.get(untouched)["X-Cache"], "HIT")
+
+    def test_collection_write_misses(self):
+        url = f"/store/collections/{self.collection.pk}/"
+        self.get(url)
+        self.get("/store/collections/")
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product(self.collection, "New product")
+        response = self.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["product_count"], 2)
+        self.assertEqual(self.get("/store/collections/")["X-Cache"], "MISS")
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = create_collection()
+        create_product(collection, "Green tea", description="Loose leaves")
+        create_product(collection, "Teapot", description="For green leaves")
+        create_product(collection, "Cup")
+
+    def search(self, query, vendor=None):
+        request = Request(APIRequestFactory().get("/store/products/", query))
+        view = mock.Mock(search_fields=["title", "description"])
+        with mock.patch.object(connection, "vendor", vendor or connection.vendor):
+            return ProductSearchFilter().filter_queryset(
+                request, Product.objects.all(), view
+            )
+
+    def test_other_databases_match_substrings(self):
+        response = APIClient().get("/store/products/?search=green tea")
+        self.assertEqual(
+            [product["title"] for product in response.data["results"]],
+            ["Green tea", "Teapot"],
+        )
+
+    def test_mysql_matches_the_fulltext_index(self):
+        queryset = self.search({"search": "green, tea-pot"}, vendor="mysql")
+
+        sql, params = queryset.query.sql_with_params()
+        match = (
+            'MATCH ("store_product"."title", "store_product"."description") '
+            "AGAINST (%s IN BOOLEAN MODE)"
+        )
+        self.assertEqual(sql.count(match), 2)
+        self.assertNotIn("LIKE", sql)
+        self.assertEqual(params, ("+green* +tea* +pot*",) * 2)
+        self.assertEqual(queryset.query.order_by, ("-search_rank",))
+
+    def test_mysql_keeps_an_explicit_ordering(self):
+        queryset = self.search({"search": "green", "ordering": "title"}, "mysql")
+        self.assertEqual(queryset.query.order_by, ())
+
+    def test_mysql_short_words_match_substrings(self):
+        queryset = self.search({"search": "green te"}, vendor="mysql")
+        sql, params = queryset.query.sql_with_params()
+        self.assertNotIn("MATCH", sql)
+        self.assertEqual(params, ("%green%", "%green%", "%te%", "%te%"))
+
+
+class ProductTagFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.collection = create_collection()
+        cls.tea = create_product(cls.collection, "Tea")
+        cls.cup = create_product(cls.collection, "Cup")
+        cls.pot = create_product(create_collection("Other"), "Pot")
+        cls.green = Tag.objects.create(label="green")
+        cls.tag(cls.tea, cls.green)
+        cls.tag(cls.pot, Tag.objects.create(label="blue"))
+
+    @staticmethod
+    def tag(product, tag):
+        return TaggedItem.objects.create(tag=tag, content_object=product)
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+
+    def titles(self, query, cache_status=None):
+        response = self.client.get(f"/store/products/?{query}")
+        self.assertEqual(response.status_code, 200)
+        if cache_status:
+            self.assertEqual(response["X-Cache"], cache_status)
+        return [product["title"] for product in response.data["results"]]
+
+    def test_filters_by_tag(self):
+        self.assertEqual(self.titles("tag=green"), ["Tea"])
+        self.assertEqual(self.titles("tag=green&cursor="), ["Tea"])
+        self.assertEqual(self.titles("tag=blue"), ["Pot"])
+        self.assertEqual(
+            self.titles(f"tag=blue&collection_id={self.collection.pk}"), []
+        )
+        self.assertEqual(self.titles("tag=red"), [])
+
+    def test_tagging_misses_cached_lists(self):
+        for query in ["tag=green", f"tag=green&collection_id={self.collection.pk}"]:
+            with self.subTest(query=query):
+                self.assertEqual(self.titles(query, "MISS"), ["Tea"])
+                self.assertEqual(self.titles(query, "HIT"), ["Tea"])
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    tagged = self.tag(self.cup, self.green)
+                self.assertEqual(self.titles(query, "MISS"), ["Cup", "Tea"])
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    tagged.delete()
+                self.assertEqual(self.titles(query, "MISS"), ["Tea"])
+
+
+class ProductCountTests(TestCase):
+    def setUp(self):
+        self.first = create_collection("First")
+        self.second = create_collection("Second")
+
+    def assertCountsMatch(self):
+        counts = Collection.objects.annotate(actual=Count("products")).values_list(
+            "title", "product_count", "actual"
+        )
+        for title, stored, actual in counts:
+            with self.subTest(collection=title):
+                self.assertEqual(stored, actual)
+
+    def test_create_and_delete(self):
+        product = create_product(self.first)
+        create_product(self.first, "Second product")
+        self.assertCountsMatch()
+        product.delete()
+        self.assertCountsMatch()
+        Product.objects.filter(collection=self.first).delete()
+        self.assertCountsMatch()
+
+    def test_move_between_collections(self):
+        product = create_product(self.first)
+        product.collection = self.second
+        product.save()
+        self.assertCountsMatch()
+        # A stale instance still moves the product out of the stored collection.
+        stale = Product.objects.get(pk=product.pk)
+        Product.objects.filter(pk=product.pk).update(collection=self.first)
+        stale.collection = self.second
+        stale.save()
+        self.assertCountsMatch()
+        Product.objects.get(pk=product.pk).delete()
+        self.assertCountsMatch()
+
+    def test_bulk_writes(self):
+        products = Product.objects.bulk_create(
+            Product(
+                title=f"Product {i}",
+                slug=f"product-{i}",
+                unit_price=Decimal(10),
+                inventory=1,
+                collection=self.first,
+            )
+            for i in range(6)
+        )
+        self.assertCountsMatch()
+        products = list(Product.objects.order_by("pk"))
+        for product in products[:2]:
+            product.collection = self.second
+        Product.objects.bulk_update(products, ["collection"])
+        self.assertCountsMatch()
+        Product.objects.filter(pk=products[2].pk).update(collection=self.second)
+        self.assertCountsMatch()
+        Product.objects.filter(collection=self.second).update(
+            collection_id=self.first.pk
+        )
+        self.assertCountsMatch()
+
+    def test_upsert(self):
+        existing = create_product(self.first)
+        existing.collection = self.second
+        Product.objects.upsert(
+            [
+                existing,
+                Product(
+                    pk=existing.pk + 100,
+                    title="New",
+                    slug="new",
+                    unit_price=Decimal(5),
+                    inventory=1,
+                    collection=self.first,
+                ),
+            ]
+        )
+        self.assertCountsMatch()
+
+    def test_save_leaves_review_counters_alone(self):
+        product = create_product(self.first)
+        Product.objects.filter(pk=product.pk).update(review_count=3)
+
+        product.title = "Renamed"
+        product.save()
+        self.assertEqual(
+            Product.objects.values_list("title", "review_count").get(), ("Renamed", 3)
+        )
+
+        product.review_count = 5
+        product.save(update_fields=["review_count"])
+        self.assertEqual(Product.objects.get().review_count, 5)
+
+        # Like any model, a saved instance whose row is gone is inserted again.
+        Product.objects.all().delete()
+        product.save()
+        self.assertEqual(
+            Product.objects.values_list("pk", "title", "review_count").get(),
+            (product.pk, "Renamed", 5),
+        )
+        self.assertEqual(Collection.objects.get(pk=self.first.pk).product_count, 1)
+
+    def test_reconcile_counters_repairs_drift(self):
+        create_product(self.first)
+        create_product(self.first, "Second product")
+        Collection.objects.filter(pk=self.first.pk).update(product_count=7)
+        Collection.objects.filter(pk=self.second.pk).update(product_count=3)
+
+        stdout = io.StringIO()
+        call_command("reconcile_counters", "--dry-run", stdout=stdout)
+        self.assertIn("2 collection counts", stdout.getvalue())
+        self.assertEqual(Collection.objects.get(pk=self.first.pk).product_count, 7)
+
+        stdout = io.StringIO()
+        before = cache.get_versions([cache.CATALOG])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("reconcile_counters", stdout=stdout)
+        self.assertIn("2 collection counts", stdout.getvalue())
+        self.assertCountsMatch()
+        self.assertGreater(cache.get_versions([cache.CATALOG]), before)
+
+        stdout = io.StringIO()
+        call_command("reconcile_counters", stdout=stdout)
+        self.assertIn("0 collection counts", stdout.getvalue())
+
+
+class BatchCartItemTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = create_collection()
+        cls.first = create_product(collection, "First")
+        cls.second = create_product(collection, "Second")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cart = Cart.objects.create()
+        CartItem.objects.create(cart=self.cart, product=self.first, quantity=2)
+
+    def batch(self, items, replace=False, cart_id=None):
+        return self.client.post(
+            f"/store/carts/{cart_id or self.cart.pk}/items/batch/",
+            {"items": items, "replace": replace},
+            format="json",
+        )
+
+    def quantities(self):
+        return dict(
+            CartItem.objects.filter(cart=self.cart).values_list(
+                "product_id", "quantity"
+            )
+        )
+
+    def test_add(self):
+        response = self.batch(
+            [
+                {"product_id": self.first.pk, "quantity": 3},
+                {"product_id": self.second.pk, "quantity": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.first.pk: 5, self.second.pk: 1})
+        self.assertEqual(
+            [(item["product"]["id"], item["quantity"]) for item in response.data],
+            [(self.first.pk, 5), (self.second.pk, 1)],
+        )
+
+    def test_replace(self):
+        response = self.batch(
+            [
+                {"product_id": self.first.pk, "quantity": 3},
+                {"product_id": self.second.pk, "quantity": 4},
+            ],
+            replace=True,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.first.pk: 3, self.second.pk: 4})
+
+    def test_duplicate_products_are_summed(self):
+        items = [
+            {"product_id": self.second.pk, "quantity": 1},
+            {"product_id": self.second.pk, "quantity": 2},
+        ]
+        self.assertEqual(self.batch(items).status_code, 200)
+        self.assertEqual(self.quantities()[self.second.pk], 3)
+        self.assertEqual(self.batch(items, replace=True).status_code, 200)
+        self.assertEqual(self.quantities()[self.second.pk], 3)
+
+    def test_unknown_product(self):
+        response = self.batch(
+            [
+                {"product_id": self.second.pk, "quantity": 1},
+                {"product_id": self.second.pk + 100, "quantity": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("items", response.data)
+        self.assertEqual(self.quantities(), {self.first.pk: 2})
+
+    def test_missing_cart(self):
+        items = [{"product_id": self.first.pk, "quantity": 1}]
+        cart_id = self.cart.pk
+        self.cart.delete()
+        for missing in [cart_id, "not-a-uuid"]:
+            with self.subTest(cart_id=missing):
+                response = self.batch(items, cart_id=missing)
+                self.assertEqual(response.status_code, 404)
+        self.assertFalse(CartItem.objects.filter(cart_id=cart_id).exists())
+
+    def test_quantity_limit(self):
+        over = MAX_CART_QUANTITY + 1
+        for items, replace in [
+            ([{"product_id": self.second.pk, "quantity": over}], False),
+            ([{"product_id": self.first.pk, "quantity": MAX_CART_QUANTITY - 1}], False),
+            (
+                [
+                    {"product_id": self.second.pk, "quantity": MAX_CART_QUANTITY},
+                    {"product_id": self.second.pk, "quantity": 1},
+                ],
+                True,
+            ),
+        ]:
+            with self.subTest(items=items, replace=replace):
+                response = self.batch(items, replace=replace)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {self.first.pk: 2})
+
+        response = self.batch(
+            [{"product_id": self.first.pk, "quantity": MAX_CART_QUANTITY - 2}]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.first.pk: MAX_CART_QUANTITY})
+
+    def test_single_add_limit(self):
+        url = f"/store/carts/{self.cart.pk}/items/"
+        response = self.client.post(
+            url, {"product_id": self.first.pk, "quantity": MAX_CART_QUANTITY - 1}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {"product_id": self.first.pk, "quantity": 3})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["quantity"], 5)
+        self.cart.delete()
+        response = self.client.post(url, {"product_id": self.first.pk, "quantity": 1})
+        self.assertEqual(response.status_code, 404)
+
+
+class UpsertTests(TestCase):
+    """Both the ``INSERT ... ON CONFLICT`` path and the generic fallback."""
+
+    def setUp(self):
+        self.collection = create_collection()
+        self.product = create_product(self.collection)
+
+    @contextmanager
+    def upsert_path(self, fallback):
+        sql = {} if fallback else UpsertQuerySet.upsert_sql
+        with mock.patch.object(UpsertQuerySet, "upsert_sql", sql):
+            with transaction.atomic():
+                yield
+                transaction.set_rollback(True)
+
+    def test_cart_quantities(self):
+        other = create_product(self.collection, "Other")
+        for fallback in (False, True):
+            with self.subTest(fallback=fallback), self.upsert_path(fallback):
+                cart = Cart.objects.create()
+                CartItem.objects.upsert_quantities(cart.pk, {self.product.pk: 2})
+                CartItem.objects.upsert_quantities(
+                    str(cart.pk), {self.product.pk: 3, other.pk: 1}
+                )
+                quantities = dict(cart.items.values_list("product_id", "quantity"))
+                self.assertEqual(quantities, {self.product.pk: 5, other.pk: 1})
+                CartItem.objects.upsert_quantities(
+                    cart.pk, {self.product.pk: 1}, increment=False
+                )
+                self.assertEqual(cart.items.get(product=self.product).quantity, 1)
+
+    def test_rollup_increments(self):
+        today = timezone.localdate()
+        for fallback in (False, True):
+            with self.subTest(fallback=fallback), self.upsert_path(fallback):
+                row = {"date": today, "product": self.product.pk, "units": 2}
+                DailyProductSales.objects.increment([{**row, "revenue": Decimal("5")}])
+                DailyProductSales.objects.increment(
+                    [{**row, "revenue": Decimal("2.5")}]
+                )
+                self.assertEqual(
+                    list(DailyProductSales.objects.values_list("units", "revenue")),
+                    [(4, Decimal("7.5"))],
+                )
+
+    def test_product_upsert(self):
+        Product.objects.filter(pk=self.product.pk).update(review_count=3)
+        for fallback in (False, True):
+            with self.subTest(fallback=fallback), self.upsert_path(fallback):
+                self.product.title = "Renamed"
+                Product.objects.upsert(
+                    [
+                        self.product,
+                        Product(
+                            pk=self.product.pk + 1,
+                            title="Inserted",
+                            slug="inserted",
+                            unit_price=Decimal("3.00"),
+                            inventory=5,
+                            collection=self.collection,
+                        ),
+                    ]
+                )
+                self.assertEqual(
+                    list(
+                        Product.objects.order_by("pk").values_list(
+                            "title", "review_count"
+                        )
+                    ),
+                    [("Renamed", 3), ("Inserted", 0)],
+                )
+                self.assertEqual(Collection.objects.get().product_count, 2)
+
+
+class CheckoutTests(TransactionTestCase):
+    stock = 5
+
+    def setUp(self):
+        collection = create_collection()
+        self.hot = create_product(collection, "Hot", inventory=self.stock)
+        self.other = create_product(collection, "Other", inventory=100)
+        user = get_user_model().objects.create_user("customer", "customer@example.com")
+        self.customer = Customer.objects.get(user=user)
+
+    def create_cart(self, hot_quantity):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.hot, quantity=hot_quantity)
+        CartItem.objects.create(cart=cart, product=self.other, quantity=1)
+        return cart
+
+    def checkout(self, cart):
+        serializer = CreateOrderSerializer(
+            data={"cart_id": cart.pk}, context={"customer_id": self.customer.pk}
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_shortage_keeps_the_cart(self):
+        cart = self.create_cart(self.stock + 1)
+        with self.assertRaises(serializers.ValidationError) as raised:
+            self.checkout(cart)
+        shortages = raised.exception.detail["items"]
+        self.assertEqual(list(shortages), [str(self.hot.pk)])
+        self.assertIn(f"Only {self.stock} left", str(shortages[str(self.hot.pk)][0]))
+        self.assertEqual(CartItem.objects.filter(cart=cart).count(), 2)
+        self.assertEqual(
+            dict(Product.objects.values_list("pk", "inventory")),
+            {self.hot.pk: self.stock, self.other.pk: 100},
+        )
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout(self):
+        cart = self.create_cart(2)
+        order = self.checkout(cart)
+        self.assertFalse(Cart.objects.filter(pk=cart.pk).exists())
+        self.assertEqual(
+            dict(order.items.values_list("product_id", "quantity")),
+            {self.hot.pk: 2, self.other.pk: 1},
+        )
+        self.assertEqual(Product.objects.get(pk=self.hot.pk).inventory, self.stock - 2)
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_concurrent_checkouts_do_not_oversell(self):
+        carts = [self.create_cart(2) for _ in range(8)]
+        barrier = threading.Barrier(len(carts))
+        orders, shortages, errors = [], [], []
+
+        def checkout(cart):
+            try:
+                barrier.wait()
+                orders.append(self.checkout(cart))
+            except serializers.ValidationError as exc:
+                shortages.append((cart, exc.detail["items"]))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        sold = OrderItem.objects.filter(product=self.hot).aggregate(
+            sold=Sum("quantity")
+        )["sold"]
+        left = Product.objects.get(pk=self.hot.pk).inventory
+        self.assertEqual(len(orders), self.stock // 2)
+        self.assertEqual(Order.objects.count(), len(orders))
+        self.assertGreaterEqual(left, 0)
+        self.assertEqual(sold + left, self.stock)
+        self.assertEqual(
+            Product.objects.get(pk=self.other.pk).inventory, 100 - len(orders)
+        )
+        for cart, items in shortages:
+            self.assertEqual(list(items), [str(self.hot.pk)])
+            self.assertEqual(CartItem.objects.filter(cart=cart).count(), 2)
+
+
+class AsyncViewTests(TransactionTestCase):
+    # The views run in another thread, which does not see a test transaction.
+
+    def setUp(self):
+        cache.get_cache().clear()
+        collection = create_collection()
+        self.product = create_product(collection, "Tea")
+        create_product(collection, "Cup", "4.25")
+        self.review = Review.objects.create(product=self.product, name="A", body="Fine")
+
+    def async_get(self, path):
+        async def get():
+            return await self.async_client.get(path)
+
+        return async_to_sync(get)()
+
+    def test_same_bodies_as_the_sync_views(self):
+        product, review = self.product, self.review
+        for path in [
+            "products/",
+            "products/?ordering=-unit_price",
+            f"products/{product.pk}/",
+            "collections/",
+            f"collections/{product.collection_id}/",
+            f"products/{product.pk}/reviews/",
+            f"products/{product.pk}/reviews/{review.pk}/",
+        ]:
+            with self.subTest(path=path):
+                expected = self.client.get(f"/store/{path}")
+                cache.get_cache().clear()
+                response = self.async_get(f"/store/async/{path}")
+                cache.get_cache().clear()
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["X-Cache"], "MISS")
+                self.assertEqual(response.content, expected.content)
+
+    def test_missing_rows(self):
+        response = self.async_get("/store/async/products/0/")
+        self.assertEqual(response.status_code, 404)
+
+
+class OrderTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = create_collection()
+        tea = create_product(collection, "Tea", "12.50")
+        cup = create_product(collection, "Cup", "3.00")
+        User = get_user_model()
+        cls.user = User.objects.create_user("customer", "customer@example.com")
+        other = User.objects.create_user("other", "other@example.com")
+        cls.admin = User.objects.create_user(
+            "admin", "admin@example.com", is_staff=True
+        )
+        customer = Customer.objects.get(user=cls.user)
+        cls.orders = [Order.objects.create(customer=customer) for _ in range(3)]
+        for order, product, quantity, unit_price in [
+            (cls.orders[0], tea, 2, "12.50"),
+            (cls.orders[0], cup, 1, "2.99"),
+            (cls.orders[1], cup, 3, "3.00"),
+        ]:
+            OrderItem.objects.create(
+                order=order,
+                product=product,
+                quantity=quantity,
+                unit_price=Decimal(unit_price),
+            )
+        Order.objects.create(customer=Customer.objects.get(user=other))
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def totals(self, user):
+        self.client.force_authenticate(user)
+        # Orders and their items, whatever the number of orders.
+        with self.assertNumQueries(2):
+            response = self.client.get("/store/orders/")
+        self.assertEqual(response.status_code, 200)
+        return {
+            order["id"]: (order["total_price"], order["item_count"])
+            for order in response.data["results"]
+        }
+
+    def test_totals_are_computed_by_the_database(self):
+        self.assertEqual(
+            self.totals(self.user),
+            {
+                self.orders[0].pk: (Decimal("27.99"), 3),
+                self.orders[1].pk: (Decimal("9.00"), 3),
+                self.orders[2].pk: (Decimal("0.00"), 0),
+            },
+        )
+
+    def test_staff_see_every_order(self):
+        self.assertEqual(len(self.totals(self.admin)), 4)
+
+    def test_detail(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(f"/store/orders/{self.orders[0].pk}/")
+        self.assertEqual(response.data["total_price"], Decimal("27.99"))
+        self.assertEqual(
+            [
+                (item["quantity"], item["product"]["title"])
+                for item in response.data["items"]
+            ],
+            [(2, "Tea"), (1, "Cup")],
+        )
+
+
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.product = create_product(create_collection())
+        cls.uploader = User.objects.create_user("uploader", "uploader@example.com")
+        cls.other = User.objects.create_user("other", "other@example.com")
+        cls.admin = User.objects.create_user(
+            "admin", "admin@example.com", is_staff=True
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            IMAGE_STAGING_STORAGE="django.core.files.storage.FileSystemStorage",
+            IMAGE_STORAGE_BACKEND="store.images.StorageBackend",
+            DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+            MEDIA_ROOT=f"{directory.name}/media",
+            MEDIA_URL="/media/",
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.get_cache().clear()
+        self.client = APIClient()
+
+    def upload(self, user):
+        self.client.force_authenticate(user)
+        return self.client.post(
+            "/store/images", {"product": self.product.pk, "image": png_upload()}
+        )
+
+    def test_upload_requires_authentication(self):
+        response = self.client.post(
+            "/store/images", {"product": self.product.pk, "image": png_upload()}
+        )
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Image.objects.exists())
+
+    def test_status_is_only_visible_to_the_uploader_and_staff(self):
+        response = self.upload(self.uploader)
+        self.assertEqual(response.status_code, 202)
+        image = Image.objects.get()
+        Image.objects.filter(pk=image.pk).update(
+            status=Image.STATUS_FAILED, error="OSError('/srv/staging/abc')"
+        )
+        url = f"/store/images/{image.pk}"
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], Image.STATUS_FAILED)
+        self.assertNotIn("error", response.data)
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(url)
+        self.assertEqual(response.data["error"], "OSError('/srv/staging/abc')")
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_processed_image_is_served_from_the_storage(self):
+        self.upload(self.uploader)
+        image = Image.objects.get()
+
+        images.process(image, images.get_backend(), max_attempts=1)
+
+        image.refresh_from_db()
+        self.assertEqual(image.status, Image.STATUS_READY)
+        name = f"images/{self.product.pk}-{image.pk}.png"
+        self.assertTrue(default_storage.exists(name))
+        expected = f"http://testserver/media/{name}"
+        response = self.client.get(f"/store/products/{self.product.pk}/")
+        self.assertEqual(response.data["image"]["image"], expected)
+        response = self.client.get("/store/products/")
+        self.assertEqual(response.data["results"][0]["image"]["image"], expected)
+
+    def test_uploads_are_staged_in_the_staging_storage(self):
+        self.upload(self.uploader)
+        image = Image.objects.get()
+        staged_file = image.staged_file
+        self.assertTrue(staged_file.startswith("staging/"))
+        self.assertTrue(images.get_staging_storage().exists(staged_file))
+
+        images.process(image, images.get_backend(), max_attempts=1)
+
+        self.assertFalse(images.get_staging_storage().exists(staged_file))
+        self.assertEqual(image.staged_file, "")
+
+    def test_failed_uploads_are_retried_later(self):
+        self.upload(self.uploader)
+        staged_file = Image.objects.get().staged_file
+        backend = mock.Mock()
+        backend.upload.side_effect = ConnectionError("timed out")
+        out = io.StringIO()
+
+        with mock.patch.object(images, "get_backend", return_value=backend):
+            call_command("process_images", "--once", "--max-attempts=2", stdout=out)
+            image = Image.objects.get()
+            self.assertEqual(image.status, Image.STATUS_PENDING)
+            self.assertEqual(image.attempts, 1)
+            self.assertGreater(image.available_at, timezone.now())
+            # Not picked up again before the backoff is over.
+            call_command("process_images", "--once", "--max-attempts=2", stdout=out)
+            self.assertEqual(backend.upload.call_count, 1)
+
+            Image.objects.update(available_at=timezone.now())
+            call_command("process_images", "--once", "--max-attempts=2", stdout=out)
+
+        image.refresh_from_db()
+        self.assertEqual((image.status, image.attempts), (Image.STATUS_FAILED, 2))
+        self.assertEqual(image.error, "ConnectionError('timed out')")
+        self.assertFalse(images.get_staging_storage().exists(staged_file))
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = create_collection()
+        cls.products = [
+            create_product(collection, title)
+            for title in ["Tea", 'Tea, "green"', "Cup", "Pot", "Kettle"]
+        ]
+        user = get_user_model().objects.create_user(
+            "admin", "admin@example.com", is_staff=True
+        )
+        order = Order.objects.create(customer=Customer.objects.get(user=user))
+        for product in cls.products[:3]:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=2, unit_price=Decimal("9.99")
+            )
+        cls.admin = user
+        cls.order = order
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        chunks = mock.patch.object(
+            export, "chunks", functools.partial(export.chunks, chunk_size=2)
+        )
+        chunks.start()
+        self.addCleanup(chunks.stop)
+
+    def stream(self, url, queries):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(queries):
+            return [part.decode() for part in response.streaming_content]
+
+    def test_ndjson_streams_keyset_chunks(self):
+        parts = self.stream("/store/export/products.ndjson", queries=3)
+
+        self.assertEqual([part.count("\n") for part in parts], [2, 2, 1])
+        rows = [json.loads(line) for line in "".join(parts).splitlines()]
+        self.assertEqual(
+            [(row["id"], row["title"]) for row in rows],
+            [(product.pk, product.title) for product in self.products],
+        )
+
+    def test_csv_streams_keyset_chunks(self):
+        parts = self.stream("/store/export/orders.csv", queries=2)
+
+        self.assertEqual(len(parts), 2)
+        header, *rows = csv.reader(io.StringIO("".join(parts)))
+        self.assertEqual(
+            header,
+            [
+                "id",
+                "order_id",
+                "product_id",
+                "quantity",
+                "unit_price",
+                "placed_at",
+                "payment_status",
+                "customer_id",
+            ],
+        )
+        self.assertEqual(
+            [row[2:5] + row[6:] for row in rows],
+            [
+                [str(product.pk), "2", "9.99", "P", str(self.order.customer_id)]
+                for product in self.products[:3]
+            ],
+        )
+        self.assertEqual(rows[0][5], self.order.placed_at.isoformat())
+
+    def test_csv_quotes_values(self):
+        parts = self.stream("/store/export/products.csv", queries=3)
+
+        rows = list(csv.reader(io.StringIO("".join(parts))))
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(
+            [row[1] for row in rows[1:]], [product.title for product in self.products]
+        )
+
+
+class ImportCatalogTests(TestCase):
+    def row(self, **kwargs):
+        return {
+            "title": "Green Tea",
+            "collection": "Beverages",
+            "unit_price": "4.50",
+            "inventory": "12",
+            **kwargs,
+        }
+
+    def test_parse_row(self):
+        self.assertEqual(
+            parse_row(self.row()),
+            {
+                "title": "Green Tea",
+                "slug": "green-tea",
+                "description": None,
+                "unit_price": Decimal("4.50"),
+                "inventory": 12,
+                "collection": "Beverages",
+            },
+        )
+        self.assertEqual(parse_row(self.row(inventory=7))["inventory"], 7)
+        self.assertEqual(parse_row(self.row(inventory=""))["inventory"], 0)
+        self.assertEqual(
+            parse_row(self.row(unit_price=Decimal("1.005")))["unit_price"],
+            Decimal("1.00"),
+        )
+
+    def test_parse_row_rejects_invalid_values(self):
+        for field, value in [
+            ("title", ""),
+            ("slug", "Not a slug"),
+            ("collection", None),
+            ("unit_price", None),
+            ("unit_price", "abc"),
+            ("unit_price", "NaN"),
+            ("unit_price", "-Infinity"),
+            ("unit_price", Decimal("NaN")),
+            ("unit_price", "0.99"),
+            ("unit_price", "10000"),
+            ("inventory", "2.7"),
+            ("inventory", "2.0"),
+            ("inventory", 2.7),
+            ("inventory", Decimal("2.0")),
+            ("inventory", True),
+            ("inventory", "-1"),
+            ("inventory", 2**31),
+        ]:
+            with self.subTest(field=field, value=value):
+                with self.assertRaises(RowError):
+                    parse_row(self.row(**{field: value}))
+        with self.assertRaises(RowError):
+            parse_row(["Green Tea"])
+
+    def test_invalid_rows_are_skipped(self):
+        create_collection("Beverages")
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as fp:
+            fp.write(
+                "title,collection,unit_price,inventory\n"
+                "Green Tea,Beverages,4.50,12\n"
+                "Black Tea,Beverages,NaN,3\n"
+                "White Tea,Beverages,6.00,2.7\n"
+            )
+            fp.flush()
+            call_command("import_catalog", fp.name, stdout=stdout, stderr=stderr)
+
+        self.assertEqual(
+            list(Product.objects.values_list("slug", "inventory")), [("green-tea", 12)]
+        )
+        self.assertIn("record 2: invalid unit_price 'NaN'", stderr.getvalue())
+        self.assertIn("record 3: invalid inventory '2.7'", stderr.getvalue())
+        self.assertIn("1 created, 0 updated, 0 unchanged, 2 skipped", stdout.getvalue())
+
+    def test_upsert_writes_whole_rows_and_keeps_counters(self):
+        collection = create_collection()
+        product = create_product(collection, description="Old")
+        Product.objects.filter(pk=product.pk).update(review_count=4)
+        product.title = "Renamed"
+        product.description = None
+        product.unit_price = Decimal("12.50")
+        product.inventory = 0
+        product.review_count = 0
+        missing = Product(
+            pk=product.pk + 1,
+            title="Inserted",
+            slug="inserted",
+            unit_price=Decimal("3.00"),
+            inventory=5,
+            collection=collection,
+        )
+
+        Product.objects.upsert([product, missing])
+
+        self.assertEqual(
+            list(
+                Product.objects.order_by("pk").values_list(
+                    "title", "description", "unit_price", "inventory", "review_count"
+                )
+            ),
+            [
+                ("Renamed", None, Decimal("12.50"), 0, 4),
+                ("Inserted", None, Decimal("3.00"), 5, 0),
+            ],
+        )
+        self.assertEqual(Collection.objects.get().product_count, 2)
+        Product.objects.upsert([])
+
+
+class GenerateDataTests(TestCase):
+    def test_derived_data_matches_the_generated_rows(self):
+        call_command(
+            "generate_data",
+            collections=2,
+            products=30,
+            customers=5,
+            orders=40,
+            carts=3,
+            reviews=60,
+            promotions=3,
+            products_per_promotion=5,
+            days=10,
+            batch_size=7,
+            seed=1,
+            stdout=io.StringIO(),
+        )
+
+        drifted = Product.objects.annotate(actual=Count("reviews")).exclude(
+            review_count=F("actual")
+        )
+        self.assertFalse(drifted.exists())
+        self.assertGreater(Product.objects.filter(review_count__gt=0).count(), 1)
+        promoted = Product.objects.filter(promotions__isnull=False).distinct()
+        self.assertEqual(ProductDiscount.objects.count(), promoted.count())
+        self.assertEqual(
+            DailyProductSales.objects.aggregate(units=Sum("units"))["units"],
+            OrderItem.objects.aggregate(units=Sum("quantity"))["units"],
+        )
+        self.assertFalse(
+            any(user.has_usable_password() for user in get_user_model().objects.all())
+        )
+
+    def test_benchmark_api_needs_debug_or_force(self):
+        with self.assertRaisesMessage(CommandError, "pass --force"):
+            call_command("benchmark_api")
+
+
+class SweepCartsTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+
+    def sweep(self, *args):
+        stdout = io.StringIO()
+        call_command("sweep_carts", "--sleep=0", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_deletes_expired_carts_and_orphaned_items(self):
+        product = create_product(create_collection())
+        expired, fresh = Cart.objects.create(), Cart.objects.create()
+        Cart.objects.filter(pk=expired.pk).update(
+            created_at=expired.created_at - timedelta(days=31)
+        )
+        for cart in (expired, fresh, Cart(pk=uuid.uuid4())):
+            CartItem.objects.create(cart_id=cart.pk, product=product, quantity=1)
+
+        stdout = io.StringIO()
+        call_command("sweep_carts", "--batch-size=1", "--sleep=0", stdout=stdout)
+
+        self.assertEqual(list(Cart.objects.values_list("pk", flat=True)), [fresh.pk])
+        self.assertEqual(
+            list(CartItem.objects.values_list("cart_id", flat=True)), [fresh.pk]
+        )
+        self.assertIn("Deleted 1 carts and 1 items in 1 batches", stdout.getvalue())
+        self.assertIn("and 1 orphaned items.", stdout.getvalue())
+
+    def test_orphan_sweeps_only_read_recent_items(self):
+        product = create_product(create_collection())
+        cart = Cart.objects.create()
+        old = CartItem.objects.create(cart=cart, product=product, quantity=1)
+        self.sweep()
+        CartItem.objects.create(cart=Cart.objects.create(), product=product, quantity=1)
+        self.sweep()
+
+        CartItem.objects.filter(pk=old.pk).update(cart_id=uuid.uuid4())
+        recent = CartItem.objects.create(
+            cart_id=uuid.uuid4(), product=product, quantity=1
+        )
+        # The old orphan is below where the run before the last one started.
+        self.assertIn("and 1 orphaned items.", self.sweep("--batch-size=1"))
+        self.assertFalse(CartItem.objects.filter(pk=recent.pk).exists())
+        self.assertTrue(CartItem.objects.filter(pk=old.pk).exists())
+
+        self.assertIn("and 1 orphaned items.", self.sweep("--all-items"))
+        self.assertFalse(CartItem.objects.filter(pk=old.pk).exists())
+
+
+class PromotionDiscountTests(TestCase):
+    def setUp(self):
+        collection = create_collection()
+        self.products = [create_product(collection, f"Product {i}") for i in range(5)]
+        self.small = Promotion.objects.create(description="Small", discount=10)
+        self.large = Promotion.objects.create(description="Large", discount=20)
+        for product in self.products:
+            product.promotions.add(self.small, self.large)
+
+    def discounts(self):
+        return list(
+            ProductDiscount.objects.order_by("product_id").values_list(
+                "promotion_id", "discount"
+            )
+        )
+
+    def drain(self):
+        while outbox.drain()[0]:
+            pass
+        self.assertFalse(OutboxEvent.objects.filter(processed_at__isnull=True))
+
+    def test_product_changes_are_refreshed_right_away(self):
+        self.assertEqual(self.discounts(), [(self.large.pk, 20)] * 5)
+        self.products[0].promotions.remove(self.large)
+        self.assertEqual(self.discounts()[0], (self.small.pk, 10))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_promotion_changes_are_refreshed_by_the_outbox(self):
+        self.large.discount = 5
+        with mock.patch.object(outbox, "DISCOUNT_BATCH_SIZE", 2):
+            self.large.save()
+            self.assertEqual(self.discounts(), [(self.large.pk, 20)] * 5)
+            self.drain()
+
+        self.assertEqual(self.discounts(), [(self.small.pk, 10)] * 5)
+        # Three batches of at most two products.
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+
+    def test_deleted_promotion(self):
+        self.large.delete()
+        self.assertEqual(self.discounts(), [])
+
+        self.drain()
+
+        self.assertEqual(self.discounts(), [(self.small.pk, 10)] * 5)
+
+    def test_rebuild_discounts_command(self):
+        bigger = Promotion.objects.create(description="Bigger", discount=30)
+        # Bulk assignments send no m2m signals.
+        Product.promotions.through.objects.bulk_create(
+            Product.promotions.through(product=product, promotion=bigger)
+            for product in self.products[:3]
+        )
+        before = cache.get_versions([cache.CATALOG])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_discounts", "--batch-size=2", stdout=io.StringIO())
+
+        self.assertEqual(
+            [discount for _, discount in self.discounts()], [30] * 3 + [20] * 2
+        )
+        self.assertGreater(cache.get_versions([cache.CATALOG]), before)
+
+    def test_reverse_assignments(self):
+        bigger = Promotion.objects.create(description="Bigger", discount=30)
+        bigger.product_set.add(*self.products[:2])
+        self.drain()
+        self.assertEqual(
+            self.discounts(), [(bigger.pk, 30)] * 2 + [(self.large.pk, 20)] * 3
+        )
+
+        self.large.product_set.clear()
+        self.drain()
+        self.assertEqual(
+            self.discounts(), [(bigger.pk, 30)] * 2 + [(self.small.pk, 10)] * 3
+        )
+
+
+class EffectivePriceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = create_collection()
+        taxed = create_collection("Taxed", tax_rate=Decimal("0.20"))
+        tea = create_product(collection, "Tea", "10.00")
+        cup = create_product(collection, "Cup", "8.00")
+        create_product(collection, "Pot", "6.00")
+        kettle = create_product(taxed, "Kettle", "20.00")
+        small = Promotion.objects.create(description="Small", discount=10)
+        large = Promotion.objects.create(description="Large", discount=35)
+        half = Promotion.objects.create(description="Half", discount=50)
+        tea.promotions.add(small, large)
+        cup.promotions.add(half, small)
+        kettle.promotions.add(small)
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.client = APIClient()
+
+    def prices(self, query):
+        response = self.client.get(f"/store/products/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [
+            (product["title"], product["effective_price"])
+            for product in response.data["results"]
+        ]
+
+    def test_largest_promotion_applies(self):
+        self.assertEqual(
+            self.prices(""),
+            [
+                ("Cup", Decimal("4.40")),
+                ("Kettle", Decimal("21.60")),
+                ("Pot", Decimal("6.60")),
+                ("Tea", Decimal("7.15")),
+            ],
+        )
+
+    def test_ordering(self):
+        expected = ["Cup", "Pot", "Tea", "Kettle"]
+        for query, titles in [
+            ("ordering=effective_price", expected),
+            ("ordering=-effective_price", expected[::-1]),
+            ("ordering=effective_price&cursor=", expected),
+        ]:
+            with self.subTest(query=query):
+                self.assertEqual([title for title, _ in self.prices(query)], titles)
+
+    def test_range_filter(self):
+        self.assertEqual(
+            self.prices("effective_price__gt=4.40&effective_price__lt=10"),
+            [("Pot", Decimal("6.60")), ("Tea", Decimal("7.15"))],
+        )
+        self.assertEqual(
+            self.prices("effective_price__gt=7.15&ordering=-effective_price"),
+            [("Kettle", Decimal("21.60"))],
+        )
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.delivered = []
+        handlers = mock.patch.dict(
+            outbox.handlers, {"test": self.delivered.append, "failing": self.refuse}
+        )
+        handlers.start()
+        self.addCleanup(handlers.stop)
+        # Events published by the tests are due by then.
+        self.now = timezone.now() + timedelta(seconds=1)
+
+    def refuse(self, payload):
+        raise RuntimeError(f"Cannot deliver {payload}")
+
+    def drain(self, **kwargs):
+        with mock.patch.object(timezone, "now", return_value=self.now):
+            return outbox.drain(**kwargs)
+
+    def test_delivers_due_events(self):
+        event = outbox.publish("test", {"n": 1})
+        later = outbox.publish("test", {"n": 2})
+        OutboxEvent.objects.filter(pk=later.pk).update(
+            available_at=self.now + timedelta(minutes=1)
+        )
+
+        self.assertEqual(self.drain(), (1, 0))
+        self.assertEqual(self.delivered, [{"n": 1}])
+        event.refresh_from_db()
+        self.assertEqual((event.attempts, event.processed_at), (1, self.now))
+        self.assertTrue(outbox.is_pending("test", n=2))
+        self.assertFalse(outbox.is_pending("test", n=1))
+
+    def test_failed_events_back_off_then_give_up(self):
+        event = outbox.publish("failing", {"n": 1})
+        unknown = outbox.publish("unknown", {})
+        delays = []
+        for attempt in range(1, 4):
+            self.assertEqual(self.drain(max_attempts=3, backoff=5.0), (0, 2))
+            event.refresh_from_db()
+            self.assertEqual(event.attempts, attempt)
+            self.assertIn("RuntimeError: Cannot deliver {'n': 1}", event.last_error)
+            delays.append((event.available_at - self.now).total_seconds())
+            # Not due again until then.
+            self.assertEqual(self.drain(max_attempts=3), (0, 0))
+            self.now = event.available_at
+
+        self.assertEqual(delays, [10, 20, 40])
+        self.assertEqual(self.drain(max_attempts=3), (0, 0))
+        event.refresh_from_db()
+        self.assertEqual((event.attempts, event.processed_at), (3, None))
+        unknown.refresh_from_db()
+        self.assertIn("No handler for topic 'unknown'", unknown.last_error)
+
+
+class OrderStatusRollupTests(TestCase):
+    def setUp(self):
+        self.product = create_product(create_collection(), unit_price="12.50")
+        user = get_user_model().objects.create_user("customer", "customer@example.com")
+        self.customer = Customer.objects.get(user=user)
+
+    def place_order(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        serializer = CreateOrderSerializer(
+            data={"cart_id": cart.pk}, context={"customer_id": self.customer.pk}
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def set_status(self, order, payment_status):
+        serializer = UpdateOrderSerializer(
+            order, data={"payment_status": payment_status}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    def statuses(self):
+        return dict(
+            DailyOrderStatus.objects.filter(orders__gt=0).values_list(
+                "payment_status", "revenue"
+            )
+        )
+
+    def test_checkout_leaves_the_status_rollup_to_the_outbox(self):
+        self.place_order()
+        self.assertFalse(DailyOrderStatus.objects.exists())
+
+        outbox.drain()
+
+        self.assertEqual(self.statuses(), {Order.PAYMENT_STATUS_PENDING: 25})
+
+    def test_status_change_before_the_rollup(self):
+        order = self.place_order()
+        self.set_status(order, Order.PAYMENT_STATUS_COMPLETE)
+        self.assertFalse(DailyOrderStatus.objects.exists())
+
+        outbox.drain()
+
+        self.assertEqual(self.statuses(), {Order.PAYMENT_STATUS_COMPLETE: 25})
+
+    def test_status_change_after_the_rollup(self):
+        order = self.place_order()
+        outbox.drain()
+
+        self.set_status(order, Order.PAYMENT_STATUS_COMPLETE)
+
+        self.assertEqual(self.statuses(), {Order.PAYMENT_STATUS_COMPLETE: 25})
+
+    def test_rebuild_leaves_pending_orders_to_the_outbox(self):
+        self.place_order()
+        outbox.drain()
+        self.place_order()
+        stdout = io.StringIO()
+
+        call_command("backfill_sales", stdout=stdout)
+        self.assertEqual(self.statuses(), {Order.PAYMENT_STATUS_PENDING: 25})
+        outbox.drain()
+
+        self.assertEqual(self.statuses(), {Order.PAYMENT_STATUS_PENDING: 50})
+        self.assertEqual(DailyProductSales.objects.get(product=self.product).units, 4)
+        call_command("backfill_sales", stdout=stdout)
+        self.assertEqual(self.statuses(), {Order.PAYMENT_STATUS_PENDING: 50})
+
+
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = create_collection()
+        for i in range(3):
+            create_product(collection, f"Product {i}")
+        cls.admin = get_user_model().objects.create_user(
+            "admin", "admin@example.com", "password", is_staff=True
+        )
+
+    def setUp(self):
+        cache.get_cache().clear()
+        metrics.registry.reset()
+        self.client = APIClient()
+
+    def test_records_queries_and_timings(self):
+        with mock.patch.object(
+            metrics.registry, "observe", wraps=metrics.registry.observe
+        ) as observe, CaptureQueriesContext(connection) as queries:
+            self.client.get("/store/products/")
+
+        route, total_ms, stats = observe.call_args.args
+        self.assertEqual(route, "GET products-list")
+        self.assertEqual(stats.queries, len(queries))
+        self.assertGreater(stats.query_time, 0)
+        self.assertGreater(stats.serialize_time, 0)
+        self.assertGreater(stats.render_time, 0)
+        self.assertGreater(total_ms, 0)
+        self.assertEqual(stats.depth, 0)
+
+        route = metrics.registry.snapshot()["routes"]["GET products-list"]
+        self.assertEqual(route["count"], 1)
+        self.assertEqual(route["queries_per_request"], len(queries))
+
+    def test_server_timing_only_in_debug_or_for_staff(self):
+        response = self.client.get("/store/products/")
+        self.assertNotIn("Server-Timing", response)
+
+        with override_settings(DEBUG=True):
+            response = self.client.get("/store/products/")
+        self.assertIn("Server-Timing", response)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get("/store/products/")
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, '
+            r"render;dur=[\d.]+, total;dur=[\d.]+$",
+        )
+
+    def test_snapshot_and_reset(self):
+        self.client.get("/store/products/")
+        self.assertEqual(self.client.get("/store/metrics").status_code, 401)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get("/store/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["routes"]["GET products-list"]["count"], 1)
+
+        self.assertEqual(self.client.delete("/store/metrics").status_code, 204)
+        routes = self.client.get("/store/metrics").data["routes"]
+        self.assertNotIn("GET products-list", routes)
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def assertSameBytes(self, data, renderer_context=None):
+        expected = JSONRenderer().render(data, None, renderer_context)
+        self.assertEqual(
+            ORJSONRenderer().render(data, None, renderer_context), expected
+        )
+
+    def test_same_bytes(self):
+        for data in [
+            {"price": Decimal("12.50"), "tax": Decimal("0.1000"), "zero": Decimal(0)},
+            [0.1, 1 / 3, 0.0001, -0.0, 123456.789, 9999999999999998.0],
+            {"placed_at": datetime.datetime(2024, 1, 2, 3, 4, 5, 678901)},
+            {"date": datetime.date(2024, 1, 2), "time": datetime.time(3, 4, 5)},
+            {"id": uuid.UUID(int=1), "label": gettext_lazy("Pending")},
+            {"items": (1, 2), "tags": {3}, "nested": [{"a": [None, True]}]},
+            "\u2028 and \u2029 in a string",
+            {1: "int", None: "none", True: "bool", 1.5: "float"},
+        ]:
+            with self.subTest(data=data):
+                self.assertSameBytes(data)
+
+    def test_floats_written_with_exponents(self):
+        for value in [1e-5, 1.5e-7, 5e-324, 1e16, 1e22, -2.5e300]:
+            for data in [value, {"value": value}, [[Decimal(value)]]]:
+                with self.subTest(data=data):
+                    self.assertSameBytes(data)
+
+    def test_big_integers(self):
+        for value in [2**63 - 1, 2**63, 2**64, -(2**63), -(2**63) - 1]:
+            with self.subTest(value=value):
+                self.assertSameBytes({"value": value})
+
+    def test_indent(self):
+        data = {"results": [{"price": Decimal("1.50")}]}
+        self.assertSameBytes(data, {"indent": 2})
+
+    def test_nan_and_infinity_are_refused(self):
+        for value in [float("nan"), float("inf"), Decimal("NaN"), Decimal("-Inf")]:
+            for renderer in [JSONRenderer(), ORJSONRenderer()]:
+                with self.subTest(value=value, renderer=renderer):
+                    with self.assertRaises(ValueError):
+                        renderer.render({"value": value})
+
+    def test_none_renders_nothing(self):
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+
+class ORJSONParserTests(SimpleTestCase):
+    def parse(self, parser, body, parser_context=None):
+        return parser.parse(io.BytesIO(body), None, parser_context)
+
+    def assertSameParse(self, body, parser_context=None):
+        expected = self.parse(JSONParser(), body, parser_context)
+        parsed = self.parse(ORJSONParser(), body, parser_context)
+        self.assertEqual(parsed, expected)
+        self.assertEqual(
+            [type(value) for value in parsed], [type(value) for value in expected]
+        )
+
+    def test_same_values(self):
+        for body in [
+            b'[1, 2.5, "\\u2028", null, true, {"a": []}]',
+            b"[18446744073709551615, 18446744073709551616, -9223372036854775809]",
+            b"[1e400, 1e-400]",
+            '["caf\u00e9"]'.encode(),
+        ]:
+            with self.subTest(body=body):
+                self.assertSameParse(body)
+
+    def test_other_encodings_are_left_to_json_parser(self):
+        self.assertSameParse('["caf\u00e9"]'.encode("latin-1"), {"encoding": "latin-1"})
+
+    def test_invalid_documents_raise_json_parser_errors(self):
+        for body in [b'{"a": 1', b"[NaN]", b"[Infinity]", b"", b"\xff"]:
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as expected:
+                    self.parse(JSONParser(), body)
+                with self.assertRaises(ParseError) as raised:
+                    self.parse(ORJSONParser(), body)
+                self.assertEqual(raised.exception.detail, expected.exception.detail)
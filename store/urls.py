@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 from rest_framework_nested import routers
 
@@ -14,5 +14,53 @@ cart_router.register("items", views.CartItemViewSet, basename="cart-items")
 
 product_router = routers.NestedDefaultRouter(router, "products", lookup="product")
 product_router.register("reviews", views.ReviewViewSet, basename="product-reviews")
-image_upload_router = [path("images", views.ImageUploadView.as_view())]
-urlpatterns = router.urls + product_router.urls + cart_router.urls + image_upload_router
+image_upload_router = [
+    path("images", views.ImageUploadView.as_view()),
+    path("images/<int:pk>", views.ImageStatusView.as_view()),
+]
+export_urls = [
+    re_path(
+        r"^export/(?P<dataset>products|orders)\.(?P<export_format>ndjson|csv)$",
+        views.ExportView.as_view(),
+    ),
+]
+metrics_urls = [path("metrics", views.MetricsView.as_view())]
+analytics_urls = [path("analytics/sales", views.SalesAnalyticsView.as_view())]
+async_urls = [
+    path("async/products/", views.async_product_list, name="async-products-list"),
+    path(
+        "async/products/<int:pk>/",
+        views.async_product_detail,
+        name="async-products-detail",
+    ),
+    path(
+        "async/products/<int:product_pk>/reviews/",
+        views.async_review_list,
+        name="async-product-reviews-list",
+    ),
+    path(
+        "async/products/<int:product_pk>/reviews/<int:pk>/",
+        views.async_review_detail,
+        name="async-product-reviews-detail",
+    ),
+    path(
+        "async/collections/",
+        views.async_collection_list,
+        name="async-collection-list",
+    ),
+    path(
+        "async/collections/<int:pk>/",
+        views.async_collection_detail,
+        name="async-collection-detail",
+    ),
+]
+urlpatterns = (
+    router.urls
+    + product_router.urls
+    + cart_router.urls
+    + image_upload_router
+    + export_urls
+    + async_urls
+    + metrics_urls
+    + analytics_urls
+)
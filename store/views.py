@@ -1,32 +1,46 @@
-from django.db.models.aggregates import Count
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.generics import GenericAPIView
+from rest_framework.generics import GenericAPIView, RetrieveAPIView, get_object_or_404
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from rest_framework.mixins import (
     CreateModelMixin,
     RetrieveModelMixin,
     DestroyModelMixin,
 )
-import cloudinary
+from . import analytics, cache, export, metrics
 from .perimissions import IsAdminOrReadOnly
 
-from .filters import ProductFilter
+from .filters import ProductFilter, ProductSearchFilter
 from .serializers import (
     AddCartItemSerializer,
+    BatchCartItemSerializer,
     CartItemSerializer,
     CartSerializer,
     CollectionSerializer,
     CreateOrderSerializer,
     CustomerSerializer,
-    ImageSerializer,
+    ImageUploadSerializer,
     OrderSerializer,
     ProductSerialzer,
+    ProductValuesSerializer,
     ReviewSerializer,
+    StaffImageStatusSerializer,
     UpdateCartItemSerializer,
     UpdateOrderSerializer,
 )
@@ -34,26 +48,59 @@ from .models import (
     CartItem,
     Collection,
     Customer,
+    Image,
     Order,
     Product,
     OrderItem,
     Review,
     Cart,
 )
-from .pagination import DefaultProductPagination
+from .pagination import (
+    DefaultProductPagination,
+    KeysetPagination,
+    OrderPagination,
+    ReviewPagination,
+)
+
+
+def customer_lookup(user):
+    """Filter for the user's customer, by its id when the token carries it."""
+    customer_id = getattr(user, "customer_id", None)
+    if customer_id is not None:
+        return {"pk": customer_id}
+    return {"user_id": user.id}
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(cache.CachedResponseMixin, ModelViewSet):
 
     serializer_class = ProductSerialzer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     filterset_class = ProductFilter
     search_fields = ["title", "description"]
+    ordering_fields = [
+        "id",
+        "title",
+        "slug",
+        "inventory",
+        "unit_price",
+        "effective_price",
+        "last_update",
+    ]
     pagination_class = DefaultProductPagination
     permission_classes = (IsAdminOrReadOnly,)
 
+    @property
+    def paginator(self):
+        # Passing ?cursor= (empty for the first page) switches to keyset pages.
+        if not hasattr(self, "_paginator"):
+            if KeysetPagination.cursor_query_param in self.request.query_params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_queryset(self):
-        queryset = Product.objects.all()
+        queryset = self.product_queryset()
         collection_id = self.request.query_params.get("collection_id")
         if collection_id:
             queryset = queryset.filter(
@@ -61,12 +108,64 @@ class ProductViewSet(ModelViewSet):
             )
         return queryset
 
+    def product_queryset(self):
+        return Product.objects.select_related("image").with_prices()
+
     def get_serializer_context(self):
         return {"request": self.request}
 
+    def perform_create(self, serializer):
+        serializer.save()
+        # The prices are annotations, read them again for the response.
+        serializer.instance = self.product_queryset().get(pk=serializer.instance.pk)
+
+    def perform_update(self, serializer):
+        self.perform_create(serializer)
+
+    def get_cache_scopes(self):
+        if self.action == "retrieve":
+            return [cache.product_scope(self.kwargs["pk"])]
+        collection_id = self.request.query_params.get("collection_id")
+        if collection_id:
+            return [cache.collection_scope(collection_id)]
+        return [cache.PRODUCTS]
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.list_values, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, self.retrieve_values, *args, **kwargs)
+
+    def list_values(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.values(
+            *ProductValuesSerializer.values, *queryset.query.annotations
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = ProductValuesSerializer(
+            queryset if page is None else page,
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    def retrieve_values(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.get_queryset()
+        row = get_object_or_404(
+            queryset.values(
+                *ProductValuesSerializer.values, *queryset.query.annotations
+            ),
+            **{self.lookup_field: kwargs[lookup_url_kwarg]},
+        )
+        serializer = ProductValuesSerializer(row, context=self.get_serializer_context())
+        return Response(serializer.data)
+
     def destroy(self, request, *args, **kwargs):
 
-        if OrderItem.objects.filter(product_id=kwargs.get("pk")):
+        if OrderItem.objects.filter(product_id=kwargs.get("pk")).exists():
             return Response(
                 {
                     "error": "Product cannot be deleted because there are orders associated with it"
@@ -75,14 +174,19 @@ class ProductViewSet(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class CollectionViewSet(ModelViewSet):
+class CollectionViewSet(cache.CachedResponseMixin, ModelViewSet):
 
-    queryset = Collection.objects.annotate(product_count=Count("products")).all()
+    queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
     permission_classes = (IsAdminOrReadOnly,)
 
+    def get_cache_scopes(self):
+        if self.action == "retrieve":
+            return [cache.collection_scope(self.kwargs["pk"])]
+        return [cache.COLLECTIONS]
+
     def destroy(self, request, *args, **kwargs):
-        if Product.objects.filter(collection_id=kwargs.get("pk")):
+        if Product.objects.filter(collection_id=kwargs.get("pk")).exists():
             return Response(
                 {
                     "error": "Collection cannot be deleted because it contains one or more products"
@@ -92,31 +196,37 @@ class CollectionViewSet(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(cache.CachedResponseMixin, ModelViewSet):
 
     serializer_class = ReviewSerializer
+    pagination_class = ReviewPagination
 
     def get_queryset(self):
         return Review.objects.filter(product_id=self.kwargs.get("product_pk"))
 
+    def get_cache_scopes(self):
+        return [cache.reviews_scope(self.kwargs.get("product_pk"))]
+
     def get_serializer_context(self):
         return {"product_id": self.kwargs.get("product_pk")}
 
     def create(self, request, *args, **kwargs):
         product_id = self.kwargs.get("product_pk")
-        try:
-            Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+        if not Product.objects.filter(id=product_id).exists():
             return Response(
-                {"error": "Cannot create a review for a product that doesn't exist"}
+                {"error": "Cannot create a review for a product that doesn't exist"},
+                status=status.HTTP_404_NOT_FOUND,
             )
-        return super().perform_create(request, *args, **kwargs)
+        return super().create(request, *args, **kwargs)
 
 
 class CartViewSet(
     GenericViewSet, CreateModelMixin, RetrieveModelMixin, DestroyModelMixin
 ):
-    queryset = Cart.objects.prefetch_related("items__product").all()
+    # Products are joined to their items instead of prefetched in title order.
+    queryset = Cart.objects.prefetch_related(
+        Prefetch("items", queryset=CartItem.objects.select_related("product"))
+    )
     serializer_class = CartSerializer
 
 
@@ -124,6 +234,8 @@ class CartItemViewSet(ModelViewSet):
     http_method_names = ["get", "post", "patch", "delete"]
 
     def get_serializer_class(self):
+        if self.action == "batch":
+            return BatchCartItemSerializer
         serializer_dict = {
             "POST": AddCartItemSerializer,
             "PATCH": UpdateCartItemSerializer,
@@ -139,6 +251,14 @@ class CartItemViewSet(ModelViewSet):
     def get_serializer_context(self):
         return {"cart_id": self.kwargs.get("cart_pk")}
 
+    @action(detail=False, methods=["POST"])
+    def batch(self, request, cart_pk=None):
+        """Add or update many products in one request."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.save()
+        return Response(CartItemSerializer(items, many=True).data)
+
 
 class CustomerViewSet(ModelViewSet):
     queryset = Customer.objects.all()
@@ -147,11 +267,11 @@ class CustomerViewSet(ModelViewSet):
 
     @action(detail=False, methods=["GET", "PUT"], permission_classes=(IsAuthenticated,))
     def me(self, request):
-        customer = Customer.objects.get(user_id=request.user.id)
+        customer = get_object_or_404(Customer, **customer_lookup(request.user))
         if request.method == "GET":
             serializer = CustomerSerializer(customer)
             return Response(serializer.data)
-        elif request.method == "POST":
+        elif request.method == "PUT":
             serializer = CustomerSerializer(customer, data=request.data)
             serializer.is_valid(raise_exception=True)
             serializer.save()
@@ -160,6 +280,7 @@ class CustomerViewSet(ModelViewSet):
 
 class OrderViewSet(ModelViewSet):
     http_method_names = ["get", "post", "patch", "delete", "head", "options"]
+    pagination_class = OrderPagination
 
     def get_permissions(self):
         if self.request.method in ["PATCH", "DELETE"]:
@@ -168,20 +289,30 @@ class OrderViewSet(ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Order.objects.with_totals().with_items()
         if user.is_staff:
-            return Order.objects.all()
-        customer_id = Customer.objects.only("id").get(user_id=user.id)
-        return Order.objects.filter(customer_id=customer_id)
+            return queryset
+        return queryset.filter(
+            **{
+                f"customer__{key}": value
+                for key, value in customer_lookup(user).items()
+            }
+        )
 
     def create(self, request, *args, **kwargs):
-        serializer = CreateOrderSerializer(data=self.request.data)
+        serializer = CreateOrderSerializer(
+            data=self.request.data, context=self.get_serializer_context()
+        )
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
-        serializer = OrderSerializer(order)
+        serializer = OrderSerializer(self.get_queryset().get(pk=order.pk))
         return Response(serializer.data)
 
     def get_serializer_context(self):
-        return {"user_id": self.request.user.id}
+        return {
+            "user_id": self.request.user.id,
+            "customer_id": getattr(self.request.user, "customer_id", None),
+        }
 
     def get_serializer_class(self):
 
@@ -194,7 +325,8 @@ class OrderViewSet(ModelViewSet):
 
 class ImageUploadView(CreateModelMixin, GenericAPIView):
 
-    serializer_class = ImageSerializer
+    permission_classes = (IsAuthenticated,)
+    serializer_class = ImageUploadSerializer
 
     def post(self, request):
         # product_id = request.data.get("product")
@@ -204,10 +336,155 @@ class ImageUploadView(CreateModelMixin, GenericAPIView):
         #     return Response(
         #         "this product does not exist", status=status.HTTP_400_BAD_REQUEST
         #     )
-        image = request.data.get("image")
-        serializer = ImageSerializer(data=request.data)
+        # The upload is only staged here, process_images does the real work.
+        serializer = ImageUploadSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(uploaded_by_id=request.user.id)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
-        cloudinary.uploader.upload(image)
-        return Response(serializer.data)
+
+class ImageStatusView(RetrieveAPIView):
+    """Processing status of an upload, visible to its uploader and to staff."""
+
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Image.objects.all()
+        return Image.objects.filter(uploaded_by_id=self.request.user.id)
+
+    def get_serializer_class(self):
+        if self.request.user.is_staff:
+            return StaffImageStatusSerializer
+        return ImageUploadSerializer
+
+
+class ExportView(APIView):
+    """Stream a whole table as NDJSON or CSV, optionally only rows ``?since=``."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, dataset, export_format):
+        dataset_export = export.EXPORTS[dataset]()
+        queryset = dataset_export.get_queryset()
+        since = request.query_params.get("since")
+        if since:
+            queryset = queryset.filter(
+                **{f"{dataset_export.since_field}__gte": self.parse_since(since)}
+            )
+
+        render, content_type = export.RENDERERS[export_format]
+        response = StreamingHttpResponse(render(queryset), content_type=content_type)
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="{dataset}.{export_format}"'
+        return response
+
+    def parse_since(self, value):
+        try:
+            since = parse_datetime(value)
+            if since is None:
+                date = parse_date(value)
+                if date is not None:
+                    since = datetime.datetime.combine(date, datetime.time.min)
+        except ValueError:
+            since = None
+        if since is None:
+            raise ValidationError({"since": "Expected an ISO 8601 date or datetime."})
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+
+class MetricsView(APIView):
+    """Per-route request histograms of the process serving the request."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(metrics.registry.snapshot())
+
+    def delete(self, request):
+        metrics.registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SalesAnalyticsView(APIView):
+    """Sales between ``?start=`` and ``?end=`` (the last 30 days by default).
+
+    Answered from the daily rollups in ``store.analytics``, never from orders.
+    """
+
+    permission_classes = (IsAdminUser,)
+    default_days = 30
+    max_limit = 100
+
+    def get(self, request):
+        end = self.parse_day(request, "end", timezone.localdate())
+        start = self.parse_day(
+            request, "start", end - datetime.timedelta(days=self.default_days - 1)
+        )
+        if start > end:
+            raise ValidationError({"start": "Must not be after end."})
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            raise ValidationError({"limit": "Expected an integer."})
+        limit = min(max(limit, 1), self.max_limit)
+        return Response(analytics.sales_report(start, end, limit))
+
+    def parse_day(self, request, name, default):
+        value = request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({name: "Expected an ISO 8601 date."})
+        return day
+
+
+async_view_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_VIEW_THREADS, thread_name_prefix="async-view"
+)
+
+
+def render_and_close(view, request, *args, **kwargs):
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, "render"):
+            response.render()
+        return response
+    finally:
+        # Connections belong to the pool thread, not to the request.
+        close_old_connections()
+
+
+def threadpool_view(view):
+    """Turn a sync view into an async one that runs in ``async_view_executor``.
+
+    Under ASGI, Django 3.2 runs every sync view in one shared thread, so a
+    slow query stalls the whole process. Django 3.2 has no async ORM, so reads
+    are bridged to a dedicated thread pool and run concurrently instead.
+    """
+    bridged = sync_to_async(
+        render_and_close, thread_sensitive=False, executor=async_view_executor
+    )
+
+    async def async_view(request, *args, **kwargs):
+        return await bridged(view, request, *args, **kwargs)
+
+    async_view.csrf_exempt = True
+    return async_view
+
+
+async_product_list = threadpool_view(ProductViewSet.as_view({"get": "list"}))
+async_product_detail = threadpool_view(ProductViewSet.as_view({"get": "retrieve"}))
+async_collection_list = threadpool_view(CollectionViewSet.as_view({"get": "list"}))
+async_collection_detail = threadpool_view(
+    CollectionViewSet.as_view({"get": "retrieve"})
+)
+async_review_list = threadpool_view(ReviewViewSet.as_view({"get": "list"}))
+async_review_detail = threadpool_view(ReviewViewSet.as_view({"get": "retrieve"}))
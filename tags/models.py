@@ -14,6 +14,13 @@ class TaggedItemManager(models.Manager):
                 object_id=obj_id
             )
 
+    def tagged_ids(self, obj_type, label):
+        """Ids of the objects tagged ``label``, to be used as a subquery."""
+        content_type = ContentType.objects.get_for_model(obj_type)
+        return TaggedItem.objects \
+            .filter(content_type=content_type, tag__label=label) \
+            .values('object_id')
+
 
 class Tag(models.Model):
     label = models.CharField(max_length=255)
@@ -28,3 +35,10 @@ class TaggedItem(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'object_id']),
+            # Covers tag filters, which only need the object ids.
+            models.Index(fields=['tag', 'content_type', 'object_id']),
+        ]